@@ -15,7 +15,7 @@ class GigAdmin(admin.ModelAdmin):
     list_filter = ['category', 'is_active', 'created_at', 'rating']
     search_fields = ['title', 'freelancer__username', 'description']
     prepopulated_fields = {'slug': ('title',)}
-    readonly_fields = ['views', 'rating', 'total_reviews']
+    readonly_fields = ['views', 'rating', 'rating_sum', 'total_reviews']
     ordering = ['-created_at']
 
 
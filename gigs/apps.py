@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class GigsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'gigs' 
\ No newline at end of file
+    name = 'gigs'
+
+    def ready(self):
+        from . import signals  # noqa: F401
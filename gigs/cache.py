@@ -0,0 +1,38 @@
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import CacheVersion
+
+
+# Homepage fragments are cached under this CacheVersion row; bumping it drops
+# them all. The version is kept in the database, so every process sees a bump
+# even when each has its own cache
+HOME_VERSION = 'home'
+
+# Upper bound on staleness for changes that bypass signals (views, ratings)
+HOME_CACHE_TIMEOUT = 600
+
+
+def home_version():
+    """Current version of the cached homepage fragments, in one primary key lookup"""
+    version = CacheVersion.objects.filter(pk=HOME_VERSION).values_list('version', flat=True).first()
+    return _create_version() if version is None else version
+
+
+def invalidate_home():
+    """Invalidate every cached homepage fragment"""
+    if not CacheVersion.objects.filter(pk=HOME_VERSION).update(version=F('version') + 1):
+        _create_version()
+
+
+def _create_version():
+    # Start from the clock so a recreated row never reuses an old version
+    version = time.time_ns()
+    try:
+        with transaction.atomic():
+            CacheVersion.objects.create(name=HOME_VERSION, version=version)
+    except IntegrityError:
+        # Created by a concurrent request
+        version = CacheVersion.objects.get(pk=HOME_VERSION).version
+    return version
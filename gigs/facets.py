@@ -0,0 +1,163 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+from .models import Gig, GigFacet
+
+
+# Lower bounds of the price buckets in rupees; the last bucket is open ended
+PRICE_BUCKETS = [0, 1000, 5000, 10000, 25000]
+
+
+def price_bucket(price):
+    """Index of the price bucket a price falls into"""
+    price = Decimal(price)
+    bucket = 0
+    for index, lower in enumerate(PRICE_BUCKETS):
+        if price >= lower:
+            bucket = index
+    return bucket
+
+
+def price_bucket_expression():
+    """SQL CASE expression computing price_bucket() for each gig"""
+    whens = [
+        When(price__gte=lower, then=Value(index))
+        for index, lower in reversed(list(enumerate(PRICE_BUCKETS)))
+    ]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def bucket_bounds(index):
+    """(min_price, max_price) filter values for a bucket; max is None if open"""
+    lower = Decimal(PRICE_BUCKETS[index])
+    if index + 1 < len(PRICE_BUCKETS):
+        return lower, Decimal(PRICE_BUCKETS[index + 1]) - Decimal('0.01')
+    return lower, None
+
+
+def price_range_buckets(min_price=None, max_price=None):
+    """The buckets a price range is made of, or None if it cuts through one"""
+    try:
+        min_price = Decimal(min_price) if min_price else None
+        max_price = Decimal(max_price) if max_price else None
+    except ArithmeticError:
+        return None
+    bounds = [bucket_bounds(index) for index in range(len(PRICE_BUCKETS))]
+    if min_price is not None and min_price not in [lower for lower, upper in bounds]:
+        return None
+    if max_price is not None and max_price not in [upper for lower, upper in bounds]:
+        return None
+    return {
+        index for index, (lower, upper) in enumerate(bounds)
+        if (min_price is None or lower >= min_price)
+        and (max_price is None or (upper is not None and upper <= max_price))
+    }
+
+
+def _summarize(rows, category_id):
+    # Each facet counts the gigs matching every other filter: categories
+    # within the price range, price buckets within the category
+    category_counts = defaultdict(int)
+    bucket_counts = [0] * len(PRICE_BUCKETS)
+    for row_category_id, bucket, in_price_range, count in rows:
+        if in_price_range:
+            category_counts[row_category_id] += count
+        if category_id is None or row_category_id == category_id:
+            bucket_counts[bucket] += count
+    return dict(category_counts), bucket_counts
+
+
+def compute_facets(gigs, category_id=None, min_price=None, max_price=None):
+    """Per-category and per-price-bucket hit counts of a Gig queryset.
+
+    ``gigs`` is filtered by neither category nor price: category counts
+    apply the price range and bucket counts the category. Both come from
+    one query grouped by (category, price bucket, in price range).
+    """
+    price_range = Q()
+    if min_price:
+        price_range &= Q(price__gte=min_price)
+    if max_price:
+        price_range &= Q(price__lte=max_price)
+    in_price_range = Value(True)
+    if price_range:
+        in_price_range = Case(When(price_range, then=Value(True)), default=Value(False))
+    rows = gigs.order_by().annotate(
+        price_bucket=price_bucket_expression(), in_price_range=in_price_range,
+    ).values_list('category_id', 'price_bucket', 'in_price_range').annotate(count=Count('id'))
+    return _summarize(rows, category_id)
+
+
+def browse_facets(category_id=None, min_price=None, max_price=None):
+    """compute_facets() of all active gigs, read from the materialized GigFacet table.
+
+    A price range that cuts through a bucket cannot be read from the table
+    and is counted from the gigs instead.
+    """
+    buckets = price_range_buckets(min_price, max_price)
+    if buckets is None:
+        return compute_facets(Gig.objects.filter(is_active=True), category_id, min_price, max_price)
+    rows = GigFacet.objects.filter(gig_count__gt=0).values_list('category_id', 'price_bucket', 'gig_count')
+    return _summarize(
+        ((row_category_id, bucket, bucket in buckets, count) for row_category_id, bucket, count in rows),
+        category_id,
+    )
+
+
+def refresh_facets(gig_model=Gig, facet_model=GigFacet):
+    """Rebuild the GigFacet table from the gigs table"""
+    rows = gig_model.objects.filter(is_active=True).order_by().annotate(
+        price_bucket=price_bucket_expression()
+    ).values_list('category_id', 'price_bucket').annotate(count=Count('id'))
+    with transaction.atomic():
+        facet_model.objects.all().delete()
+        facet_model.objects.bulk_create([
+            facet_model(category_id=category_id, price_bucket=bucket, gig_count=count)
+            for category_id, bucket, count in rows
+        ])
+
+
+def facet_key(category_id, price, is_active):
+    """GigFacet cell a gig is counted in, or None if it is not counted"""
+    if not is_active:
+        return None
+    return category_id, price_bucket(price)
+
+
+def shift_facet(key, delta):
+    """Add delta to one GigFacet cell, creating it on first use"""
+    if key is None or not delta:
+        return
+    category_id, bucket = key
+    cell = GigFacet.objects.filter(category_id=category_id, price_bucket=bucket)
+    if cell.update(gig_count=F('gig_count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            GigFacet.objects.create(category_id=category_id, price_bucket=bucket, gig_count=delta)
+    except IntegrityError:
+        # Created concurrently
+        cell.update(gig_count=F('gig_count') + delta)
+
+
+def price_bucket_options(bucket_counts, params):
+    """Template rows for the price facet, each with a link querystring"""
+    options = []
+    for index, count in enumerate(bucket_counts):
+        min_price, max_price = bucket_bounds(index)
+        bucket_params = params.copy()
+        bucket_params['min_price'] = min_price
+        if max_price is None:
+            bucket_params.pop('max_price', None)
+        else:
+            bucket_params['max_price'] = max_price
+        options.append({
+            'min_price': PRICE_BUCKETS[index],
+            'max_price': PRICE_BUCKETS[index + 1] if max_price is not None else None,
+            'count': count,
+            'querystring': bucket_params.urlencode(),
+        })
+    return options
@@ -0,0 +1,86 @@
+import json
+import logging
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from gigs import view_counter
+from skillbazar import benchmark
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Seed a large dataset in a separate database and benchmark every app URL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--gigs', type=int, default=100000)
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--messages', type=int, default=5000000)
+        parser.add_argument('--messages-per-conversation', type=int, default=50)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--database-name', default='benchmark.sqlite3',
+                            help='Benchmark database, never the configured one')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the seeded database and reuse it on the next run')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--baseline', help='Earlier results to compare against')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed p95 slowdown as a fraction of the baseline')
+
+    def handle(self, *args, **options):
+        missing = benchmark.missing_specs()
+        if missing:
+            raise CommandError(f"No benchmark spec or skip reason for {', '.join(missing)}")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = options['database_name']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not CustomUser.objects.filter(username=benchmark.BENCH_USERNAME).exists():
+                benchmark.seed(
+                    users=options['users'], gigs=options['gigs'], orders=options['orders'],
+                    messages=options['messages'],
+                    messages_per_conversation=options['messages_per_conversation'],
+                    stdout=self.stdout,
+                )
+            # Failing views are reported by status code, not tracebacks
+            request_logger = logging.getLogger('django.request')
+            request_logger.disabled = True
+            try:
+                results = benchmark.run(
+                    iterations=options['iterations'], warmup=options['warmup'], stdout=self.stdout
+                )
+            finally:
+                request_logger.disabled = False
+        finally:
+            # Buffered views belong to the benchmark database
+            view_counter.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(),
+                'iterations': options['iterations'],
+                'dataset': {key: options[key] for key in ('users', 'gigs', 'orders', 'messages')},
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self.stdout.write(f"Wrote {len(results)} results to {options['output']}")
+
+        if baseline:
+            regressions = benchmark.compare(results, baseline['results'], options['threshold'])
+            if regressions:
+                raise CommandError('Benchmark regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline!'))
+        else:
+            failed = benchmark.failures(results)
+            if failed:
+                raise CommandError('Failed requests:\n' + '\n'.join(failed))
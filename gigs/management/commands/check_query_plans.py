@@ -0,0 +1,52 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from gigs.models import Category, Gig, Order
+from gigs.views import GIG_ORDERINGS
+
+# A plan step that reads a whole table instead of an index
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+
+
+class Command(BaseCommand):
+    help = 'Check with EXPLAIN QUERY PLAN that the hot gig and order queries use an index'
+
+    def hot_queries(self):
+        active = Gig.objects.filter(is_active=True)
+        category = Category.objects.first()
+        category_id = category.id if category else 0
+        queries = {
+            f'gig_list sort={sort}': active.order_by(*ordering)[:13]
+            for sort, ordering in GIG_ORDERINGS.items()
+        }
+        queries.update({
+            'home featured': active.order_by('-rating', '-views')[:8],
+            'home recent': active.order_by('-created_at')[:6],
+            'category_gigs': active.filter(category_id=category_id).order_by(*GIG_ORDERINGS['newest'])[:13],
+            'gig_detail related gigs': active.filter(similar_to__gig_id=0).order_by('similar_to__rank')[:4],
+            'orders by freelancer and status': Order.objects.filter(freelancer_id=0, status='pending'),
+            'orders by buyer and status': Order.objects.filter(buyer_id=0, status='pending'),
+        })
+        return queries
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN checks only run on SQLite.')
+
+        failures = []
+        for name, queryset in self.hot_queries().items():
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            scans = [step for step in plan if FULL_SCAN_RE.match(step)]
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: {"; ".join(plan)}'))
+            else:
+                self.stdout.write(f'{name}: {"; ".join(plan)}')
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries scan a table: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index!'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from gigs import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for gigs'
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            self.stdout.write('Full-text search index is only used on SQLite, nothing to do.')
+            return
+
+        search.create_index()
+        self.stdout.write(
+            self.style.SUCCESS('Successfully rebuilt the gig search index!')
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from gigs.facets import refresh_facets
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized category and price facet counts'
+
+    def handle(self, *args, **options):
+        refresh_facets()
+        self.stdout.write(
+            self.style.SUCCESS('Successfully refreshed gig facets!')
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from gigs.similarity import TOP_K, rebuild_similarities, update_stale_similarities
+
+
+class Command(BaseCommand):
+    help = 'Recompute related gigs for gigs created or edited since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild the neighbours of every active gig instead',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help=f'Neighbours to store per gig (default: {TOP_K})',
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            count = rebuild_similarities(top_k=options['top_k'])
+        else:
+            count = update_stale_similarities(top_k=options['top_k'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully updated related gigs for {count} gigs!')
+        )
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from gigs import search
+    search.create_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from gigs import search
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gigs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gigs', '0002_gig_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gig',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
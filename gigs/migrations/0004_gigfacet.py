@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_gig_facets(apps, schema_editor):
+    from gigs.facets import refresh_facets
+    refresh_facets(apps.get_model('gigs', 'Gig'), apps.get_model('gigs', 'GigFacet'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gigs', '0003_gig_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GigFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('gig_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='gigs.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='gigfacet',
+            constraint=models.UniqueConstraint(fields=('category', 'price_bucket'), name='unique_gig_facet'),
+        ),
+        migrations.RunPython(fill_gig_facets, migrations.RunPython.noop),
+    ]
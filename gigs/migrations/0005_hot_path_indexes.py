@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gigs', '0004_gigfacet'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='gig_active_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price', 'id'], name='gig_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-rating', '-id'], name='gig_active_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-rating', '-views'], name='gig_active_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-created_at', '-id'], name='gig_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['freelancer', 'status'], name='order_freelancer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', 'status'], name='order_buyer_status_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gigs', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GigSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'verbose_name_plural': 'Gig similarities',
+            },
+        ),
+        migrations.AddField(
+            model_name='gig',
+            name='similarity_stale',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='gig',
+            index=models.Index(condition=models.Q(('similarity_stale', True)), fields=['id'], name='gig_similarity_stale_idx'),
+        ),
+        migrations.AddField(
+            model_name='gigsimilarity',
+            name='gig',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_gigs', to='gigs.gig'),
+        ),
+        migrations.AddField(
+            model_name='gigsimilarity',
+            name='related_gig',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='gigs.gig'),
+        ),
+        migrations.AddConstraint(
+            model_name='gigsimilarity',
+            constraint=models.UniqueConstraint(fields=('gig', 'rank'), name='unique_gig_similarity_rank'),
+        ),
+    ]
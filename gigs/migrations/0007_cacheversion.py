@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gigs', '0006_gig_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField()),
+            ],
+        ),
+    ]
@@ -1,6 +1,13 @@
-from django.db import models
+import operator
+from collections import defaultdict
+from functools import reduce
+
+from django.db import models, transaction
+from django.db.models import Q
 from django.urls import reverse
+from django.utils import timezone
 from users.models import CustomUser
+from users.stats import apply_stats_change, combine_contributions, order_contribution
 
 
 class Category(models.Model):
@@ -36,10 +43,24 @@ class Gig(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     views = models.PositiveIntegerField(default=0)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    rating_sum = models.PositiveIntegerField(default=0)  # Running sum of review ratings
     total_reviews = models.PositiveIntegerField(default=0)
+    similarity_stale = models.BooleanField(default=True)  # Related gigs need recomputing
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # gig_list sort orders (keyset positions) over active gigs
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_active=True), name='gig_active_newest_idx'),
+            models.Index(fields=['price', 'id'], condition=models.Q(is_active=True), name='gig_active_price_idx'),
+            models.Index(fields=['-rating', '-id'], condition=models.Q(is_active=True), name='gig_active_rating_idx'),
+            # home featured gigs
+            models.Index(fields=['-rating', '-views'], condition=models.Q(is_active=True), name='gig_active_featured_idx'),
+            # category_gigs
+            models.Index(fields=['category', '-created_at', '-id'], condition=models.Q(is_active=True), name='gig_active_category_idx'),
+            # similarity job work queue
+            models.Index(fields=['id'], condition=models.Q(similarity_stale=True), name='gig_similarity_stale_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -48,17 +69,53 @@ class Gig(models.Model):
         return reverse('gigs:gig_detail', kwargs={'slug': self.slug})
     
     def increment_views(self):
+        # Written by gigs.view_counter, in batches when buffering is on
+        from .view_counter import record_view
+        record_view(self.pk)
         self.views += 1
-        self.save(update_fields=['views'])
-    
-    def update_rating(self):
-        from orders.models import Review
-        reviews = Review.objects.filter(gig=self)
-        if reviews.exists():
-            avg_rating = reviews.aggregate(avg=models.Avg('rating'))['avg']
-            self.rating = round(avg_rating, 2)
-            self.total_reviews = reviews.count()
-            self.save(update_fields=['rating', 'total_reviews'])
+
+
+class OrderQuerySet(models.QuerySet):
+    def transition(self, status, **changes):
+        """Move the orders in this queryset that may go to ``status`` there, in one UPDATE.
+
+        Each order only moves if it still has the status it was read with,
+        so orders changed concurrently are skipped rather than overwritten.
+        ``changes`` are further fields to set. Returns how many orders moved.
+        """
+        sources = [source for source, targets in Order.TRANSITIONS.items() if status in targets]
+        rows = list(self.filter(status__in=sources).order_by().values(
+            'id', 'freelancer_id', 'buyer_id', 'status', 'amount',
+        ))
+        if not rows:
+            return 0
+        ids_by_status = defaultdict(list)
+        for row in rows:
+            ids_by_status[row['status']].append(row['id'])
+        read_with = reduce(operator.or_, (Q(id__in=ids, status=source) for source, ids in ids_by_status.items()))
+        now = timezone.now()
+        with transaction.atomic():
+            moved = Order.objects.filter(read_with).update(status=status, updated_at=now, **changes)
+            if moved < len(rows):
+                # Some were changed in between; the ones moved here carry this update's time
+                ids = set(Order.objects.filter(
+                    id__in=[row['id'] for row in rows], status=status, updated_at=now,
+                ).values_list('id', flat=True))
+                rows = [row for row in rows if row['id'] in ids]
+            _apply_transition_stats(rows, status)
+        return moved
+
+
+def _apply_transition_stats(rows, status):
+    """Move orders that changed status between their parties' stats"""
+    apply_stats_change(
+        combine_contributions(
+            order_contribution(row['freelancer_id'], row['buyer_id'], row['status'], row['amount']) for row in rows
+        ),
+        combine_contributions(
+            order_contribution(row['freelancer_id'], row['buyer_id'], status, row['amount']) for row in rows
+        ),
+    )
 
 
 class Order(models.Model):
@@ -70,6 +127,14 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    # The statuses an order may move to from each status
+    TRANSITIONS = {
+        'pending': ('in_progress', 'cancelled'),
+        'in_progress': ('completed', 'cancelled'),
+        'completed': (),
+        'cancelled': (),
+    }
+    
     gig = models.ForeignKey(Gig, on_delete=models.CASCADE, related_name='orders')
     buyer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders_bought')
     freelancer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders_received')
@@ -82,9 +147,90 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # dashboard and order list filters
+            models.Index(fields=['freelancer', 'status'], name='order_freelancer_status_idx'),
+            models.Index(fields=['buyer', 'status'], name='order_buyer_status_idx'),
+        ]
+    
+    objects = OrderQuerySet.as_manager()
     
     def __str__(self):
         return f"Order #{self.id} - {self.gig.title}"
     
+    def can_transition(self, status):
+        return status in self.TRANSITIONS.get(self.status, ())
+    
+    @property
+    def next_statuses(self):
+        """(status, label) pairs this order may move to"""
+        return [choice for choice in self.STATUS_CHOICES if self.can_transition(choice[0])]
+    
+    def transition(self, status, **changes):
+        """Move this order to ``status`` if allowed and it still has the status it was read with.
+
+        A single conditional UPDATE, so of two concurrent changes only the
+        first applies. ``changes`` are further fields to set. Returns
+        whether the order moved; the instance is updated when it did.
+        """
+        if not self.can_transition(status):
+            return False
+        now = timezone.now()
+        with transaction.atomic():
+            moved = Order.objects.filter(pk=self.pk, status=self.status).update(
+                status=status, updated_at=now, **changes
+            )
+            if moved:
+                _apply_transition_stats([{
+                    'freelancer_id': self.freelancer_id, 'buyer_id': self.buyer_id,
+                    'status': self.status, 'amount': self.amount,
+                }], status)
+        if moved:
+            self.status, self.updated_at = status, now
+            for field, value in changes.items():
+                setattr(self, field, value)
+        return bool(moved)
+    
     def get_absolute_url(self):
-        return reverse('orders:order_detail', kwargs={'pk': self.pk}) 
\ No newline at end of file
+        return reverse('orders:order_detail', kwargs={'pk': self.pk}) 
+
+
+class GigFacet(models.Model):
+    """Materialized number of active gigs per category and price bucket"""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facets')
+    price_bucket = models.PositiveSmallIntegerField()
+    gig_count = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'price_bucket'], name='unique_gig_facet'),
+        ]
+    
+    def __str__(self):
+        return f"{self.category} / bucket {self.price_bucket}: {self.gig_count}"
+
+
+class GigSimilarity(models.Model):
+    """Precomputed content neighbour of a gig, rank 1 being the closest"""
+    gig = models.ForeignKey(Gig, on_delete=models.CASCADE, related_name='similar_gigs')
+    related_gig = models.ForeignKey(Gig, on_delete=models.CASCADE, related_name='similar_to')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        verbose_name_plural = 'Gig similarities'
+        constraints = [
+            models.UniqueConstraint(fields=['gig', 'rank'], name='unique_gig_similarity_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.gig_id} -> {self.related_gig_id} ({self.score:.3f})"
+
+
+class CacheVersion(models.Model):
+    """Version of a group of cached fragments, shared by every process through the database"""
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import json
+import math
+
+from django.core.cache import cache
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, usable in templates like a Django Page"""
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, number, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<KeysetPage {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], self.number + 1, 'next')
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], self.number - 1, 'previous')
+
+
+class KeysetPaginator:
+    """Cursor based paginator that seeks past the last row instead of using OFFSET.
+
+    ``ordering`` lists the sort fields, ending with a unique field (usually
+    ``id``) so every row has a distinct position. Each page is fetched with a
+    single ``LIMIT per_page + 1`` query after the cursor. The total count is
+    optional: when ``count_timeout`` is set it is computed once and cached for
+    that many seconds, otherwise ``count`` is None.
+    """
+
+    def __init__(self, object_list, per_page, ordering, count_timeout=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.count_timeout = count_timeout
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+
+    @property
+    def count(self):
+        """Total number of objects, cached across requests"""
+        if self.count_timeout is None:
+            return None
+        if not hasattr(self, '_count'):
+            digest = hashlib.md5(str(self.object_list.query).encode()).hexdigest()
+            self._count = cache.get_or_set(
+                f'keyset_count:{digest}', self.object_list.count, self.count_timeout
+            )
+        return self._count
+
+    @property
+    def num_pages(self):
+        """Number of pages derived from the cached count, or None"""
+        if self.count is None:
+            return None
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def encode_cursor(self, obj, number, direction):
+        values = [self._field_to_string(obj, name) for name, _ in self.fields]
+        payload = json.dumps({'v': values, 'n': number, 'd': direction})
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = payload['v']
+            number = int(payload['n'])
+            direction = payload['d']
+            if len(values) != len(self.fields) or direction not in ('next', 'previous'):
+                raise ValueError
+            model = self.object_list.model
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise InvalidCursor(cursor)
+        return values, max(1, number), direction
+
+    def _field_to_string(self, obj, name):
+        value = getattr(obj, name)
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    def _seek(self, values, forward):
+        """Build the WHERE clause for rows strictly after (or before) values"""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[index]})
+            for prev_index in range(index):
+                term &= Q(**{self.fields[prev_index][0]: values[prev_index]})
+            condition |= term
+        return condition
+
+    def page(self, cursor=None):
+        """Return the page after (or before) the given cursor"""
+        if not cursor:
+            rows = list(self.object_list.order_by(*self.ordering)[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self, 1, len(rows) > self.per_page, False)
+
+        values, number, direction = self.decode_cursor(cursor)
+        if direction == 'next':
+            queryset = self.object_list.filter(self._seek(values, True)).order_by(*self.ordering)
+            rows = list(queryset[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self, number, len(rows) > self.per_page, True)
+
+        reverse_ordering = [
+            name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+        ]
+        queryset = self.object_list.filter(self._seek(values, False)).order_by(*reverse_ordering)
+        rows = list(queryset[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(rows, self, number, True, has_previous)
+
+    def get_page(self, cursor=None):
+        """Like page() but falls back to the first page on a bad cursor"""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page(None)
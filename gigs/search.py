@@ -0,0 +1,144 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+
+from users.models import CustomUser
+from .models import Category, Gig
+
+
+# SQLite FTS5 inverted index over the searchable gig fields. The rowid of
+# each index row is the id of the gig it describes.
+FTS_TABLE = 'gigs_gig_fts'
+
+# bm25() column weights: title, description, freelancer_name, category_name
+RANK_WEIGHTS = (10.0, 1.0, 4.0, 6.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_enabled(conn=None):
+    """Return True if the full-text index is available on this database"""
+    return (conn or connection).vendor == 'sqlite'
+
+
+def create_index(conn=None):
+    """Create the FTS5 table (if missing) and fill it from existing gigs"""
+    conn = conn or connection
+    if not is_enabled(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, description, freelancer_name, category_name, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    rebuild_index(conn)
+
+
+def drop_index(conn=None):
+    """Drop the FTS5 table"""
+    conn = conn or connection
+    if not is_enabled(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _reindex(where, params, conn=None):
+    """Replace the index rows of every gig matching the given SQL condition"""
+    conn = conn or connection
+    if not is_enabled(conn):
+        return
+    gig_table = Gig._meta.db_table
+    user_table = CustomUser._meta.db_table
+    category_table = Category._meta.db_table
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN "
+            f"(SELECT g.id FROM {gig_table} g WHERE {where})",
+            params,
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} "
+            "(rowid, title, description, freelancer_name, category_name) "
+            "SELECT g.id, g.title, g.description, "
+            "u.username || ' ' || u.first_name || ' ' || u.last_name, c.name "
+            f"FROM {gig_table} g "
+            f"JOIN {user_table} u ON u.id = g.freelancer_id "
+            f"JOIN {category_table} c ON c.id = g.category_id "
+            f"WHERE {where}",
+            params,
+        )
+
+
+def rebuild_index(conn=None):
+    """Rebuild the whole index from scratch"""
+    conn = conn or connection
+    if not is_enabled(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    _reindex('1 = 1', [], conn)
+
+
+def index_gig(gig_id):
+    """(Re)index a single gig"""
+    _reindex('g.id = %s', [gig_id])
+
+
+def index_category(category_id):
+    """Reindex every gig in a category after the category was renamed"""
+    _reindex('g.category_id = %s', [category_id])
+
+
+def index_freelancer(user_id):
+    """Reindex every gig of a freelancer after their name changed"""
+    _reindex('g.freelancer_id = %s', [user_id])
+
+
+def remove_gig(gig_id):
+    """Drop a gig from the index"""
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [gig_id])
+
+
+def build_match_query(query):
+    """Turn free user input into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term and all terms must match, which
+    mirrors the substring semantics of the old icontains search without
+    exposing the FTS5 query syntax to users.
+    """
+    tokens = TOKEN_RE.findall(query.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_gigs(gigs, query):
+    """Filter a Gig queryset by a search query.
+
+    On SQLite the queryset is joined against the FTS5 index and annotated
+    with ``search_rank`` (lower is more relevant). Other databases fall back
+    to the plain icontains search with a constant rank.
+    """
+    match = build_match_query(query)
+    if not is_enabled() or not match:
+        return gigs.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(freelancer__username__icontains=query) |
+            Q(category__name__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return gigs.extra(
+        select={'search_rank': f'bm25({FTS_TABLE}, {weights})'},
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = {Gig._meta.db_table}.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[match],
+    )
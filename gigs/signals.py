@@ -0,0 +1,84 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from skillbazar.old_rows import old_row, touches, track_old_row
+from users.models import CustomUser
+from .models import Category, Gig
+from . import search
+from .cache import invalidate_home
+from .facets import facet_key, shift_facet
+
+
+# Fields that feed the search index; saves touching none of them are ignored
+GIG_SEARCH_FIELDS = {'title', 'description', 'freelancer', 'freelancer_id', 'category', 'category_id'}
+CATEGORY_SEARCH_FIELDS = {'name'}
+USER_SEARCH_FIELDS = {'username', 'first_name', 'last_name'}
+
+# Fields that decide which GigFacet cell a gig is counted in
+GIG_FACET_FIELDS = {'category', 'category_id', 'price', 'is_active'}
+
+# Fields the related gigs job reads
+GIG_SIMILARITY_FIELDS = {'title', 'description', 'is_active'}
+
+track_old_row(Gig, GIG_FACET_FIELDS)
+
+
+@receiver(post_save, sender=Gig)
+def index_gig_on_save(sender, instance, update_fields=None, **kwargs):
+    """Keep the search index in sync with gig edits"""
+    if touches(update_fields, GIG_SEARCH_FIELDS):
+        search.index_gig(instance.pk)
+
+
+@receiver(post_delete, sender=Gig)
+def unindex_gig_on_delete(sender, instance, **kwargs):
+    search.remove_gig(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def index_category_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """Reindex a category's gigs when its name changes"""
+    if not created and touches(update_fields, CATEGORY_SEARCH_FIELDS):
+        search.index_category(instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def index_freelancer_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """Reindex a freelancer's gigs when their name changes"""
+    if not created and touches(update_fields, USER_SEARCH_FIELDS):
+        search.index_freelancer(instance.pk)
+
+
+@receiver(post_save, sender=Gig)
+@receiver(post_delete, sender=Gig)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_home_on_change(sender, **kwargs):
+    """Drop the cached homepage sections when gigs or categories change"""
+    invalidate_home()
+
+
+@receiver(post_save, sender=Gig)
+def update_facets_on_save(sender, instance, update_fields=None, **kwargs):
+    """Move the gig between GigFacet cells when its category, price or state change"""
+    if not touches(update_fields, GIG_FACET_FIELDS):
+        return
+    before = old_row(instance)
+    if before:
+        before = facet_key(before['category_id'], before['price'], before['is_active'])
+    after = facet_key(instance.category_id, instance.price, instance.is_active)
+    if before != after:
+        shift_facet(before, -1)
+        shift_facet(after, 1)
+
+
+@receiver(post_delete, sender=Gig)
+def update_facets_on_delete(sender, instance, **kwargs):
+    shift_facet(facet_key(instance.category_id, instance.price, instance.is_active), -1)
+
+
+@receiver(post_save, sender=Gig)
+def mark_similarity_stale(sender, instance, created=False, update_fields=None, **kwargs):
+    """Queue edited gigs for the next update_gig_similarities run"""
+    if not created and touches(update_fields, GIG_SIMILARITY_FIELDS) and not instance.similarity_stale:
+        Gig.objects.filter(pk=instance.pk).update(similarity_stale=True)
+        instance.similarity_stale = True
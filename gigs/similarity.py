@@ -0,0 +1,179 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+
+# Neighbours stored per gig; more than gig_detail shows so inactive ones can drop out
+TOP_K = 8
+# Pairs scoring below this cosine similarity are not worth storing
+MIN_SCORE = 0.05
+# Title words count this many times as much as description words
+TITLE_WEIGHT = 3
+# Terms found in more than this share of gigs carry no signal and are dropped
+MAX_DOCUMENT_FREQUENCY = 0.5
+# Gigs scored against the corpus per sparse matrix product
+BATCH_SIZE = 500
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+STOP_WORDS = frozenset('''
+    a about an and are as at be by can do for from get have i if in into is it
+    its me my of on or our so that the their this to up we will with you your
+'''.split())
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def _term_counts(title, description):
+    counts = Counter(tokenize(description))
+    for token in tokenize(title):
+        counts[token] += TITLE_WEIGHT
+    return counts
+
+
+def build_matrix(documents):
+    """Return (ids, matrix) with one L2 normalised TF-IDF row per document.
+
+    ``documents`` is an iterable of (id, title, description). Term
+    frequencies are sublinear (1 + log tf) and idf is smoothed, so the
+    dot product of two rows is their cosine similarity.
+    """
+    ids, counts = [], []
+    for gig_id, title, description in documents:
+        ids.append(gig_id)
+        counts.append(_term_counts(title, description))
+
+    document_frequency = Counter()
+    for terms in counts:
+        document_frequency.update(terms.keys())
+    max_df = max(1, int(MAX_DOCUMENT_FREQUENCY * len(ids))) if len(ids) > 2 else len(ids)
+    vocabulary = {}
+    for term, df in document_frequency.items():
+        if df <= max_df:
+            vocabulary[term] = len(vocabulary)
+
+    total = len(ids)
+    idf = np.zeros(len(vocabulary))
+    for term, column in vocabulary.items():
+        idf[column] = math.log((1 + total) / (1 + document_frequency[term])) + 1
+
+    rows, columns, values = [], [], []
+    for row, terms in enumerate(counts):
+        for term, tf in terms.items():
+            column = vocabulary.get(term)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+                values.append((1 + math.log(tf)) * idf[column])
+
+    matrix = sparse.csr_matrix(
+        (values, (rows, columns)), shape=(total, len(vocabulary)), dtype=np.float64,
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return ids, sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+
+def _active_documents():
+    from .models import Gig
+    return Gig.objects.filter(is_active=True).order_by('id').values_list('id', 'title', 'description').iterator()
+
+
+def _neighbours(ids, matrix, rows, top_k):
+    """Yield (gig_id, [(related_id, score), ...]) for the given matrix rows"""
+    transposed = matrix.T.tocsc()
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        scores = (matrix[batch] @ transposed).tocsr()
+        for offset, row in enumerate(batch):
+            begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+            columns = scores.indices[begin:end]
+            values = scores.data[begin:end]
+            keep = (columns != row) & (values >= MIN_SCORE)
+            columns, values = columns[keep], values[keep]
+            if len(values) > top_k:
+                best = np.argpartition(-values, top_k)[:top_k]
+                columns, values = columns[best], values[best]
+            order = np.lexsort((columns, -values))
+            yield ids[row], [(ids[columns[i]], float(values[i])) for i in order]
+
+
+def _store(neighbours):
+    from .models import GigSimilarity
+    rows = [
+        GigSimilarity(gig_id=gig_id, related_gig_id=related_id, rank=rank, score=score)
+        for gig_id, related in neighbours
+        for rank, (related_id, score) in enumerate(related, 1)
+    ]
+    GigSimilarity.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_similarities(top_k=TOP_K):
+    """Recompute the neighbours of every active gig from scratch.
+
+    Returns the number of gigs processed.
+    """
+    from .models import Gig, GigSimilarity
+
+    started = timezone.now()
+    ids, matrix = build_matrix(_active_documents())
+    neighbours = list(_neighbours(ids, matrix, list(range(len(ids))), top_k))
+    with transaction.atomic():
+        GigSimilarity.objects.all().delete()
+        _store(neighbours)
+        Gig.objects.filter(similarity_stale=True, updated_at__lte=started).update(similarity_stale=False)
+    return len(ids)
+
+
+def update_stale_similarities(top_k=TOP_K):
+    """Recompute neighbours for gigs created or edited since the last run.
+
+    Besides the stale gigs themselves, every gig that listed a stale gig as
+    a neighbour, or that a stale gig now beats its weakest neighbour, gets
+    its list recomputed too. Other gigs keep scores computed against the
+    idf of an earlier run, so a periodic full rebuild is still worthwhile.
+    Returns the number of gigs whose neighbours were recomputed.
+    """
+    from .models import Gig, GigSimilarity
+
+    started = timezone.now()
+    stale = set(Gig.objects.filter(similarity_stale=True).values_list('id', flat=True))
+    if not stale:
+        return 0
+
+    ids, matrix = build_matrix(_active_documents())
+    position = {gig_id: row for row, gig_id in enumerate(ids)}
+
+    affected = stale | set(
+        GigSimilarity.objects.filter(related_gig__in=stale).values_list('gig_id', flat=True)
+    )
+    # Gigs a stale gig may now break into the top k of
+    weakest = {
+        row['gig_id']: (row['lowest'], row['total'])
+        for row in GigSimilarity.objects.order_by().values('gig_id').annotate(
+            lowest=Min('score'), total=Count('id')
+        )
+    }
+    stale_rows = [position[gig_id] for gig_id in stale if gig_id in position]
+    for _, related in _neighbours(ids, matrix, stale_rows, len(ids)):
+        for related_id, score in related:
+            lowest, total = weakest.get(related_id, (0, 0))
+            if total < top_k or score > lowest:
+                affected.add(related_id)
+
+    rows = sorted(position[gig_id] for gig_id in affected if gig_id in position)
+    neighbours = list(_neighbours(ids, matrix, rows, top_k))
+    with transaction.atomic():
+        # Also clears deactivated gigs, whose neighbours are all in affected
+        GigSimilarity.objects.filter(gig__in=affected).delete()
+        _store(neighbours)
+        Gig.objects.filter(pk__in=stale, updated_at__lte=started).update(similarity_stale=False)
+    return len(rows)
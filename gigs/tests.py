@@ -0,0 +1,508 @@
+import threading
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from skillbazar.query_budget import assert_max_queries, count_queries
+from users.models import CustomUser, UserStats
+from . import facets, search, similarity, view_counter
+from .cache import home_version, invalidate_home
+from .models import CacheVersion, Category, Gig, GigFacet, GigSimilarity
+from .pagination import InvalidCursor, KeysetPaginator
+
+
+# Session and user lookups made by every signed-in request
+REQUEST_QUERIES = 2
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class GigPageQueryTests(TestCase):
+    """Gig pages run a fixed number of queries however many gigs they show"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.categories = [
+            Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(3)
+        ]
+        for i in range(15):
+            freelancer = CustomUser.objects.create_user(f'freelancer{i}', f'freelancer{i}@skillbazar.com', 'password')
+            Gig.objects.create(
+                freelancer=freelancer, category=cls.categories[i % 3], title=f'Logo design {i}',
+                slug=f'logo-design-{i}', description='A professional logo', price=Decimal(500 + i),
+                delivery_time=3,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Cold caches, including the unread badge warmed at login, are the worst case
+        cache.clear()
+
+    def test_home(self):
+        with assert_max_queries(REQUEST_QUERIES + 5, 'home'):
+            response = self.client.get(reverse('gigs:home'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_gig_list(self):
+        with assert_max_queries(REQUEST_QUERIES + 5, 'gig_list'):
+            response = self.client.get(reverse('gigs:gig_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_gig_list_filtered(self):
+        with assert_max_queries(REQUEST_QUERIES + 5, 'gig_list'):
+            response = self.client.get(
+                reverse('gigs:gig_list'), {'category': 'category-1', 'min_price': '505', 'sort': 'price_low'}
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_category_gigs(self):
+        with assert_max_queries(REQUEST_QUERIES + 4, 'category_gigs'):
+            response = self.client.get(reverse('gigs:category', kwargs={'slug': 'category-0'}))
+        self.assertEqual(response.status_code, 200)
+
+
+class HomeCacheTests(TestCase):
+    """Homepage sections stay cached until a gig or category changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.category = Category.objects.create(name='Graphic Design', slug='graphic-design')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def create_gig(self, title):
+        return Gig.objects.create(
+            freelancer=self.user, category=self.category, title=title, slug=title.lower().replace(' ', '-'),
+            description='A professional logo', price=Decimal('500'), delivery_time=3,
+        )
+
+    def test_warm_home_only_reads_version(self):
+        self.client.get(reverse('gigs:home'))
+        with assert_max_queries(REQUEST_QUERIES + 1, 'home'):
+            self.client.get(reverse('gigs:home'))
+
+    def test_change_drops_cached_sections(self):
+        self.assertNotContains(self.client.get(reverse('gigs:home')), 'Logo design')
+        gig = self.create_gig('Logo design')
+        self.assertContains(self.client.get(reverse('gigs:home')), 'Logo design')
+        gig.title = 'Brand identity'
+        gig.save()
+        response = self.client.get(reverse('gigs:home'))
+        self.assertContains(response, 'Brand identity')
+        self.assertNotContains(response, 'Logo design')
+
+    def test_version_is_shared_through_the_database(self):
+        version = home_version()
+        # Another process bumps the version; this one's cache is not involved
+        CacheVersion.objects.filter(pk='home').update(version=version + 1)
+        self.assertEqual(home_version(), version + 1)
+        invalidate_home()
+        self.assertEqual(home_version(), version + 2)
+
+    def test_missing_version_is_recreated(self):
+        invalidate_home()
+        CacheVersion.objects.all().delete()
+        invalidate_home()
+        self.assertEqual(CacheVersion.objects.count(), 1)
+
+
+class ViewCounterTests(TestCase):
+    """Gig views are written straight away, or buffered and flushed in batches when configured"""
+
+    @classmethod
+    def setUpTestData(cls):
+        freelancer = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        category = Category.objects.create(name='Graphic Design', slug='graphic-design')
+        cls.gigs = [
+            Gig.objects.create(
+                freelancer=freelancer, category=category, title=f'Logo design {i}', slug=f'logo-design-{i}',
+                description='A professional logo', price=Decimal('500'), delivery_time=3,
+            )
+            for i in range(3)
+        ]
+
+    def views(self):
+        gigs = Gig.objects.filter(pk__in=[gig.pk for gig in self.gigs]).order_by('pk')
+        return list(gigs.values_list('views', flat=True))
+
+    @override_settings(GIG_VIEW_FLUSH_INTERVAL=None)
+    def test_unbuffered_views_are_written_straight_away(self):
+        for _ in range(2):
+            self.client.get(reverse('gigs:gig_detail', kwargs={'slug': self.gigs[0].slug}))
+        self.assertEqual(self.views(), [2, 0, 0])
+        self.assertFalse(any(thread.name == 'gig-view-flusher' for thread in threading.enumerate()))
+
+    @override_settings(GIG_VIEW_FLUSH_INTERVAL=60)
+    def test_buffered_views_are_flushed_in_batches(self):
+        self.addCleanup(view_counter.flush)
+        with mock.patch.object(view_counter, '_ensure_flusher') as ensure_flusher:
+            for gig, count in zip(self.gigs, (2, 2, 1)):
+                for _ in range(count):
+                    gig.increment_views()
+        ensure_flusher.assert_called_with(60)
+        self.assertEqual(self.views(), [0, 0, 0])
+        self.assertEqual(view_counter.pending_views(self.gigs[0].pk), 2)
+
+        with count_queries() as counter:
+            self.assertEqual(view_counter.flush(), 3)
+        # One UPDATE per distinct count
+        self.assertEqual(sum(sql.startswith('UPDATE') for sql in counter.queries), 2)
+        self.assertEqual(self.views(), [2, 2, 1])
+        self.assertEqual(view_counter.pending_views(self.gigs[0].pk), 0)
+        self.assertEqual(view_counter.flush(), 0)
+
+    @override_settings(GIG_VIEW_FLUSH_INTERVAL=60)
+    def test_failed_flush_keeps_views_for_the_next_one(self):
+        self.addCleanup(view_counter.flush)
+        with mock.patch.object(view_counter, '_ensure_flusher'):
+            self.gigs[0].increment_views()
+            self.gigs[0].increment_views()
+        with mock.patch.object(Gig.objects, 'filter', side_effect=DatabaseError('locked')), \
+                self.assertLogs('gigs.view_counter', 'ERROR'):
+            self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(view_counter.pending_views(self.gigs[0].pk), 2)
+        self.assertEqual(view_counter.flush(), 1)
+        self.assertEqual(self.views(), [2, 0, 0])
+
+
+class GigSaveTests(TestCase):
+    """Signal receivers share one read of the row a gig save replaces"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.freelancer = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        cls.categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(2)]
+
+    def test_save_reads_old_row_once(self):
+        gig = Gig.objects.create(
+            freelancer=self.freelancer, category=self.categories[0], title='Logo design', slug='logo-design',
+            description='A professional logo', price=Decimal('500'), delivery_time=3,
+        )
+        gig.category = self.categories[1]
+        gig.is_active = False
+        with count_queries() as counter:
+            gig.save()
+        reads = [sql for sql in counter.queries if sql.startswith('SELECT') and 'FROM "gigs_gig"' in sql]
+        self.assertEqual(len(reads), 1, reads)
+
+        stats = UserStats.objects.get(user=self.freelancer)
+        self.assertEqual((stats.gig_count, stats.active_gig_count), (1, 0))
+        self.assertFalse(GigFacet.objects.filter(gig_count__gt=0).exists())
+
+    def test_save_of_other_fields_reads_nothing(self):
+        gig = Gig.objects.create(
+            freelancer=self.freelancer, category=self.categories[0], title='Logo design', slug='logo-design',
+            description='A professional logo', price=Decimal('500'), delivery_time=3,
+        )
+        with count_queries() as counter:
+            gig.save(update_fields=['delivery_time'])
+        self.assertFalse([sql for sql in counter.queries if sql.startswith('SELECT') and 'FROM "gigs_gig"' in sql])
+
+
+class GigSearchTests(TestCase):
+    """Full-text search ranks title matches first and falls back to icontains"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.freelancer = CustomUser.objects.create_user(
+            'sita', 'sita@skillbazar.com', 'password', first_name='Sita', last_name='Sharma',
+        )
+        cls.design = Category.objects.create(name='Graphic Design', slug='graphic-design')
+        cls.writing = Category.objects.create(name='Writing', slug='writing')
+        cls.title_match = cls.create_gig('Logo design', 'Any style you need', cls.design)
+        cls.description_match = cls.create_gig('Brand kit', 'Colours, fonts and a logo', cls.design)
+        cls.other = cls.create_gig('Blog posts', 'Articles about travel', cls.writing)
+
+    @classmethod
+    def create_gig(cls, title, description, category):
+        return Gig.objects.create(
+            freelancer=cls.freelancer, category=category, title=title, slug=title.lower().replace(' ', '-'),
+            description=description, price=Decimal('500'), delivery_time=3,
+        )
+
+    def search(self, query):
+        return list(search.search_gigs(Gig.objects.all(), query).order_by('search_rank', 'pk'))
+
+    def test_match_query_quotes_every_word(self):
+        self.assertEqual(search.build_match_query('Logo, design!'), '"logo"* "design"*')
+        self.assertEqual(search.build_match_query('logo" OR title:*'), '"logo"* "or"* "title"*')
+        self.assertEqual(search.build_match_query('!!!'), '')
+
+    def test_title_match_ranks_first(self):
+        self.assertEqual(self.search('logo'), [self.title_match, self.description_match])
+
+    def test_words_are_prefixes_and_all_must_match(self):
+        self.assertEqual(self.search('des'), [self.title_match, self.description_match])
+        self.assertEqual(self.search('logo fonts'), [self.description_match])
+        self.assertEqual(self.search('logo travel'), [])
+
+    def test_freelancer_and_category_names_are_searched(self):
+        self.assertEqual(set(self.search('sharma')), {self.title_match, self.description_match, self.other})
+        self.assertEqual(self.search('writing'), [self.other])
+
+    def test_index_follows_edits(self):
+        self.writing.name = 'Copywriting'
+        self.writing.save()
+        self.assertEqual(self.search('copywriting'), [self.other])
+        self.freelancer.last_name = 'Thapa'
+        self.freelancer.save()
+        self.assertEqual(len(self.search('thapa')), 3)
+        self.other.title = 'Travel logo'
+        self.other.save()
+        self.assertIn(self.other, self.search('logo'))
+        self.other.delete()
+        self.assertEqual(self.search('travel'), [])
+
+    def test_query_without_words_falls_back_to_icontains(self):
+        gig = self.create_gig('C++ tutoring', 'Lessons', self.writing)
+        self.assertEqual(self.search('++'), [gig])
+
+    def test_other_databases_fall_back_to_icontains(self):
+        with mock.patch.object(search, 'is_enabled', return_value=False):
+            results = self.search('logo')
+        self.assertEqual(results, [self.title_match, self.description_match])
+        self.assertEqual({gig.search_rank for gig in results}, {0.0})
+
+    def test_gig_list_orders_searches_by_relevance(self):
+        self.client.force_login(self.freelancer)
+        response = self.client.get(reverse('gigs:gig_list'), {'q': 'logo'})
+        self.assertEqual(list(response.context['page_obj']), [self.title_match, self.description_match])
+
+
+class KeysetPaginatorTests(TestCase):
+    """Cursors walk every row exactly once, in order, even across tied sort values"""
+
+    @classmethod
+    def setUpTestData(cls):
+        freelancer = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        category = Category.objects.create(name='Graphic Design', slug='graphic-design')
+        # Prices repeat, so pages often split a run of equal values
+        for i in range(23):
+            Gig.objects.create(
+                freelancer=freelancer, category=category, title=f'Gig {i}', slug=f'gig-{i}',
+                description='A gig', price=Decimal(500 + 100 * (i % 4)), delivery_time=3,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, paginator):
+        """Follow next cursors from the first page, then previous cursors back"""
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(paginator.page(back[-1].previous_cursor))
+        return pages, back[::-1]
+
+    def test_walk_forward_and_back(self):
+        for ordering in (('price', 'id'), ('-price', '-id'), ('-created_at', '-id')):
+            with self.subTest(ordering=ordering):
+                expected = list(Gig.objects.order_by(*ordering))
+                pages, back = self.walk(KeysetPaginator(Gig.objects.all(), 5, ordering))
+                self.assertEqual([gig for page in pages for gig in page], expected)
+                self.assertEqual([list(page) for page in back], [list(page) for page in pages])
+                self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+                self.assertEqual([page.number for page in back], [1, 2, 3, 4, 5])
+
+    def test_each_page_is_one_query(self):
+        paginator = KeysetPaginator(Gig.objects.all(), 5, ('price', 'id'))
+        cursor = paginator.page().next_cursor
+        with assert_max_queries(1, 'page'):
+            self.assertEqual(len(paginator.page(cursor)), 5)
+
+    def test_bad_cursor(self):
+        paginator = KeysetPaginator(Gig.objects.all(), 5, ('price', 'id'))
+        for cursor in ('not-a-cursor', paginator.encode_cursor(Gig.objects.first(), 2, 'sideways')):
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+            self.assertEqual(paginator.get_page(cursor).number, 1)
+
+    def test_count_is_cached(self):
+        paginator = KeysetPaginator(Gig.objects.all(), 5, ('price', 'id'), count_timeout=60)
+        self.assertEqual((paginator.count, paginator.num_pages), (23, 5))
+        Gig.objects.filter(pk=Gig.objects.first().pk).delete()
+        with assert_max_queries(0, 'count'):
+            self.assertEqual(KeysetPaginator(Gig.objects.all(), 5, ('price', 'id'), count_timeout=60).count, 23)
+        self.assertIsNone(KeysetPaginator(Gig.objects.all(), 5, ('price', 'id')).count)
+
+    def test_gig_list_pages_by_cursor(self):
+        self.client.force_login(CustomUser.objects.get(username='freelancer'))
+        response = self.client.get(reverse('gigs:gig_list'), {'sort': 'price_low'})
+        first = list(response.context['page_obj'])
+        response = self.client.get(
+            reverse('gigs:gig_list'), {'sort': 'price_low', 'cursor': response.context['page_obj'].next_cursor},
+        )
+        second = list(response.context['page_obj'])
+        self.assertFalse(set(first) & set(second))
+        self.assertLessEqual(first[-1].price, second[0].price)
+
+
+class FacetTests(TestCase):
+    """Each facet counts the gigs matching the other active filters, from the gigs or the GigFacet table"""
+
+    PRICES = ['500', '999.99', '1000', '4999.99', '5000', '12000', '25000', '80000']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.freelancer = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        cls.categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(3)]
+        for i, price in enumerate(cls.PRICES * 2):
+            Gig.objects.create(
+                freelancer=cls.freelancer, category=cls.categories[i % 3], title=f'Gig {i}', slug=f'gig-{i}',
+                description='A gig', price=Decimal(price), delivery_time=3, is_active=i % 5 != 0,
+            )
+
+    def expected(self, category_id=None, min_price=None, max_price=None):
+        """The facet counts, counted gig by gig"""
+        gigs = list(Gig.objects.filter(is_active=True))
+        in_range = [
+            gig for gig in gigs
+            if (min_price is None or gig.price >= Decimal(min_price))
+            and (max_price is None or gig.price <= Decimal(max_price))
+        ]
+        category_counts = {}
+        for gig in in_range:
+            category_counts[gig.category_id] = category_counts.get(gig.category_id, 0) + 1
+        bucket_counts = [0] * len(facets.PRICE_BUCKETS)
+        for gig in gigs:
+            if category_id is None or gig.category_id == category_id:
+                bucket_counts[facets.price_bucket(gig.price)] += 1
+        return category_counts, bucket_counts
+
+    def test_price_buckets(self):
+        self.assertEqual(
+            [facets.price_bucket(price) for price in self.PRICES], [0, 0, 1, 1, 2, 3, 4, 4],
+        )
+        self.assertEqual(facets.price_range_buckets('1000', '4999.99'), {1})
+        self.assertEqual(facets.price_range_buckets('1000', None), {1, 2, 3, 4})
+        self.assertEqual(facets.price_range_buckets(None, '9999.99'), {0, 1, 2})
+        self.assertIsNone(facets.price_range_buckets('1500', None))
+        self.assertIsNone(facets.price_range_buckets('cheap', None))
+
+    def test_counts_under_the_other_filters(self):
+        category_id = self.categories[1].id
+        for filters in (
+            {}, {'category_id': category_id}, {'min_price': '1000', 'max_price': '9999.99'},
+            {'category_id': category_id, 'min_price': '5000'}, {'min_price': '900', 'max_price': '20000'},
+        ):
+            with self.subTest(**filters):
+                expected = self.expected(**filters)
+                self.assertEqual(facets.compute_facets(Gig.objects.filter(is_active=True), **filters), expected)
+                self.assertEqual(facets.browse_facets(**filters), expected)
+
+    def test_browse_reads_the_facet_table(self):
+        with assert_max_queries(1, 'browse_facets'):
+            facets.browse_facets(self.categories[0].id, '1000', '4999.99')
+
+    def test_facet_table_follows_gig_changes(self):
+        gig = Gig.objects.filter(is_active=True).first()
+        gig.price = Decimal('30000')
+        gig.save()
+        gig.category = self.categories[2]
+        gig.save(update_fields=['category'])
+        Gig.objects.filter(is_active=True).last().delete()
+        inactive = Gig.objects.filter(is_active=False).first()
+        inactive.is_active = True
+        inactive.save()
+
+        cells = set(GigFacet.objects.filter(gig_count__gt=0).values_list('category_id', 'price_bucket', 'gig_count'))
+        facets.refresh_facets()
+        self.assertEqual(cells, set(GigFacet.objects.values_list('category_id', 'price_bucket', 'gig_count')))
+        self.assertEqual(facets.browse_facets(), self.expected())
+
+
+class GigSimilarityTests(TestCase):
+    """Related gigs are the closest active gigs by TF-IDF cosine, kept current by the incremental job"""
+
+    GIGS = [
+        ('Logo design', 'Modern minimalist logo design for your brand identity'),
+        ('Brand logo', 'Minimalist brand logo and identity design'),
+        ('Business card design', 'Print ready business card design with your logo'),
+        ('Python scraping', 'Python web scraping scripts with requests and pandas'),
+        ('Data scraping', 'Scraping product data into spreadsheets with Python'),
+        ('Wedding video editing', 'Cinematic wedding video editing with colour grading'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.freelancer = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        cls.category = Category.objects.create(name='Design', slug='design')
+        cls.gigs = [
+            Gig.objects.create(
+                freelancer=cls.freelancer, category=cls.category, title=title, slug=f'gig-{i}',
+                description=description, price=Decimal('1000'), delivery_time=3,
+            )
+            for i, (title, description) in enumerate(cls.GIGS)
+        ]
+
+    def related(self, gig):
+        return list(GigSimilarity.objects.filter(gig=gig).order_by('rank').values_list('related_gig_id', flat=True))
+
+    def all_related(self):
+        return {gig.id: self.related(gig) for gig in Gig.objects.all()}
+
+    def test_rows_are_unit_vectors(self):
+        ids, matrix = similarity.build_matrix(
+            [(1, 'Logo', 'Vector logo'), (2, 'Logo', 'Vector logo'), (3, 'Video', 'Editing'),
+             (4, 'Copywriting', 'Blog posts'), (5, 'Translation', 'Nepali')]
+        )
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        np.testing.assert_allclose(norms, 1)
+        np.testing.assert_allclose((matrix[0] @ matrix[1].T).toarray(), [[1]])
+        self.assertEqual((matrix[0] @ matrix[2].T).nnz, 0)
+
+    def test_rebuild_ranks_closest_gigs_first(self):
+        self.assertEqual(similarity.rebuild_similarities(), len(self.gigs))
+        logo, brand, card, python, data, video = self.gigs
+        self.assertEqual(self.related(logo)[0], brand.id)
+        self.assertEqual(self.related(python), [data.id])
+        self.assertEqual(self.related(video), [])
+        for gig in self.gigs:
+            scores = list(GigSimilarity.objects.filter(gig=gig).order_by('rank').values_list('score', flat=True))
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            self.assertNotIn(gig.id, self.related(gig))
+        self.assertFalse(Gig.objects.filter(similarity_stale=True).exists())
+
+    def test_gig_detail_shows_neighbours_in_rank_order(self):
+        similarity.rebuild_similarities()
+        logo = self.gigs[0]
+        response = self.client.get(reverse('gigs:gig_detail', args=[logo.slug]))
+        self.assertEqual([gig.id for gig in response.context['related_gigs']], self.related(logo)[:4])
+
+    def test_incremental_update_matches_rebuild(self):
+        similarity.rebuild_similarities()
+        logo, brand, card, python, data, video = self.gigs
+        # The video gig turns into a scraping gig and the brand gig goes away
+        video.title = 'Python data scraping'
+        video.description = 'Scraping websites into spreadsheets with Python and pandas'
+        video.save()
+        brand.is_active = False
+        brand.save()
+        self.assertEqual(set(Gig.objects.filter(similarity_stale=True)), {video, brand})
+
+        # Every gig that listed the brand gig or now ranks the video gig, besides the video gig
+        self.assertEqual(similarity.update_stale_similarities(), 5)
+        self.assertFalse(Gig.objects.filter(similarity_stale=True).exists())
+        self.assertEqual(self.related(brand), [])
+        self.assertIn(video.id, self.related(python))
+        self.assertIn(video.id, self.related(data))
+        incremental = self.all_related()
+
+        similarity.rebuild_similarities()
+        self.assertEqual(incremental, self.all_related())
+
+    def test_nothing_stale_is_a_no_op(self):
+        similarity.rebuild_similarities()
+        with assert_max_queries(1, 'update_stale_similarities'):
+            self.assertEqual(similarity.update_stale_similarities(), 0)
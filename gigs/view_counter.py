@@ -0,0 +1,109 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = Counter()
+_flusher = None
+_flusher_pid = None
+
+
+def flush_interval():
+    """Seconds between flushes, or None when views are written straight away.
+
+    Buffering is opt-in (settings.GIG_VIEW_FLUSH_INTERVAL) so that only
+    server processes run a flusher thread, not tests or management
+    commands. At most this much view data is lost on a crash.
+    """
+    return getattr(settings, 'GIG_VIEW_FLUSH_INTERVAL', None)
+
+
+def record_view(gig_id):
+    """Count one view of a gig, buffered for the next flush when buffering is on"""
+    from .models import Gig
+
+    interval = flush_interval()
+    if not interval:
+        Gig.objects.filter(pk=gig_id).update(views=F('views') + 1)
+        return
+    _ensure_flusher(interval)
+    with _lock:
+        _pending[gig_id] += 1
+
+
+def pending_views(gig_id):
+    """Views of a gig recorded in this process but not yet flushed"""
+    with _lock:
+        return _pending.get(gig_id, 0)
+
+
+def flush():
+    """Write all buffered views to the database and return how many gigs changed.
+
+    Gigs with the same number of new views share one
+    ``UPDATE ... SET views = views + n`` statement, all in one transaction.
+    If the write fails the counts are put back for the next flush.
+    """
+    from .models import Gig
+
+    global _pending
+    with _lock:
+        batch, _pending = _pending, Counter()
+    if not batch:
+        return 0
+
+    by_count = defaultdict(list)
+    for gig_id, count in batch.items():
+        by_count[count].append(gig_id)
+
+    try:
+        with transaction.atomic():
+            for count, gig_ids in by_count.items():
+                Gig.objects.filter(pk__in=gig_ids).update(views=F('views') + count)
+    except Exception:
+        logger.exception('Failed to flush %d buffered gig views', sum(batch.values()))
+        with _lock:
+            _pending.update(batch)
+        return 0
+    return len(batch)
+
+
+def _run_flusher(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        finally:
+            connection.close()
+
+
+def _ensure_flusher(interval):
+    """Start the background flusher once per process (again after a fork)"""
+    global _flusher, _flusher_pid, _pending
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with _lock:
+        if _flusher_pid == pid:
+            return
+        if _flusher_pid is not None:
+            # Forked child: the parent still owns the copied counts
+            _pending = Counter()
+        _flusher = threading.Thread(
+            target=_run_flusher, args=(interval,), name='gig-view-flusher', daemon=True,
+        )
+        _flusher.start()
+        _flusher_pid = pid
+
+
+atexit.register(flush)
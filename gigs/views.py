@@ -1,71 +1,112 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
 from django.core.paginator import Paginator
 from django.utils.text import slugify
+from skillbazar.query_budget import PAGE_QUERIES, query_budget
 from .models import Gig, Category, Order
 from .forms import GigForm
+from . import facets, search
+from .cache import HOME_CACHE_TIMEOUT, home_version
+from .pagination import KeysetPaginator
 
 
+GIGS_PER_PAGE = 12
+
+# Seconds a gig list total is cached for the "N services found" hint
+GIG_COUNT_TIMEOUT = 300
+
+# Keyset orderings per sort option; each ends in id so positions are unique
+GIG_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+    'rating': ('-rating', '-id'),
+}
+
+# Related gigs shown on gig_detail
+RELATED_GIGS = 4
+
+
+@query_budget(4 + PAGE_QUERIES)
 def home(request):
-    """Homepage view with featured gigs and categories"""
+    """Homepage view with featured gigs and categories.
+
+    The querysets are lazy and the template caches each section under
+    home_version, so a warm homepage only looks up that version.
+    """
     categories = Category.objects.all()[:6]
-    featured_gigs = Gig.objects.filter(is_active=True).order_by('-rating', '-views')[:8]
-    recent_gigs = Gig.objects.filter(is_active=True).order_by('-created_at')[:6]
+    card_gigs = Gig.objects.filter(is_active=True).select_related('freelancer', 'category')
+    featured_gigs = card_gigs.order_by('-rating', '-views')[:8]
+    recent_gigs = card_gigs.order_by('-created_at')[:6]
     
     context = {
         'categories': categories,
         'featured_gigs': featured_gigs,
         'recent_gigs': recent_gigs,
+        'home_version': home_version(),
+        'home_cache_timeout': HOME_CACHE_TIMEOUT,
     }
     return render(request, 'gigs/home.html', context)
 
 
+@query_budget(4 + PAGE_QUERIES)
 def gig_list(request):
     """List all gigs with filtering and search"""
-    gigs = Gig.objects.filter(is_active=True)
+    gigs = Gig.objects.filter(is_active=True).select_related('freelancer', 'category')
     
     # Search functionality
     query = request.GET.get('q')
     if query:
-        gigs = gigs.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(freelancer__username__icontains=query) |
-            Q(category__name__icontains=query)
-        )
+        gigs = search.search_gigs(gigs, query)
     
-    # Category filter
+    categories = list(Category.objects.all())
     category_slug = request.GET.get('category')
+    min_price = request.GET.get('min_price')
+    max_price = request.GET.get('max_price')
+    category_id = None
+    if category_slug:
+        # An unknown slug matches no gigs
+        category_id = next((category.id for category in categories if category.slug == category_slug), 0)
+    
+    # Facet counts for the search, each under the other facet's filter;
+    # plain browsing reads them from the materialized facet table
+    if query:
+        category_counts, bucket_counts = facets.compute_facets(gigs, category_id, min_price, max_price)
+    else:
+        category_counts, bucket_counts = facets.browse_facets(category_id, min_price, max_price)
+    
+    # Category filter
     if category_slug:
         gigs = gigs.filter(category__slug=category_slug)
     
     # Price filter
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
     if min_price:
         gigs = gigs.filter(price__gte=min_price)
     if max_price:
         gigs = gigs.filter(price__lte=max_price)
     
-    # Sort options
-    sort = request.GET.get('sort', 'newest')
-    if sort == 'price_low':
-        gigs = gigs.order_by('price')
-    elif sort == 'price_high':
-        gigs = gigs.order_by('-price')
-    elif sort == 'rating':
-        gigs = gigs.order_by('-rating')
-    else:  # newest
-        gigs = gigs.order_by('-created_at')
+    # Sort options (searches default to relevance)
+    sort = request.GET.get('sort') or ('relevance' if query else 'newest')
     
-    # Pagination
-    paginator = Paginator(gigs, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination: relevance ranks are only known per query, so that sort
+    # pages by offset; every other sort seeks by cursor
+    if sort == 'relevance' and query:
+        gigs = gigs.order_by('search_rank', '-created_at')
+        paginator = Paginator(gigs, GIGS_PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get('page'))
+    else:
+        ordering = GIG_ORDERINGS.get(sort, GIG_ORDERINGS['newest'])
+        paginator = KeysetPaginator(gigs, GIGS_PER_PAGE, ordering, count_timeout=GIG_COUNT_TIMEOUT)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
     
-    categories = Category.objects.all()
+    for category in categories:
+        category.hit_count = category_counts.get(category.id, 0)
+    
+    # Current filters, carried over by the pagination and facet links
+    params = request.GET.copy()
+    params.pop('page', None)
+    params.pop('cursor', None)
     
     context = {
         'page_obj': page_obj,
@@ -75,6 +116,8 @@ def gig_list(request):
         'min_price': min_price,
         'max_price': max_price,
         'sort': sort,
+        'querystring': params.urlencode(),
+        'price_buckets': facets.price_bucket_options(bucket_counts, params),
     }
     return render(request, 'gigs/gig_list.html', context)
 
@@ -84,11 +127,16 @@ def gig_detail(request, slug):
     gig = get_object_or_404(Gig, slug=slug, is_active=True)
     gig.increment_views()
     
-    # Get related gigs
-    related_gigs = Gig.objects.filter(
-        category=gig.category,
-        is_active=True
-    ).exclude(id=gig.id)[:4]
+    # Precomputed content neighbours, read off the (gig, rank) index
+    related_gigs = list(
+        Gig.objects.filter(similar_to__gig=gig, is_active=True).order_by('similar_to__rank')[:RELATED_GIGS]
+    )
+    if not related_gigs:
+        # Not computed yet: newest gigs in the same category
+        related_gigs = Gig.objects.filter(
+            category_id=gig.category_id,
+            is_active=True
+        ).exclude(id=gig.id).order_by('-created_at', '-id')[:RELATED_GIGS]
     
     context = {
         'gig': gig,
@@ -97,15 +145,15 @@ def gig_detail(request, slug):
     return render(request, 'gigs/gig_detail.html', context)
 
 
+@query_budget(3 + PAGE_QUERIES)
 def category_gigs(request, slug):
     """Show gigs for a specific category"""
     category = get_object_or_404(Category, slug=slug)
-    gigs = Gig.objects.filter(category=category, is_active=True).order_by('-created_at')
+    gigs = Gig.objects.filter(category=category, is_active=True).select_related('freelancer', 'category')
     
     # Pagination
-    paginator = Paginator(gigs, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(gigs, GIGS_PER_PAGE, GIG_ORDERINGS['newest'], count_timeout=GIG_COUNT_TIMEOUT)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'category': category,
@@ -1,12 +1,20 @@
 from django.contrib import admin
-from .models import Conversation, Message
+from .models import Conversation, ConversationParticipant, Message, ReplyTask
+from .replies import TEMPLATES
+
+
+class ConversationParticipantInline(admin.TabularInline):
+    model = ConversationParticipant
+    extra = 0
+    raw_id_fields = ['user']
+    readonly_fields = ['unread_count', 'last_read_message_id', 'last_activity_at']
 
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ['id', 'participants_list', 'created_at', 'updated_at']
-    filter_horizontal = ['participants']
-    readonly_fields = ['created_at', 'updated_at']
+    list_display = ['id', 'participants_list', 'created_at', 'last_activity_at']
+    inlines = [ConversationParticipantInline]
+    readonly_fields = ['created_at', 'updated_at', 'last_message', 'last_activity_at']
     
     def participants_list(self, obj):
         return ", ".join([user.username for user in obj.participants.all()])
@@ -15,11 +23,30 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['sender', 'conversation', 'content_preview', 'is_read', 'created_at']
-    list_filter = ['is_read', 'created_at']
+    list_display = ['sender', 'conversation', 'content_preview', 'created_at']
+    list_filter = ['created_at']
+    # Templated messages store only their template key and the sender's name
+    # in content; get_search_results also matches the templates' own text
     search_fields = ['content', 'sender__username']
     readonly_fields = ['created_at']
     
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        term = search_term.strip().lower()
+        keys = [key for key, template in TEMPLATES.items() if term and term in template.lower()]
+        if keys:
+            results |= queryset.filter(template__in=keys)
+        return results, may_have_duplicates
+    
     def content_preview(self, obj):
-        return obj.content[:50] + "..." if len(obj.content) > 50 else obj.content
-    content_preview.short_description = 'Content' 
\ No newline at end of file
+        text = obj.text
+        return text[:50] + "..." if len(text) > 50 else text
+    content_preview.short_description = 'Content'
+
+
+@admin.register(ReplyTask)
+class ReplyTaskAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'conversation', 'sender', 'attempts', 'run_after', 'created_at']
+    list_filter = ['kind']
+    raw_id_fields = ['conversation', 'sender', 'message']
+    readonly_fields = ['created_at']
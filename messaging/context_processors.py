@@ -0,0 +1,10 @@
+from .inbox import unread_total
+
+
+def unread_messages(request):
+    """Expose the signed in user's unread message total as ``unread_message_count``"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    # Only looked up by templates that show it
+    return {'unread_message_count': lambda: unread_total(user.id)}
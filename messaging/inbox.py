@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce, Greatest
+
+
+# Cached unread totals are dropped or recounted whenever a change commits, so
+# this only bounds how long an unused one is kept. Invalidations reach other
+# processes (and the message worker) only through a shared cache; see CACHES
+UNREAD_TOTAL_TIMEOUT = getattr(settings, 'MESSAGING_UNREAD_TOTAL_TIMEOUT', 24 * 60 * 60)
+
+
+def unread_total_key(user_id):
+    return f'messaging:unread_total:{user_id}'
+
+
+def unread_total(user_id):
+    """The user's unread messages across all conversations, cached per user"""
+    total = cache.get(unread_total_key(user_id))
+    if total is None:
+        total = refresh_unread_total(user_id)
+    return total
+
+
+def refresh_unread_total(user_id):
+    """Count the user's unread messages into the cache and return the total"""
+    from .models import ConversationParticipant
+
+    total = ConversationParticipant.objects.filter(user_id=user_id).aggregate(
+        total=Coalesce(Sum('unread_count'), 0),
+    )['total']
+    cache.set(unread_total_key(user_id), total, UNREAD_TOTAL_TIMEOUT)
+    return total
+
+
+def _forget_unread_totals(user_ids):
+    # Dropped rather than bumped: a total counted after the commit already
+    # includes the change, and the next read counts it from the database
+    cache.delete_many([unread_total_key(user_id) for user_id in user_ids])
+
+
+def forget_participant(participant):
+    """Recount a departing participant's unread total once the removal commits"""
+    if participant.unread_count:
+        transaction.on_commit(lambda: refresh_unread_total(participant.user_id))
+
+
+def record_message(message):
+    """Make a new message the conversation's latest and count it as unread.
+
+    One UPDATE moves the conversation's last message and activity time
+    (unless a newer message already got there), and one bumps every other
+    participant's unread counter along with their inbox position. Their
+    cached unread totals are dropped once the message commits.
+    """
+    from .models import Conversation, ConversationParticipant
+
+    sent_at = message.created_at
+    Conversation.objects.filter(
+        pk=message.conversation_id, last_activity_at__lte=sent_at,
+    ).update(last_message=message, last_activity_at=sent_at, updated_at=sent_at)
+    ConversationParticipant.objects.filter(conversation_id=message.conversation_id).update(
+        last_activity_at=Greatest('last_activity_at', sent_at),
+        unread_count=Case(
+            When(user_id=message.sender_id, then=F('unread_count')),
+            default=F('unread_count') + 1,
+        ),
+    )
+    recipients = list(
+        ConversationParticipant.objects.filter(conversation_id=message.conversation_id)
+        .exclude(user_id=message.sender_id).values_list('user_id', flat=True)
+    )
+    transaction.on_commit(lambda: _forget_unread_totals(recipients))
+
+
+def mark_read(conversation_id, user):
+    """Move the user's read watermark to the conversation's last message.
+
+    One UPDATE of the user's membership row, skipped when nothing is unread.
+    Moving the watermark recounts the user's cached unread total.
+    """
+    from .models import Conversation, ConversationParticipant
+
+    last_message = Conversation.objects.filter(pk=OuterRef('conversation')).values('last_message_id')[:1]
+    moved = ConversationParticipant.objects.filter(
+        conversation_id=conversation_id, user=user, unread_count__gt=0,
+    ).update(
+        last_read_message_id=Greatest('last_read_message_id', Coalesce(Subquery(last_message), 0)),
+        unread_count=0,
+    )
+    if moved:
+        transaction.on_commit(lambda: refresh_unread_total(user.id))
+
+
+def rebuild_inbox(conversation_model=None, participant_model=None, message_model=None):
+    """Recompute last messages, activity times and unread counters from messages.
+
+    Unread counters count the other participants' messages past each read
+    watermark. Each column is filled by one set based UPDATE, and cached
+    unread totals are dropped. Models can be passed in so migrations can
+    use their historical versions.
+    """
+    if conversation_model is None:
+        from .models import Conversation, ConversationParticipant, Message
+        conversation_model, participant_model, message_model = Conversation, ConversationParticipant, Message
+
+    latest = message_model.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+    unread = message_model.objects.filter(
+        conversation=OuterRef('conversation'), id__gt=OuterRef('last_read_message_id'),
+    ).exclude(sender=OuterRef('user')).order_by().values('conversation').annotate(total=Count('id'))
+
+    with transaction.atomic():
+        conversation_model.objects.update(
+            last_message=Subquery(latest.values('id')[:1]),
+            last_activity_at=Coalesce(Subquery(latest.values('created_at')[:1]), 'created_at'),
+        )
+        participant_model.objects.update(
+            last_activity_at=Subquery(
+                conversation_model.objects.filter(pk=OuterRef('conversation')).values('last_activity_at')[:1]
+            ),
+            unread_count=Coalesce(Subquery(unread.values('total')), 0),
+        )
+    user_ids = participant_model.objects.values_list('user_id', flat=True).distinct()
+    _forget_unread_totals(user_ids)
@@ -0,0 +1,34 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from messaging.replies import generate_auto_reply, generate_welcome_message, match_keyword
+from users.models import CustomUser
+
+SAMPLE_MESSAGES = [
+    'Hi, what would this cost for a five page website?',
+    'I need it quickly, the deadline is Friday.',
+    'Can you show me your portfolio?',
+    'Hello there, I came across your gig and would like to know more about it.',
+    'Ok thanks',
+    'Is revision included in the package, and how do payments work?',
+]
+
+
+class Command(BaseCommand):
+    help = 'Time auto-reply and welcome message generation per call'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help='Calls timed per run')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs; the fastest is reported')
+
+    def handle(self, *args, **options):
+        freelancer = CustomUser(username='bench', first_name='Bench', last_name='Freelancer')
+        cases = {
+            'match_keyword': lambda: [match_keyword(text) for text in SAMPLE_MESSAGES],
+            'generate_auto_reply': lambda: [generate_auto_reply(text, freelancer) for text in SAMPLE_MESSAGES],
+            'generate_welcome_message': lambda: [generate_welcome_message(freelancer) for _ in SAMPLE_MESSAGES],
+        }
+        calls = options['number'] * len(SAMPLE_MESSAGES)
+        for name, case in cases.items():
+            best = min(timeit.repeat(case, number=options['number'], repeat=options['repeat']))
+            self.stdout.write(f'{name}: {best / calls * 1e6:.2f} us per call')
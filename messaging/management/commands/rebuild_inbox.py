@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from messaging.inbox import rebuild_inbox
+
+
+class Command(BaseCommand):
+    help = 'Rebuild conversation last messages and unread counters from all messages'
+
+    def handle(self, *args, **options):
+        rebuild_inbox()
+        self.stdout.write(
+            self.style.SUCCESS('Successfully rebuilt the messaging inbox!')
+        )
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from messaging.tasks import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Send queued welcome messages and auto-replies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the tasks that are due and exit')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=100, help='Tasks run per database poll')
+
+    def handle(self, *args, **options):
+        if settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+            self.stderr.write(self.style.WARNING(
+                'The default cache is local to this process: unread badges in the web '
+                'processes will miss auto-replies until their cached totals expire.'
+            ))
+        if options['once']:
+            sent = 0
+            while True:
+                ran = run_pending(options['batch_size'])
+                sent += ran
+                if ran < options['batch_size']:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'Sent {sent} queued messages!'))
+            return
+        self.stdout.write('Message worker running, press Ctrl+C to stop.')
+        try:
+            while True:
+                close_old_connections()
+                if run_pending(options['batch_size']) < options['batch_size']:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
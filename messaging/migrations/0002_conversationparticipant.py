@@ -0,0 +1,36 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('messaging', '0001_initial'),
+    ]
+
+    operations = [
+        # Adopt the auto-created participants table as an explicit through model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ConversationParticipant',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='messaging.conversation')),
+                        ('user', models.ForeignKey(db_column='customuser_id', on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'messaging_conversation_participants',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='conversations', through='messaging.ConversationParticipant', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_conversationparticipant'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='conversation',
+            options={'ordering': ['-last_activity_at']},
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message'),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='conversationparticipant',
+            index=models.Index(fields=['user', '-last_activity_at', '-conversation'], name='participant_inbox_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_inbox_state(apps, schema_editor):
+    # A frozen copy of messaging.inbox.rebuild_inbox as of this migration,
+    # which counted unread messages by Message.is_read
+    Conversation = apps.get_model('messaging', 'Conversation')
+    ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+    Message = apps.get_model('messaging', 'Message')
+
+    latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+    unread = Message.objects.filter(
+        conversation=OuterRef('conversation'), is_read=False,
+    ).exclude(sender=OuterRef('user')).order_by().values('conversation').annotate(total=Count('id'))
+
+    with transaction.atomic():
+        Conversation.objects.update(
+            last_message=Subquery(latest.values('id')[:1]),
+            last_activity_at=Coalesce(Subquery(latest.values('created_at')[:1]), 'created_at'),
+        )
+        ConversationParticipant.objects.update(
+            last_activity_at=Subquery(
+                Conversation.objects.filter(pk=OuterRef('conversation')).values('last_activity_at')[:1]
+            ),
+            unread_count=Coalesce(Subquery(unread.values('total')), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_conversation_inbox_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_inbox_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0004_backfill_inbox_state'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='message_history_idx'),
+        ),
+    ]
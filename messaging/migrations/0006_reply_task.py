@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('messaging', '0005_message_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplyTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('welcome', 'Welcome message'), ('auto_reply', 'Auto-reply')], max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reply_tasks', to='messaging.conversation')),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='messaging.message')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['run_after', 'id'],
+                'indexes': [models.Index(fields=['run_after', 'id'], name='reply_task_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def backfill_pair_keys(apps, schema_editor):
+    """Key every two-party conversation; the oldest of any duplicate threads keeps the key"""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+
+    members = defaultdict(list)
+    for conversation_id, user_id in ConversationParticipant.objects.values_list('conversation_id', 'user_id'):
+        members[conversation_id].append(user_id)
+
+    keyed = set()
+    updates = []
+    for conversation in Conversation.objects.only('id').order_by('id'):
+        user_ids = members.get(conversation.id, [])
+        if len(user_ids) != 2:
+            continue
+        pair = (min(user_ids), max(user_ids))
+        if pair in keyed:
+            continue
+        keyed.add(pair)
+        conversation.min_user_id, conversation.max_user_id = pair
+        updates.append(conversation)
+    Conversation.objects.bulk_update(updates, ['min_user', 'max_user'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_conversation_pair_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pair_keys, migrations.RunPython.noop),
+    ]
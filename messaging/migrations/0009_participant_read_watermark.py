@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0008_backfill_conversation_pair_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    """Start each watermark at the newest message from the others the user had read"""
+    ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+    Message = apps.get_model('messaging', 'Message')
+
+    others = Message.objects.filter(conversation=OuterRef('conversation')).exclude(sender=OuterRef('user')).order_by()
+    newest_read = others.filter(is_read=True).values('conversation').annotate(newest=Max('id'))
+    ConversationParticipant.objects.update(
+        last_read_message_id=Coalesce(Subquery(newest_read.values('newest')), 0),
+    )
+    # Recount against the watermarks, so counters and watermarks agree
+    unread = others.filter(id__gt=OuterRef('last_read_message_id')).values('conversation').annotate(total=Count('id'))
+    ConversationParticipant.objects.update(
+        unread_count=Coalesce(Subquery(unread.values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_participant_read_watermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_read_watermarks, migrations.RunPython.noop),
+    ]
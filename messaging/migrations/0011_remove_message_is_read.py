@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_backfill_read_watermark'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0011_remove_message_is_read'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='template',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
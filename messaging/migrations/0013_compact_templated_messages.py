@@ -0,0 +1,133 @@
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+# A frozen copy of messaging.replies.TEMPLATES as of this migration, so later
+# additions to the reply tables do not change what it matches
+TEMPLATES = {
+    'welcome.0': "Hi! I'm {name}. Thanks for your interest in my services. How can I help you today?",
+    'welcome.1': "Hello! I'm {name}. I'm excited to work with you. What project do you have in mind?",
+    'welcome.2': "Welcome! I'm {name}. I'd love to discuss your project requirements. What are you looking for?",
+    'welcome.3': "Hi there! I'm {name}. Ready to bring your ideas to life. What can I do for you?",
+    'welcome.4': "Hello! I'm {name}. Let's discuss how I can help with your project. What do you need?",
+    'price.0': "Thanks for asking about pricing! I offer competitive rates and can provide a detailed quote based on your specific requirements. What's your budget range?",
+    'price.1': "I'd be happy to discuss pricing options with you. My rates are flexible and depend on the project scope. Could you share more details about your project?",
+    'price.2': "Pricing varies based on project complexity and timeline. I can provide a custom quote once I understand your needs better. What's your timeline?",
+    'price.3': "I offer transparent pricing with no hidden fees. Let me know your project details and I'll provide a fair quote. What's your budget?",
+    'cost.0': 'I offer competitive pricing that fits various budgets. Could you tell me more about your project so I can give you an accurate quote?',
+    'cost.1': "My rates are reasonable and I'm happy to work within your budget. What's the scope of your project?",
+    'cost.2': "I provide value for money with quality work. Let's discuss your requirements and I'll give you a fair price.",
+    'time.0': "Great question about timing! I typically deliver projects within the agreed timeframe. What's your deadline for this project?",
+    'time.1': "I'm committed to meeting deadlines and keeping you updated throughout the process. When do you need this completed?",
+    'time.2': "Timeline depends on project scope, but I always communicate clearly about delivery dates. What's your preferred timeline?",
+    'time.3': 'I work efficiently to meet your deadlines. How soon do you need this project completed?',
+    'deadline.0': "I understand deadlines are important. I'll work efficiently to meet your timeline. When do you need this completed?",
+    'deadline.1': "I'm committed to delivering on time. Let me know your deadline and I'll ensure we meet it.",
+    'deadline.2': "Timely delivery is a priority for me. What's your target completion date?",
+    'experience.0': "I have extensive experience in this field and have completed many successful projects. I'd be happy to share my portfolio with you.",
+    'experience.1': 'With years of experience, I bring expertise and reliability to every project. Would you like to see some of my previous work?',
+    'experience.2': "I'm confident in my skills and experience. I can provide references and examples of my work if you'd like.",
+    'experience.3': "I've worked on various projects and have a proven track record. Would you like to see some examples of my work?",
+    'portfolio.0': "I'd be happy to share my portfolio with you! I have examples of my best work that showcase my skills and style.",
+    'portfolio.1': "Absolutely! I can show you my portfolio with various projects I've completed. What type of work interests you most?",
+    'portfolio.2': 'I have a comprehensive portfolio demonstrating my expertise. Would you like me to share specific examples relevant to your project?',
+    'portfolio.3': "My portfolio showcases my best work and demonstrates my capabilities. I'd love to share it with you!",
+    'work.0': "I'd be happy to show you examples of my work. I have a portfolio that demonstrates my skills and style.",
+    'work.1': 'I can share my previous projects with you. What type of work are you most interested in seeing?',
+    'work.2': 'I have a collection of my best work that I can share. Would you like to see specific examples?',
+    'start.0': "I'm ready to start working on your project! Let's discuss the details and get everything set up.",
+    'start.1': "Perfect! I'm excited to begin. Let me know what specific requirements you have and I'll get started right away.",
+    'start.2': "Great! I'm available to start immediately. What are the next steps you'd like to take?",
+    'start.3': "I'm ready to get started on your project. Let's finalize the details and begin!",
+    'begin.0': "I'm ready to begin working on your project. Let's discuss the requirements and get started.",
+    'begin.1': "Perfect! I'm excited to start. What specific details should we discuss first?",
+    'begin.2': "Great! Let's get started. What are the key requirements for your project?",
+    'payment.0': "I accept various payment methods and can discuss payment terms that work for both of us. What's your preferred payment method?",
+    'payment.1': "Payment can be arranged through SkillBazar's secure system. I'm flexible with payment schedules. What works best for you?",
+    'payment.2': "I offer secure payment options and can work with your preferred payment method. Let's discuss the payment terms.",
+    'payment.3': "I'm flexible with payment arrangements. We can discuss terms that work for both of us.",
+    'pay.0': 'I accept multiple payment methods for your convenience. What payment option works best for you?',
+    'pay.1': "Payment can be arranged securely through SkillBazar. I'm flexible with payment schedules.",
+    'pay.2': "I offer various payment options to make it easy for you. Let's discuss what works best.",
+    'quality.0': "I'm committed to delivering high-quality work that exceeds expectations. Quality is my top priority.",
+    'quality.1': 'I take pride in my work and always strive for excellence. You can expect top-notch results.',
+    'quality.2': 'Quality is non-negotiable for me. I ensure every project meets the highest standards.',
+    'revision.0': "I offer revisions to ensure you're completely satisfied with the final result. Your satisfaction is important to me.",
+    'revision.1': "I'm happy to make revisions until you're 100% satisfied. I want you to love the final product.",
+    'revision.2': 'I provide revision rounds to make sure the work meets your exact requirements.',
+    'urgent.0': "I understand this is urgent. I'll prioritize your project and work efficiently to meet your timeline.",
+    'urgent.1': "I can accommodate urgent projects. Let me know your deadline and I'll ensure timely delivery.",
+    'urgent.2': "I'm available for urgent work and will work quickly to meet your needs.",
+    'quick.0': "I can work quickly to meet your timeline. Let me know your deadline and I'll ensure fast delivery.",
+    'quick.1': "I'm efficient and can complete projects quickly while maintaining quality. What's your timeline?",
+    'quick.2': 'I can work fast to meet your needs. How soon do you need this completed?',
+    'question.0': "Great question! I'm {name} and I'd be happy to help. Could you provide more details about your project?",
+    'question.1': "Thanks for asking! I'm {name}. Let me know more about your requirements so I can give you a detailed answer.",
+    'question.2': "Good question! I'm {name}. I'd love to discuss your project in detail to provide the best answer.",
+    'default.0': "Thanks for your message! I'm {name} and I'm here to help with your project. Could you tell me more about what you need?",
+    'default.1': "Hi! I appreciate your interest. I'm {name} and I'd love to discuss your project requirements in detail.",
+    'default.2': "Hello! I'm {name}. I'm excited to work with you. What specific aspects of your project would you like to discuss?",
+    'default.3': "Thanks for reaching out! I'm {name}. I'm ready to help bring your project to life. What are your main requirements?",
+    'default.4': "Hi there! I'm {name}. I'm committed to delivering quality work. What can I help you with today?",
+    'default.5': "Hello! I'm {name}. I'm here to help you with your project. What would you like to discuss?",
+    'default.6': "Hi! I'm {name}. I'm excited to work with you. What project do you have in mind?",
+    'default.7': "Thanks for contacting me! I'm {name}. I'd love to hear more about your project requirements.",
+}
+
+
+def _batches(queryset):
+    """Rows of queryset in id order, one list per batch, safe to update as it goes"""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def compact_templated_messages(apps, schema_editor):
+    """Store messages whose text is a canned reply as its template key and params"""
+    Message = apps.get_model('messaging', 'Message')
+
+    named = {key: template for key, template in TEMPLATES.items() if '{name}' in template}
+    plain = {template: key for key, template in TEMPLATES.items() if key not in named}
+    by_name = {}
+
+    for batch in _batches(Message.objects.filter(template='').select_related('sender')):
+        changed = []
+        for message in batch:
+            # CustomUser.get_full_name()
+            sender = message.sender
+            name = f'{sender.first_name} {sender.last_name}'.strip() or sender.username
+            if message.content in plain:
+                message.template, message.content = plain[message.content], ''
+            else:
+                if name not in by_name:
+                    by_name[name] = {template.format(name=name): key for key, template in named.items()}
+                key = by_name[name].get(message.content)
+                if key is None:
+                    continue
+                message.template, message.content = key, name
+            changed.append(message)
+        Message.objects.bulk_update(changed, ['template', 'content'])
+
+
+def expand_templated_messages(apps, schema_editor):
+    Message = apps.get_model('messaging', 'Message')
+
+    for batch in _batches(Message.objects.exclude(template='')):
+        for message in batch:
+            message.template, message.content = '', TEMPLATES[message.template].format(name=message.content)
+        Message.objects.bulk_update(batch, ['template', 'content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0012_message_template'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_templated_messages, expand_templated_messages),
+    ]
@@ -1,30 +1,113 @@
 from django.db import models
+from django.utils import timezone
 from users.models import CustomUser
 
 
 class Conversation(models.Model):
     """Conversation between two users"""
-    participants = models.ManyToManyField(CustomUser, related_name='conversations')
+    participants = models.ManyToManyField(CustomUser, through='ConversationParticipant', related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by messaging.inbox when a message is sent
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    # The two participants ordered by id, so a pair has one conversation found by one index lookup
+    min_user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    max_user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     
     class Meta:
-        ordering = ['-updated_at']
+        ordering = ['-last_activity_at']
+        constraints = [
+            models.UniqueConstraint(fields=['min_user', 'max_user'], name='conversation_pair_unique'),
+        ]
     
     def __str__(self):
         return f"Conversation {self.id}"
 
+    @staticmethod
+    def pair_key(user_id, other_user_id):
+        """Lookup arguments for the conversation between two users"""
+        return {
+            'min_user_id': min(user_id, other_user_id),
+            'max_user_id': max(user_id, other_user_id),
+        }
+
 
 class Message(models.Model):
     """Message in a conversation"""
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='sent_messages')
+    # For templated messages, the template's parameters; see text
     content = models.TextField()
-    is_read = models.BooleanField(default=False)
+    # Key of the canned reply (messaging.replies.TEMPLATES) the message was sent from
+    template = models.CharField(max_length=20, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # conversation_detail history window and older pages
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_history_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Message from {self.sender.username} in {self.conversation}"
+
+    @property
+    def text(self):
+        """The message as shown to users, expanded from its template if it has one"""
+        if self.template:
+            from .replies import render_template
+            return render_template(self.template, self.content)
+        return self.content
+
+
+class ConversationParticipant(models.Model):
+    """A user's membership of a conversation"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_column='customuser_id', related_name='conversation_memberships')
+    # Messages from the other participants this user has not read yet
+    unread_count = models.PositiveIntegerField(default=0)
+    # Read watermark: every message up to this id has been seen by the user
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    # Copy of conversation.last_activity_at so the inbox can be read off one index
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'messaging_conversation_participants'
+        unique_together = [('conversation', 'user')]
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at', '-conversation'], name='participant_inbox_idx'),
+        ]
     
     def __str__(self):
-        return f"Message from {self.sender.username} in {self.conversation}" 
\ No newline at end of file
+        return f"{self.user} in {self.conversation}"
+
+
+class ReplyTask(models.Model):
+    """A welcome message or auto-reply waiting for the message worker"""
+    WELCOME = 'welcome'
+    AUTO_REPLY = 'auto_reply'
+    KIND_CHOICES = [
+        (WELCOME, 'Welcome message'),
+        (AUTO_REPLY, 'Auto-reply'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='reply_tasks')
+    # The participant the reply is sent as
+    sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    # The message being answered; empty for welcome messages
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['run_after', 'id'], name='reply_task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.conversation}"
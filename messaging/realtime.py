@@ -0,0 +1,167 @@
+"""Push delivery of new messages to open conversation pages.
+
+Messages are published, once their transaction commits, to a per
+conversation channel as small JSON deltas. The conversation event stream
+(a Server-Sent Events view served by the ASGI application) subscribes to
+that channel. The default broker fans events out inside one process; set
+MESSAGING_BROKER_URL to a Redis URL so several ASGI workers, and the
+message worker's replies, share events. Brokers that are not ``shared``
+miss messages saved by other processes, so listeners on them also poll
+the database.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before it is dropped as too slow
+SUBSCRIBER_BUFFER = 100
+
+# Queued in place of an event when a subscriber falls too far behind
+OVERFLOW = object()
+
+
+def channel_name(conversation_id):
+    return f'conversation:{conversation_id}'
+
+
+def message_event(message):
+    """The JSON delta pushed for a new message"""
+    return {
+        'id': message.id,
+        'conversation_id': message.conversation_id,
+        'sender_id': message.sender_id,
+        'content': message.text,
+        'created_at': message.created_at.isoformat(),
+    }
+
+
+def format_event(event):
+    """Encode an event as a Server-Sent Events frame"""
+    return f'id: {event["id"]}\nevent: message\ndata: {json.dumps(event)}\n\n'
+
+
+class Subscription:
+    """Events for one listener, handed over to the event loop it runs on"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+
+    def deliver(self, event):
+        # Publishers run in request threads, never on the listener's loop
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            # The listener reconnects and catches up from the database
+            self.queue.get_nowait()
+            event = OVERFLOW
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """In-process pub/sub; only reaches listeners in the publishing process"""
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self):
+        while True:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return json.loads(message['data'])
+
+
+class RedisBroker:
+    """Redis pub/sub, for running several ASGI workers"""
+    shared = True
+
+    def __init__(self, url):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured('MESSAGING_BROKER_URL requires the redis package.')
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        self._async_redis = redis.asyncio
+
+    def publish(self, channel, event):
+        self._client.publish(channel, json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        client = self._async_redis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            yield RedisSubscription(pubsub)
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+            await client.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The broker configured by MESSAGING_BROKER_URL, created on first use"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = getattr(settings, 'MESSAGING_BROKER_URL', '')
+                _broker = RedisBroker(url) if url else LocalBroker()
+    return _broker
+
+
+def publish_message(message):
+    """Push a saved message to its conversation's listeners.
+
+    Failures are only logged: the message is stored, and listeners pick it
+    up from the database when they reconnect.
+    """
+    try:
+        get_broker().publish(channel_name(message.conversation_id), message_event(message))
+    except Exception:
+        logger.exception('Failed to publish message %s', message.pk)
@@ -0,0 +1,35 @@
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import ConversationParticipant, Message
+from .inbox import forget_participant, record_message, refresh_unread_total
+from .realtime import publish_message
+
+
+@receiver(post_save, sender=Message)
+def record_new_message(sender, instance, created=False, **kwargs):
+    """Keep the conversation's last message and unread counters current"""
+    if created:
+        record_message(instance)
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created=False, **kwargs):
+    """Send new messages to open conversation pages once they are committed"""
+    if created:
+        transaction.on_commit(partial(publish_message, instance))
+
+
+@receiver(post_delete, sender=ConversationParticipant)
+def drop_unread_messages(sender, instance, **kwargs):
+    """Take a deleted conversation's unread messages off its members' badges"""
+    forget_participant(instance)
+
+
+@receiver(user_logged_in)
+def warm_unread_total(sender, request, user, **kwargs):
+    """Count the unread badge at login rather than on the first page view"""
+    refresh_unread_total(user.id)
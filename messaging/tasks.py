@@ -0,0 +1,102 @@
+"""Welcome messages and auto-replies, written off the request path.
+
+Views only queue a ReplyTask row in the same transaction as the user's
+own message; ``manage.py run_message_worker`` turns queued tasks into
+messages. With settings.MESSAGING_TASKS_EAGER on, tasks run as soon as
+the request's transaction commits instead, which suits runserver.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .replies import auto_reply_template, template_params, welcome_template
+
+
+logger = logging.getLogger(__name__)
+
+# Failed tasks are retried this many times before they are dropped
+MAX_ATTEMPTS = 5
+
+# Seconds before the first retry, doubled after every further failure
+RETRY_DELAY = 30
+
+
+def queue_welcome(conversation, sender):
+    """Queue the welcome message ``sender`` opens a new conversation with"""
+    from .models import ReplyTask
+
+    _queue(ReplyTask(kind=ReplyTask.WELCOME, conversation=conversation, sender=sender))
+
+
+def queue_auto_reply(message, sender_id):
+    """Queue the auto-reply the user ``sender_id`` answers a message with"""
+    from .models import ReplyTask
+
+    _queue(ReplyTask(
+        kind=ReplyTask.AUTO_REPLY, conversation_id=message.conversation_id, sender_id=sender_id, message=message,
+    ))
+
+
+def _queue(task):
+    task.save()
+    if getattr(settings, 'MESSAGING_TASKS_EAGER', False):
+        transaction.on_commit(lambda: run_task(task.pk))
+
+
+def run_pending(limit=100):
+    """Run up to ``limit`` due tasks, oldest first, and return how many ran"""
+    from .models import ReplyTask
+
+    due = ReplyTask.objects.filter(run_after__lte=timezone.now()).values_list('pk', flat=True)[:limit]
+    return sum(run_task(pk) for pk in list(due))
+
+
+def run_task(pk):
+    """Send the message for one task and return whether it was sent.
+
+    The task row is deleted in the same transaction that creates the
+    message, so a task claimed by another worker is skipped and a failed
+    send leaves the task in place to be retried with backoff.
+    """
+    from .models import Message, ReplyTask
+
+    try:
+        with transaction.atomic():
+            task = ReplyTask.objects.select_related('sender', 'message').filter(pk=pk).first()
+            if task is None or ReplyTask.objects.filter(pk=pk).delete()[0] == 0:
+                return False
+            template = _reply_template(task)
+            Message.objects.create(
+                conversation_id=task.conversation_id, sender=task.sender, template=template,
+                content=template_params(template, task.sender.get_full_name()),
+            )
+    except Exception:
+        logger.exception('Reply task %s failed', pk)
+        _record_failure(pk)
+        return False
+    return True
+
+
+def _reply_template(task):
+    from .models import ReplyTask
+
+    if task.kind == ReplyTask.WELCOME:
+        return welcome_template()
+    return auto_reply_template(task.message.text)
+
+
+def _record_failure(pk):
+    from .models import ReplyTask
+
+    task = ReplyTask.objects.filter(pk=pk).first()
+    if task is None:
+        return
+    if task.attempts + 1 >= MAX_ATTEMPTS:
+        logger.error('Dropping reply task %s after %d attempts', pk, MAX_ATTEMPTS)
+        task.delete()
+        return
+    delay = timedelta(seconds=RETRY_DELAY * 2 ** task.attempts)
+    ReplyTask.objects.filter(pk=pk).update(attempts=task.attempts + 1, run_after=timezone.now() + delay)
@@ -0,0 +1,528 @@
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from skillbazar.query_budget import assert_max_queries
+from users.models import CustomUser
+from .inbox import mark_read, rebuild_inbox, refresh_unread_total, unread_total
+from . import replies, tasks
+from .models import Conversation, ConversationParticipant, Message, ReplyTask
+from .realtime import LocalBroker
+from .views import UNSHARED_BROKER_POLL_INTERVAL, _poll_interval
+
+
+# Session and user lookups made by every signed-in request
+REQUEST_QUERIES = 2
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class ConversationPageQueryTests(TestCase):
+    """Conversation pages run a fixed number of queries however much there is to show"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.conversations = []
+        for i in range(6):
+            other = CustomUser.objects.create_user(f'freelancer{i}', f'freelancer{i}@skillbazar.com', 'password')
+            conversation = Conversation.objects.create(**Conversation.pair_key(cls.user.id, other.id))
+            conversation.participants.add(cls.user, other)
+            for j in range(5):
+                Message.objects.create(conversation=conversation, sender=other if j % 2 else cls.user, content=f'Message {j}')
+            cls.conversations.append(conversation)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Cold caches, including the unread badge warmed at login, are the worst case
+        cache.clear()
+
+    def test_conversation_list(self):
+        with assert_max_queries(REQUEST_QUERIES + 3, 'conversation_list'):
+            response = self.client.get(reverse('messaging:conversation_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_conversation_detail(self):
+        url = reverse('messaging:conversation_detail', kwargs={'conversation_id': self.conversations[0].id})
+        with assert_max_queries(REQUEST_QUERIES + 5, 'conversation_detail'):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(QUERY_BUDGET_RAISE=True, MESSAGING_TASKS_EAGER=False)
+class ConversationPostQueryTests(TransactionTestCase):
+    """Posting a message, counted outside a test transaction so no savepoints are added"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        other = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        self.conversation = Conversation.objects.create(**Conversation.pair_key(self.user.id, other.id))
+        self.conversation.participants.add(self.user, other)
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def test_conversation_detail_post(self):
+        url = reverse('messaging:conversation_detail', kwargs={'conversation_id': self.conversation.id})
+        with assert_max_queries(REQUEST_QUERIES + 8, 'conversation_detail'):
+            response = self.client.post(url, {'content': 'Hello'})
+        self.assertEqual(response.status_code, 302)
+
+
+class InboxStateTests(TestCase):
+    """The denormalized inbox agrees with the messages it summarizes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.others = []
+        cls.conversations = []
+        for i in range(3):
+            other = CustomUser.objects.create_user(f'freelancer{i}', f'freelancer{i}@skillbazar.com', 'password')
+            conversation = Conversation.objects.create(**Conversation.pair_key(cls.user.id, other.id))
+            conversation.participants.add(cls.user, other)
+            cls.others.append(other)
+            cls.conversations.append(conversation)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def send(self, i, sender, content='Hello'):
+        return Message.objects.create(conversation=self.conversations[i], sender=sender, content=content)
+
+    def inbox_state(self):
+        conversations = Conversation.objects.order_by('id').values_list('id', 'last_message_id', 'last_activity_at')
+        participants = ConversationParticipant.objects.order_by('id').values_list(
+            'id', 'unread_count', 'last_activity_at',
+        )
+        return list(conversations), list(participants)
+
+    def test_messages_update_inbox_state(self):
+        self.send(0, self.others[0])
+        self.send(1, self.user)
+        self.send(2, self.others[2])
+        last = self.send(0, self.others[0], 'Anyone there?')
+        conversation = Conversation.objects.get(pk=self.conversations[0].pk)
+        self.assertEqual(conversation.last_message, last)
+        self.assertEqual(conversation.last_activity_at, last.created_at)
+        self.assertEqual(conversation.updated_at, last.created_at)
+        memberships = ConversationParticipant.objects.filter(conversation=conversation)
+        self.assertEqual(memberships.get(user=self.user).unread_count, 2)
+        self.assertEqual(memberships.get(user=self.others[0]).unread_count, 0)
+        self.assertEqual(ConversationParticipant.objects.get(conversation=self.conversations[1], user=self.others[1]).unread_count, 1)
+
+        state = self.inbox_state()
+        rebuild_inbox()
+        self.assertEqual(self.inbox_state(), state)
+
+    def test_rebuild_repairs_drifted_state(self):
+        for i in (0, 1, 2):
+            self.send(i, self.others[i])
+        self.send(1, self.user)
+        state = self.inbox_state()
+        Conversation.objects.update(last_message=None)
+        ConversationParticipant.objects.update(unread_count=7)
+        rebuild_inbox()
+        self.assertEqual(self.inbox_state(), state)
+
+    def test_inbox_is_ordered_by_last_activity(self):
+        for i in (2, 0, 1, 2):
+            self.send(i, self.others[i], f'Message for {i}')
+        response = self.client.get(reverse('messaging:conversation_list'))
+        data = response.context['conversation_data']
+        self.assertEqual([row['conversation'] for row in data], [self.conversations[i] for i in (2, 1, 0)])
+        self.assertEqual([row['other_user'] for row in data], [self.others[i] for i in (2, 1, 0)])
+        self.assertEqual([row['unread_count'] for row in data], [2, 1, 1])
+        self.assertEqual(data[0]['last_message'].content, 'Message for 2')
+
+    def test_inbox_pages_by_cursor(self):
+        for i in (0, 1, 2):
+            self.send(i, self.others[i])
+        with mock.patch('messaging.views.CONVERSATIONS_PER_PAGE', 2):
+            first = self.client.get(reverse('messaging:conversation_list')).context
+            second = self.client.get(
+                reverse('messaging:conversation_list'), {'cursor': first['page_obj'].next_cursor},
+            ).context
+        shown = [row['conversation'] for row in first['conversation_data'] + second['conversation_data']]
+        self.assertEqual(shown, [self.conversations[i] for i in (2, 1, 0)])
+        self.assertFalse(second['page_obj'].has_next())
+
+
+class ReadWatermarkTests(TestCase):
+    """Reading moves one watermark row, and unread counts are the messages past it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.other = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        cls.conversation = Conversation.objects.create(**Conversation.pair_key(cls.user.id, cls.other.id))
+        cls.conversation.participants.add(cls.user, cls.other)
+
+    def send(self, sender):
+        return Message.objects.create(conversation=self.conversation, sender=sender, content='Hello')
+
+    def membership(self, user):
+        return ConversationParticipant.objects.get(conversation=self.conversation, user=user)
+
+    def test_opening_moves_watermark_to_last_message(self):
+        self.send(self.other)
+        last = self.send(self.other)
+        self.client.force_login(self.user)
+        self.client.get(reverse('messaging:conversation_detail', kwargs={'conversation_id': self.conversation.id}))
+        membership = self.membership(self.user)
+        self.assertEqual((membership.last_read_message_id, membership.unread_count), (last.id, 0))
+        self.assertEqual(self.membership(self.other).last_read_message_id, 0)
+
+    def test_read_conversation_is_not_rewritten(self):
+        self.send(self.other)
+        mark_read(self.conversation.id, self.user)
+        with assert_max_queries(1, 'mark_read'), self.captureOnCommitCallbacks() as callbacks:
+            mark_read(self.conversation.id, self.user)
+        self.assertEqual(callbacks, [])
+
+    def test_messages_past_watermark_are_unread(self):
+        self.send(self.other)
+        mark_read(self.conversation.id, self.user)
+        self.send(self.other)
+        self.send(self.user)
+        self.send(self.other)
+        self.assertEqual(self.membership(self.user).unread_count, 2)
+        rebuild_inbox()
+        self.assertEqual(self.membership(self.user).unread_count, 2)
+
+
+class MigrationTestMixin:
+    """Runs a data migration against rows created with the models before it"""
+
+    app = 'messaging'
+
+    def migrate(self, name):
+        """Move this app to migration ``name``, the others to their latest, and return the models"""
+        executor = MigrationExecutor(connection)
+        targets = [(self.app, name)] + [node for node in executor.loader.graph.leaf_nodes() if node[0] != self.app]
+        executor.migrate(targets)
+        executor.loader.build_graph()
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+
+class BackfillReadWatermarkTests(MigrationTestMixin, TransactionTestCase):
+    """0010 turns per-message is_read flags into watermarks and counts"""
+
+    def test_backfill(self):
+        apps = self.migrate('0009_participant_read_watermark')
+        User = apps.get_model('users', 'CustomUser')
+        Conversation = apps.get_model('messaging', 'Conversation')
+        ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+        Message = apps.get_model('messaging', 'Message')
+        user = User.objects.create(username='buyer', email='buyer@skillbazar.com')
+        other = User.objects.create(username='freelancer', email='freelancer@skillbazar.com')
+        conversation = Conversation.objects.create()
+        ConversationParticipant.objects.create(conversation=conversation, user=user)
+        ConversationParticipant.objects.create(conversation=conversation, user=other)
+        read = [Message.objects.create(conversation=conversation, sender=other, content='Hi', is_read=True) for _ in range(2)]
+        Message.objects.create(conversation=conversation, sender=user, content='Hi', is_read=False)
+        Message.objects.create(conversation=conversation, sender=other, content='Hi', is_read=False)
+
+        apps = self.migrate('0010_backfill_read_watermark')
+        ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+        watermarks = dict(ConversationParticipant.objects.values_list('user_id', 'last_read_message_id'))
+        unread = dict(ConversationParticipant.objects.values_list('user_id', 'unread_count'))
+        self.assertEqual(watermarks, {user.id: read[-1].id, other.id: 0})
+        self.assertEqual(unread, {user.id: 1, other.id: 1})
+
+
+class ConversationPairTests(TestCase):
+    """A pair of users has one conversation, found by its pair key"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.other = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+
+    def start(self, user, other):
+        self.client.force_login(user)
+        return self.client.get(reverse('messaging:start_conversation', kwargs={'user_id': other.id}))
+
+    def test_pair_key_ignores_order(self):
+        self.assertEqual(
+            Conversation.pair_key(self.user.id, self.other.id), Conversation.pair_key(self.other.id, self.user.id),
+        )
+
+    def test_either_side_finds_the_same_conversation(self):
+        first = self.start(self.user, self.other)
+        second = self.start(self.other, self.user)
+        self.assertEqual(first.url, second.url)
+        conversation = Conversation.objects.get()
+        self.assertEqual(set(conversation.participants.all()), {self.user, self.other})
+        self.assertEqual(
+            (conversation.min_user, conversation.max_user), tuple(sorted((self.user, self.other), key=lambda u: u.id)),
+        )
+
+    def test_pair_is_unique(self):
+        Conversation.objects.create(**Conversation.pair_key(self.user.id, self.other.id))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Conversation.objects.create(**Conversation.pair_key(self.other.id, self.user.id))
+
+    def test_concurrent_start_uses_the_winner(self):
+        """A conversation committed between the lookup and the insert is redirected to"""
+        conversation = Conversation.objects.create(**Conversation.pair_key(self.other.id, self.user.id))
+        conversation.participants.add(self.user, self.other)
+        pending = [True]
+
+        def miss_lookup(execute, sql, params, many, context):
+            if pending and sql.startswith('SELECT "messaging_conversation"."id"'):
+                # The lookup ran before the other request committed
+                pending.pop()
+                params = (0, 0)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(miss_lookup):
+            response = self.start(self.user, self.other)
+        self.assertFalse(pending)
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertRedirects(
+            response, reverse('messaging:conversation_detail', kwargs={'conversation_id': conversation.id}),
+            fetch_redirect_response=False,
+        )
+
+
+class BackfillPairKeyTests(MigrationTestMixin, TransactionTestCase):
+    """0008 keys two-party conversations, leaving later duplicates unkeyed"""
+
+    def test_backfill(self):
+        apps = self.migrate('0007_conversation_pair_key')
+        User = apps.get_model('users', 'CustomUser')
+        Conversation = apps.get_model('messaging', 'Conversation')
+        ConversationParticipant = apps.get_model('messaging', 'ConversationParticipant')
+        users = [User.objects.create(username=f'user{i}', email=f'user{i}@skillbazar.com') for i in range(3)]
+        conversations = []
+        for members in ((1, 0), (0, 1), (0, 2), (0, 1, 2)):
+            conversation = Conversation.objects.create()
+            for i in members:
+                ConversationParticipant.objects.create(conversation=conversation, user=users[i])
+            conversations.append(conversation)
+
+        apps = self.migrate('0008_backfill_conversation_pair_key')
+        Conversation = apps.get_model('messaging', 'Conversation')
+        keys = dict(Conversation.objects.values_list('id', 'min_user_id'))
+        self.assertEqual([keys[c.id] for c in conversations], [users[0].id, None, users[0].id, None])
+        self.assertEqual(
+            Conversation.objects.get(pk=conversations[2].pk).max_user_id, users[2].id,
+        )
+
+
+class UnreadTotalTests(TestCase):
+    """Cached unread totals follow each commit, with no timeout to wait out"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.other = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        cls.conversation = Conversation.objects.create(**Conversation.pair_key(cls.user.id, cls.other.id))
+        cls.conversation.participants.add(cls.user, cls.other)
+
+    def setUp(self):
+        cache.clear()
+
+    def send(self, sender):
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(conversation=self.conversation, sender=sender, content='Hello')
+
+    def test_new_message_reaches_cached_total(self):
+        self.assertEqual(unread_total(self.user.id), 0)
+        self.send(self.other)
+        self.send(self.user)
+        self.assertEqual(unread_total(self.user.id), 1)
+        self.assertEqual(unread_total(self.other.id), 1)
+
+    def test_total_counted_before_the_callback_is_not_counted_twice(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Message.objects.create(conversation=self.conversation, sender=self.other, content='Hello')
+        # Another request counts the committed message before this one's callback runs
+        self.assertEqual(refresh_unread_total(self.user.id), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(unread_total(self.user.id), 1)
+
+    def test_reading_recounts_total(self):
+        self.send(self.other)
+        self.assertEqual(unread_total(self.user.id), 1)
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('messaging:conversation_detail', kwargs={'conversation_id': self.conversation.id}))
+        self.assertEqual(unread_total(self.user.id), 0)
+
+
+@override_settings(MESSAGING_TASKS_EAGER=False)
+class ReplyTaskTests(TestCase):
+    """Queued replies are sent once, and failures are retried with backoff until dropped"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.other = CustomUser.objects.create_user(
+            'freelancer', 'freelancer@skillbazar.com', 'password', first_name='Sita', last_name='Rai',
+        )
+        cls.conversation = Conversation.objects.create(**Conversation.pair_key(cls.user.id, cls.other.id))
+        cls.conversation.participants.add(cls.user, cls.other)
+
+    def queue_reply(self):
+        message = Message.objects.create(conversation=self.conversation, sender=self.user, content='What is your price?')
+        tasks.queue_auto_reply(message, self.other.id)
+        return ReplyTask.objects.get()
+
+    def replies(self):
+        return Message.objects.filter(sender=self.other)
+
+    def test_worker_sends_reply_once(self):
+        task = self.queue_reply()
+        self.assertFalse(self.replies().exists())
+        self.assertEqual(tasks.run_pending(), 1)
+        reply = self.replies().get()
+        self.assertTrue(reply.template.startswith('price.'))
+        self.assertFalse(ReplyTask.objects.exists())
+        self.assertFalse(tasks.run_task(task.pk))
+        self.assertEqual(self.replies().count(), 1)
+
+    def test_tasks_not_due_wait(self):
+        task = self.queue_reply()
+        ReplyTask.objects.filter(pk=task.pk).update(run_after=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(tasks.run_pending(), 0)
+
+    @override_settings(MESSAGING_TASKS_EAGER=True)
+    def test_eager_tasks_run_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue_reply()
+        self.assertEqual(self.replies().count(), 1)
+        self.assertFalse(ReplyTask.objects.exists())
+
+    def test_failures_back_off_then_drop(self):
+        task = self.queue_reply()
+        with mock.patch('messaging.tasks._reply_template', side_effect=RuntimeError('boom')), \
+                self.assertLogs('messaging.tasks', 'ERROR'):
+            for attempt in range(1, tasks.MAX_ATTEMPTS):
+                started = timezone.now()
+                self.assertFalse(tasks.run_task(task.pk))
+                task.refresh_from_db()
+                self.assertEqual(task.attempts, attempt)
+                delay = timedelta(seconds=tasks.RETRY_DELAY * 2 ** (attempt - 1))
+                self.assertTrue(started + delay <= task.run_after <= timezone.now() + delay)
+                self.assertEqual(tasks.run_pending(), 0)
+            self.assertFalse(tasks.run_task(task.pk))
+        self.assertFalse(ReplyTask.objects.exists())
+        self.assertFalse(self.replies().exists())
+
+
+class ReplyTemplateTests(SimpleTestCase):
+    """Canned replies are picked by keyword and stored as a template key"""
+
+    def test_keyword_priority(self):
+        for text, group in (
+            ('What is your deadline and price?', 'price'),
+            ('Any discounts on costs?', 'cost'),
+            ('Simply priceless', 'default'),
+            ('How   soon can you start', 'start'),
+            ('Can you help me out', 'question'),
+            ('Hello', 'default'),
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(replies.auto_reply_template(text).split('.')[0], group)
+
+    def test_templates_are_append_only(self):
+        frozen = import_module('messaging.migrations.0013_compact_templated_messages').TEMPLATES
+        self.assertEqual({key: replies.TEMPLATES[key] for key in frozen}, frozen)
+
+    def test_message_text_expands_template(self):
+        message = Message(template='welcome.0', content=replies.template_params('welcome.0', 'Sita'))
+        self.assertEqual(message.text, "Hi! I'm Sita. Thanks for your interest in my services. How can I help you today?")
+        self.assertEqual(replies.template_params('price.0', 'Sita'), '')
+        self.assertEqual(Message(template='price.0', content='').text, replies.TEMPLATES['price.0'])
+        self.assertEqual(Message(content='Hello').text, 'Hello')
+
+
+class CompactTemplatedMessagesTests(MigrationTestMixin, TransactionTestCase):
+    """0013 stores canned replies as keys and its reverse restores their text"""
+
+    def test_forwards_and_backwards(self):
+        apps = self.migrate('0012_message_template')
+        User = apps.get_model('users', 'CustomUser')
+        Conversation = apps.get_model('messaging', 'Conversation')
+        Message = apps.get_model('messaging', 'Message')
+        named = User.objects.create(username='sita', email='sita@skillbazar.com', first_name='Sita', last_name='Rai')
+        unnamed = User.objects.create(username='ram', email='ram@skillbazar.com')
+        conversation = Conversation.objects.create()
+        contents = [
+            (named, replies.TEMPLATES['welcome.1'].format(name='Sita Rai')),
+            (unnamed, replies.TEMPLATES['default.3'].format(name='ram')),
+            (named, replies.TEMPLATES['price.2']),
+            # Someone else's name in a template is the user's own text
+            (unnamed, replies.TEMPLATES['welcome.0'].format(name='Sita Rai')),
+            (named, 'See you tomorrow'),
+        ]
+        ids = [Message.objects.create(conversation=conversation, sender=sender, content=content).id for sender, content in contents]
+
+        apps = self.migrate('0013_compact_templated_messages')
+        Message = apps.get_model('messaging', 'Message')
+        stored = [Message.objects.values_list('template', 'content').get(pk=pk) for pk in ids]
+        self.assertEqual(stored, [
+            ('welcome.1', 'Sita Rai'), ('default.3', 'ram'), ('price.2', ''),
+            ('', contents[3][1]), ('', 'See you tomorrow'),
+        ])
+
+        apps = self.migrate('0012_message_template')
+        Message = apps.get_model('messaging', 'Message')
+        restored = [Message.objects.values_list('template', 'content').get(pk=pk) for pk in ids]
+        self.assertEqual(restored, [('', content) for _, content in contents])
+
+
+class PollIntervalTests(TestCase):
+    """Live pages only poll the database for replies their broker cannot see"""
+
+    def test_unshared_broker_with_worker_polls(self):
+        with self.settings(MESSAGING_TASKS_EAGER=False):
+            self.assertEqual(_poll_interval(LocalBroker()), UNSHARED_BROKER_POLL_INTERVAL)
+
+    def test_eager_tasks_do_not_poll(self):
+        with self.settings(MESSAGING_TASKS_EAGER=True):
+            self.assertIsNone(_poll_interval(LocalBroker()))
+
+    def test_shared_broker_does_not_poll(self):
+        broker = LocalBroker()
+        broker.shared = True
+        with self.settings(MESSAGING_TASKS_EAGER=False):
+            self.assertIsNone(_poll_interval(broker))
+
+
+class MessageAdminSearchTests(TestCase):
+    """Admin search finds templated messages by the text users see"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@skillbazar.com', 'password')
+        other = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password', first_name='Sita')
+        conversation = Conversation.objects.create(**Conversation.pair_key(cls.admin.id, other.id))
+        cls.plain = Message.objects.create(conversation=conversation, sender=cls.admin, content='What is your price?')
+        cls.templated = Message.objects.create(conversation=conversation, sender=other, template='price.0', content='')
+        cls.named = Message.objects.create(conversation=conversation, sender=other, template='welcome.0', content='Sita')
+
+    def search(self, term):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:messaging_message_changelist'), {'q': term})
+        return set(response.context['cl'].result_list)
+
+    def test_search_matches_template_text(self):
+        self.assertEqual(self.search('pricing'), {self.templated})
+        self.assertEqual(self.search('interest in my services'), {self.named})
+
+    def test_search_still_matches_stored_content(self):
+        self.assertEqual(self.search('your price'), {self.plain})
+        self.assertEqual(self.search('Sita'), {self.named})
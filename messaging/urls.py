@@ -6,6 +6,9 @@ app_name = 'messaging'
 urlpatterns = [
     path('conversations/', views.conversation_list, name='conversation_list'),
     path('conversation/<int:conversation_id>/', views.conversation_detail, name='conversation_detail'),
+    path('conversation/<int:conversation_id>/messages/', views.conversation_messages, name='conversation_messages'),
+    path('conversation/<int:conversation_id>/events/', views.conversation_events, name='conversation_events'),
+    path('conversation/<int:conversation_id>/updates/', views.conversation_updates, name='conversation_updates'),
     path('start-conversation/<int:user_id>/', views.start_conversation, name='start_conversation'),
     path('conversation/<int:conversation_id>/delete/', views.delete_conversation, name='delete_conversation'),
 ] 
\ No newline at end of file
@@ -1,69 +1,287 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from .models import Conversation, Message
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from gigs.pagination import KeysetPaginator
+from skillbazar.query_budget import PAGE_QUERIES, query_budget
+from .models import Conversation, ConversationParticipant, Message
+from .inbox import mark_read
+from .realtime import OVERFLOW, channel_name, format_event, get_broker, message_event
+from .tasks import queue_auto_reply, queue_welcome
 from users.models import CustomUser
-import random
 from django.views.decorators.http import require_POST
 
+CONVERSATIONS_PER_PAGE = 20
+
+# Inbox order, served by participant_inbox_idx
+INBOX_ORDERING = ('-last_activity_at', '-conversation_id')
+
+# Newest messages rendered with a conversation, and per older page
+MESSAGES_PER_PAGE = 50
+
+# Seconds between keepalive comments on an idle event stream
+EVENT_STREAM_KEEPALIVE = 15
+
+# Seconds before an event stream is closed; the browser reconnects and resumes
+EVENT_STREAM_LIFETIME = 300
+
+# Longest a delta request may be held open waiting for new messages
+LONG_POLL_MAX_WAIT = 30
+
+# Seconds between database checks while waiting on a broker that only sees
+# this process's messages, when replies come from run_message_worker
+UNSHARED_BROKER_POLL_INTERVAL = 2
+
 @login_required
+@query_budget(2 + PAGE_QUERIES)
 def conversation_list(request):
     """Show user's conversations"""
-    conversations = request.user.conversations.all()
-    # Get unread counts for each conversation
+    memberships = ConversationParticipant.objects.filter(
+        user=request.user
+    ).select_related('conversation__last_message')
+    paginator = KeysetPaginator(memberships, CONVERSATIONS_PER_PAGE, INBOX_ORDERING)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    # The other side of every conversation on the page, in one query
+    other_users = {
+        participant.conversation_id: participant.user
+        for participant in ConversationParticipant.objects.filter(
+            conversation_id__in=[membership.conversation_id for membership in page_obj]
+        ).exclude(user=request.user).select_related('user')
+    }
     conversation_data = []
-    for conversation in conversations:
-        other_user = conversation.participants.exclude(id=request.user.id).first()
+    for membership in page_obj:
+        other_user = other_users.get(membership.conversation_id)
         if other_user:
-            unread_count = conversation.messages.filter(
-                sender=other_user,
-                is_read=False
-            ).count()
             conversation_data.append({
-                'conversation': conversation,
+                'conversation': membership.conversation,
                 'other_user': other_user,
-                'unread_count': unread_count,
-                'last_message': conversation.messages.last()
+                'unread_count': membership.unread_count,
+                'last_message': membership.conversation.last_message,
             })
     context = {
         'conversation_data': conversation_data,
+        'page_obj': page_obj,
     }
     return render(request, 'messaging/conversation_list.html', context)
 
 @login_required
+@query_budget(8)  # a post also queues the auto-reply
 def conversation_detail(request, conversation_id):
     """Show conversation messages"""
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
     if request.method == 'POST':
         content = request.POST.get('content', '').strip()
         if content:
-            # Create the message
-            message = Message.objects.create(
-                conversation=conversation,
-                sender=request.user,
-                content=content
-            )
-            # Auto-reply from the other participant (gig owner)
-            other_user = conversation.participants.exclude(id=request.user.id).first()
-            if other_user:
-                auto_reply = generate_auto_reply(content, other_user)
-                Message.objects.create(
+            with transaction.atomic():
+                # Create the message
+                message = Message.objects.create(
                     conversation=conversation,
-                    sender=other_user,
-                    content=auto_reply
+                    sender=request.user,
+                    content=content
                 )
+                # Auto-reply from the other participant (gig owner), sent by the message worker
+                other_user_id = conversation.memberships.exclude(user=request.user).values_list('user_id', flat=True).first()
+                if other_user_id:
+                    queue_auto_reply(message, other_user_id)
+            if _wants_json(request):
+                return JsonResponse(message_event(message), status=201)
             return redirect('messaging:conversation_detail', conversation_id=conversation_id)
+        if _wants_json(request):
+            return JsonResponse({'error': 'Message cannot be empty.'}, status=400)
     # Mark messages as read
-    conversation.messages.filter(
-        sender__in=conversation.participants.exclude(id=request.user.id)
-    ).update(is_read=True)
+    mark_read(conversation.id, request.user)
+    chat_messages, has_older = _message_window(conversation.messages.all())
     context = {
         'conversation': conversation,
-        'messages': conversation.messages.all(),
+        # Not 'messages', which base.html renders as flash messages
+        'chat_messages': chat_messages,
+        'has_older': has_older,
         'other_user': conversation.participants.exclude(id=request.user.id).first(),
     }
     return render(request, 'messaging/conversation_detail.html', context)
 
+@login_required
+@query_budget(3)
+def conversation_messages(request, conversation_id):
+    """JSON page of the messages before ``before_id``, oldest first"""
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    messages = conversation.messages.all()
+    before_id = request.GET.get('before_id')
+    if before_id:
+        try:
+            before = messages.values_list('created_at', 'id').get(id=int(before_id))
+        except (ValueError, Message.DoesNotExist):
+            return JsonResponse({'error': 'Unknown before_id.'}, status=400)
+        # A range on created_at (rather than an OR) lets the index seek to the anchor
+        messages = messages.filter(created_at__lte=before[0]).exclude(created_at=before[0], id__gte=before[1])
+    messages, has_older = _message_window(messages)
+    return JsonResponse({
+        'messages': [message_event(message) for message in messages],
+        'has_older': has_older,
+    })
+
+def _message_window(messages):
+    """The newest MESSAGES_PER_PAGE messages, oldest first, and whether more precede them"""
+    newest = list(messages.order_by('-created_at', '-id')[:MESSAGES_PER_PAGE + 1])
+    return newest[:MESSAGES_PER_PAGE][::-1], len(newest) > MESSAGES_PER_PAGE
+
+def _wants_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
+def _request_user(request):
+    user = request.user
+    user.is_authenticated  # resolve the lazy user outside the event loop
+    return user
+
+async def conversation_events(request, conversation_id):
+    """Server-Sent Events stream of new messages in a conversation.
+
+    Needs the ASGI application (skillbazar.asgi); under WSGI it answers
+    204 so browsers stop reconnecting and the page posts and reloads as
+    before. Messages after the Last-Event-ID header, or the last_id
+    parameter on first connect, are replayed from the database before live
+    events, so reconnecting never loses a message.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await sync_to_async(_request_user)(request)
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    if not await Conversation.objects.filter(id=conversation_id, participants=user).aexists():
+        raise Http404('No conversation matches the given query.')
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    response = StreamingHttpResponse(
+        _message_stream(conversation_id, user, last_id), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _poll_interval(broker):
+    """Seconds between database checks for messages the broker cannot see, or None.
+
+    Only replies sent by a separate run_message_worker process miss an
+    unshared broker; eager tasks are sent from the request's own process.
+    """
+    if broker.shared or getattr(settings, 'MESSAGING_TASKS_EAGER', False):
+        return None
+    return UNSHARED_BROKER_POLL_INTERVAL
+
+async def _message_stream(conversation_id, user, last_id):
+    loop = asyncio.get_running_loop()
+    closes_at = loop.time() + EVENT_STREAM_LIFETIME
+    broker = get_broker()
+    poll_interval = _poll_interval(broker)
+    yield 'retry: 2000\n\n'
+    async with broker.subscribe(channel_name(conversation_id)) as subscription:
+        # Subscribed first, so nothing slips between the replay and live events
+        if last_id is None and poll_interval:
+            # Polling needs a starting point even on first connect
+            newest = await Message.objects.filter(conversation_id=conversation_id).aaggregate(id=Max('id'))
+            last_id = newest['id'] or 0
+        if last_id is not None:
+            async for message in Message.objects.filter(conversation_id=conversation_id, id__gt=last_id).order_by('id'):
+                last_id = message.id
+                yield format_event(message_event(message))
+        sent_at = loop.time()
+        while True:
+            now = loop.time()
+            remaining = closes_at - now
+            if remaining <= 0:
+                return
+            timeout = min(sent_at + EVENT_STREAM_KEEPALIVE - now, remaining, poll_interval or remaining)
+            try:
+                events = [await asyncio.wait_for(subscription.get(), max(timeout, 0))]
+            except asyncio.TimeoutError:
+                events = []
+                if poll_interval:
+                    events = [message_event(message) for message in await _messages_since(conversation_id, last_id)]
+                if not events and loop.time() >= sent_at + EVENT_STREAM_KEEPALIVE:
+                    sent_at = loop.time()
+                    yield ': keepalive\n\n'
+            for event in events:
+                if event is OVERFLOW:
+                    # Too far behind; the browser reconnects and replays from last_id
+                    return
+                if last_id is not None and event['id'] <= last_id:
+                    continue
+                last_id = event['id']
+                sent_at = loop.time()
+                yield format_event(event)
+                if event['sender_id'] != user.id:
+                    # Delivered to an open conversation page, so it has been read
+                    await sync_to_async(mark_read)(conversation_id, user)
+
+async def conversation_updates(request, conversation_id):
+    """JSON list of the messages after ``since_id``, oldest first.
+
+    Returns at most MESSAGES_PER_PAGE messages; ``has_more`` asks the client
+    to fetch again from ``last_id``. With ``wait`` (seconds, capped at
+    LONG_POLL_MAX_WAIT) an empty answer is held back until a message
+    arrives or the wait runs out. Waiting needs the ASGI application;
+    under WSGI the request answers at once.
+    """
+    user = await sync_to_async(_request_user)(request)
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    if not await Conversation.objects.filter(id=conversation_id, participants=user).aexists():
+        raise Http404('No conversation matches the given query.')
+    try:
+        since_id = int(request.GET.get('since_id', 0))
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return JsonResponse({'error': 'since_id and wait must be numbers.'}, status=400)
+    wait = min(max(wait, 0), LONG_POLL_MAX_WAIT) if isinstance(request, ASGIRequest) else 0
+
+    messages = await _messages_since(conversation_id, since_id)
+    if not messages and wait:
+        broker = get_broker()
+        async with broker.subscribe(channel_name(conversation_id)) as subscription:
+            # Subscribed first, so a message sent in between is not missed
+            messages = await _messages_since(conversation_id, since_id)
+            if not messages:
+                messages = await _wait_for_messages(subscription, conversation_id, since_id, wait, _poll_interval(broker))
+    has_more = len(messages) > MESSAGES_PER_PAGE
+    messages = messages[:MESSAGES_PER_PAGE]
+    if any(message.sender_id != user.id for message in messages):
+        await sync_to_async(mark_read)(conversation_id, user)
+    return JsonResponse({
+        'messages': [message_event(message) for message in messages],
+        'last_id': messages[-1].id if messages else since_id,
+        'has_more': has_more,
+    })
+
+async def _messages_since(conversation_id, since_id):
+    """Up to MESSAGES_PER_PAGE + 1 messages after since_id, oldest first"""
+    messages = Message.objects.filter(conversation_id=conversation_id, id__gt=since_id).order_by('id')
+    return [message async for message in messages[:MESSAGES_PER_PAGE + 1]]
+
+async def _wait_for_messages(subscription, conversation_id, since_id, wait, poll_interval):
+    """Messages after since_id once one is published, or found every poll_interval seconds"""
+    loop = asyncio.get_running_loop()
+    gives_up_at = loop.time() + wait
+    while True:
+        remaining = gives_up_at - loop.time()
+        if remaining <= 0:
+            return []
+        try:
+            await asyncio.wait_for(subscription.get(), min(remaining, poll_interval or remaining))
+        except asyncio.TimeoutError:
+            if not poll_interval:
+                return []
+        messages = await _messages_since(conversation_id, since_id)
+        if messages:
+            return messages
+
 @login_required
 def start_conversation(request, user_id):
     """Start a new conversation with a user"""
@@ -71,23 +289,20 @@ def start_conversation(request, user_id):
     if other_user == request.user:
         return redirect('gigs:home')
     # Check if conversation already exists
-    existing_conversation = Conversation.objects.filter(
-        participants=request.user
-    ).filter(
-        participants=other_user
-    ).first()
-    if existing_conversation:
-        return redirect('messaging:conversation_detail', conversation_id=existing_conversation.id)
-    # Create new conversation
-    conversation = Conversation.objects.create()
-    conversation.participants.add(request.user, other_user)
-    # Create initial welcome message from the gig owner
-    welcome_message = generate_welcome_message(other_user)
-    Message.objects.create(
-        conversation=conversation,
-        sender=other_user,
-        content=welcome_message
-    )
+    pair = Conversation.pair_key(request.user.id, other_user.id)
+    existing_id = Conversation.objects.filter(**pair).values_list('id', flat=True).first()
+    if existing_id:
+        return redirect('messaging:conversation_detail', conversation_id=existing_id)
+    try:
+        with transaction.atomic():
+            # Create new conversation
+            conversation = Conversation.objects.create(**pair)
+            conversation.participants.add(request.user, other_user)
+            # Initial welcome message from the gig owner, sent by the message worker
+            queue_welcome(conversation, other_user)
+    except IntegrityError:
+        # A concurrent request created the conversation first
+        conversation = Conversation.objects.get(**pair)
     return redirect('messaging:conversation_detail', conversation_id=conversation.id)
 
 @require_POST
@@ -96,126 +311,3 @@ def delete_conversation(request, conversation_id):
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
     conversation.delete()
     return redirect('messaging:conversation_list')
-
-def generate_welcome_message(freelancer):
-    """Generate a welcome message from the freelancer"""
-    welcome_messages = [
-        f"Hi! I'm {freelancer.get_full_name()}. Thanks for your interest in my services. How can I help you today?",
-        f"Hello! I'm {freelancer.get_full_name()}. I'm excited to work with you. What project do you have in mind?",
-        f"Welcome! I'm {freelancer.get_full_name()}. I'd love to discuss your project requirements. What are you looking for?",
-        f"Hi there! I'm {freelancer.get_full_name()}. Ready to bring your ideas to life. What can I do for you?",
-        f"Hello! I'm {freelancer.get_full_name()}. Let's discuss how I can help with your project. What do you need?"
-    ]
-    return random.choice(welcome_messages)
-
-def generate_auto_reply(user_message, freelancer):
-    """Generate an auto-reply based on the user's message content"""
-    user_message_lower = user_message.lower()
-    responses = {
-        'price': [
-            f"Thanks for asking about pricing! I offer competitive rates and can provide a detailed quote based on your specific requirements. What's your budget range?",
-            f"I'd be happy to discuss pricing options with you. My rates are flexible and depend on the project scope. Could you share more details about your project?",
-            f"Pricing varies based on project complexity and timeline. I can provide a custom quote once I understand your needs better. What's your timeline?",
-            f"I offer transparent pricing with no hidden fees. Let me know your project details and I'll provide a fair quote. What's your budget?"
-        ],
-        'cost': [
-            f"I offer competitive pricing that fits various budgets. Could you tell me more about your project so I can give you an accurate quote?",
-            f"My rates are reasonable and I'm happy to work within your budget. What's the scope of your project?",
-            f"I provide value for money with quality work. Let's discuss your requirements and I'll give you a fair price."
-        ],
-        'time': [
-            f"Great question about timing! I typically deliver projects within the agreed timeframe. What's your deadline for this project?",
-            f"I'm committed to meeting deadlines and keeping you updated throughout the process. When do you need this completed?",
-            f"Timeline depends on project scope, but I always communicate clearly about delivery dates. What's your preferred timeline?",
-            f"I work efficiently to meet your deadlines. How soon do you need this project completed?"
-        ],
-        'deadline': [
-            f"I understand deadlines are important. I'll work efficiently to meet your timeline. When do you need this completed?",
-            f"I'm committed to delivering on time. Let me know your deadline and I'll ensure we meet it.",
-            f"Timely delivery is a priority for me. What's your target completion date?"
-        ],
-        'experience': [
-            f"I have extensive experience in this field and have completed many successful projects. I'd be happy to share my portfolio with you.",
-            f"With years of experience, I bring expertise and reliability to every project. Would you like to see some of my previous work?",
-            f"I'm confident in my skills and experience. I can provide references and examples of my work if you'd like.",
-            f"I've worked on various projects and have a proven track record. Would you like to see some examples of my work?"
-        ],
-        'portfolio': [
-            f"I'd be happy to share my portfolio with you! I have examples of my best work that showcase my skills and style.",
-            f"Absolutely! I can show you my portfolio with various projects I've completed. What type of work interests you most?",
-            f"I have a comprehensive portfolio demonstrating my expertise. Would you like me to share specific examples relevant to your project?",
-            f"My portfolio showcases my best work and demonstrates my capabilities. I'd love to share it with you!"
-        ],
-        'work': [
-            f"I'd be happy to show you examples of my work. I have a portfolio that demonstrates my skills and style.",
-            f"I can share my previous projects with you. What type of work are you most interested in seeing?",
-            f"I have a collection of my best work that I can share. Would you like to see specific examples?"
-        ],
-        'start': [
-            f"I'm ready to start working on your project! Let's discuss the details and get everything set up.",
-            f"Perfect! I'm excited to begin. Let me know what specific requirements you have and I'll get started right away.",
-            f"Great! I'm available to start immediately. What are the next steps you'd like to take?",
-            f"I'm ready to get started on your project. Let's finalize the details and begin!"
-        ],
-        'begin': [
-            f"I'm ready to begin working on your project. Let's discuss the requirements and get started.",
-            f"Perfect! I'm excited to start. What specific details should we discuss first?",
-            f"Great! Let's get started. What are the key requirements for your project?"
-        ],
-        'payment': [
-            f"I accept various payment methods and can discuss payment terms that work for both of us. What's your preferred payment method?",
-            f"Payment can be arranged through SkillBazar's secure system. I'm flexible with payment schedules. What works best for you?",
-            f"I offer secure payment options and can work with your preferred payment method. Let's discuss the payment terms.",
-            f"I'm flexible with payment arrangements. We can discuss terms that work for both of us."
-        ],
-        'pay': [
-            f"I accept multiple payment methods for your convenience. What payment option works best for you?",
-            f"Payment can be arranged securely through SkillBazar. I'm flexible with payment schedules.",
-            f"I offer various payment options to make it easy for you. Let's discuss what works best."
-        ],
-        'quality': [
-            f"I'm committed to delivering high-quality work that exceeds expectations. Quality is my top priority.",
-            f"I take pride in my work and always strive for excellence. You can expect top-notch results.",
-            f"Quality is non-negotiable for me. I ensure every project meets the highest standards."
-        ],
-        'revision': [
-            f"I offer revisions to ensure you're completely satisfied with the final result. Your satisfaction is important to me.",
-            f"I'm happy to make revisions until you're 100% satisfied. I want you to love the final product.",
-            f"I provide revision rounds to make sure the work meets your exact requirements."
-        ],
-        'urgent': [
-            f"I understand this is urgent. I'll prioritize your project and work efficiently to meet your timeline.",
-            f"I can accommodate urgent projects. Let me know your deadline and I'll ensure timely delivery.",
-            f"I'm available for urgent work and will work quickly to meet your needs."
-        ],
-        'quick': [
-            f"I can work quickly to meet your timeline. Let me know your deadline and I'll ensure fast delivery.",
-            f"I'm efficient and can complete projects quickly while maintaining quality. What's your timeline?",
-            f"I can work fast to meet your needs. How soon do you need this completed?"
-        ]
-    }
-    # Check for keywords in the user's message
-    for keyword, reply_list in responses.items():
-        if keyword in user_message_lower:
-            return random.choice(reply_list)
-    # Check for question words to provide more helpful responses
-    question_words = ['what', 'how', 'when', 'where', 'why', 'can you', 'do you', 'will you']
-    if any(word in user_message_lower for word in question_words):
-        question_responses = [
-            f"Great question! I'm {freelancer.get_full_name()} and I'd be happy to help. Could you provide more details about your project?",
-            f"Thanks for asking! I'm {freelancer.get_full_name()}. Let me know more about your requirements so I can give you a detailed answer.",
-            f"Good question! I'm {freelancer.get_full_name()}. I'd love to discuss your project in detail to provide the best answer."
-        ]
-        return random.choice(question_responses)
-    # Default responses for general messages
-    default_responses = [
-        f"Thanks for your message! I'm {freelancer.get_full_name()} and I'm here to help with your project. Could you tell me more about what you need?",
-        f"Hi! I appreciate your interest. I'm {freelancer.get_full_name()} and I'd love to discuss your project requirements in detail.",
-        f"Hello! I'm {freelancer.get_full_name()}. I'm excited to work with you. What specific aspects of your project would you like to discuss?",
-        f"Thanks for reaching out! I'm {freelancer.get_full_name()}. I'm ready to help bring your project to life. What are your main requirements?",
-        f"Hi there! I'm {freelancer.get_full_name()}. I'm committed to delivering quality work. What can I help you with today?",
-        f"Hello! I'm {freelancer.get_full_name()}. I'm here to help you with your project. What would you like to discuss?",
-        f"Hi! I'm {freelancer.get_full_name()}. I'm excited to work with you. What project do you have in mind?",
-        f"Thanks for contacting me! I'm {freelancer.get_full_name()}. I'd love to hear more about your project requirements."
-    ]
-    return random.choice(default_responses) 
\ No newline at end of file
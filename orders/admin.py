@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Review
+from .models import PaymentTransaction, Review
 
 
 @admin.register(Review)
@@ -8,4 +8,14 @@ class ReviewAdmin(admin.ModelAdmin):
     list_filter = ['rating', 'created_at']
     search_fields = ['gig__title', 'reviewer__username', 'freelancer__username', 'comment']
     readonly_fields = ['created_at', 'updated_at']
-    ordering = ['-created_at'] 
\ No newline at end of file
+    ordering = ['-created_at']
+
+
+@admin.register(PaymentTransaction)
+class PaymentTransactionAdmin(admin.ModelAdmin):
+    list_display = ['reference', 'gateway', 'order', 'amount', 'status', 'created_at', 'settled_at']
+    list_filter = ['gateway', 'status', 'created_at']
+    search_fields = ['reference', 'gateway_transaction_id']
+    raw_id_fields = ['order']
+    readonly_fields = ['created_at', 'updated_at', 'settled_at']
+    ordering = ['-created_at']
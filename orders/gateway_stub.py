@@ -0,0 +1,221 @@
+"""A local stand-in for the Khalti and eSewa payment gateways.
+
+Serves the calls orders.gateways makes (Khalti initiate and lookup, eSewa
+transrec) and the pages the browser is sent to (Khalti's payment page,
+eSewa's form target), which approve the payment and redirect back like
+the real gateways. Point PAYMENT_GATEWAYS at it to develop and test
+payments offline; ``delay`` and ``error_rate`` simulate a slow or failing
+gateway. Payments are kept in memory.
+"""
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from django.utils import timezone
+
+
+# Smallest Khalti payment, in paisa
+KHALTI_MIN_AMOUNT = 1000
+
+# Seconds a Khalti payment link stays valid
+KHALTI_LINK_LIFETIME = 1800
+
+
+class StubGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0, error_rate=0):
+        super().__init__(address, StubGatewayHandler)
+        self.delay = delay
+        self.error_rate = error_rate
+        self.khalti_payments = {}
+        self.esewa_payments = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def gateway_settings(self):
+        """PAYMENT_GATEWAYS pointing at this server"""
+        return {
+            'khalti': {
+                'public_key': 'test_public_key_stub',
+                'secret_key': 'test_secret_key_stub',
+                'base_url': f'{self.url}/api/v2/',
+            },
+            'esewa': {
+                'merchant_id': 'EPAYTEST',
+                'payment_url': f'{self.url}/epay/main',
+                'verify_url': f'{self.url}/epay/transrec',
+            },
+        }
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up waiting on a delayed answer have hung up
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self):
+        """Serve from a daemon thread, for tests; stop with shutdown()"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._dispatch({
+            '/pay/': self.khalti_pay,
+            '/epay/transrec': self.esewa_verify,
+        })
+
+    def do_POST(self):
+        self._dispatch({
+            '/api/v2/epayment/initiate/': self.khalti_initiate,
+            '/api/v2/epayment/lookup/': self.khalti_lookup,
+            '/epay/main': self.esewa_pay,
+            '/epay/transrec': self.esewa_verify,
+        })
+
+    def _dispatch(self, routes):
+        url = urlsplit(self.path)
+        self.query = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if random.random() < self.server.error_rate:
+            return self._send(503, b'Service unavailable', 'text/plain')
+        route = routes.get(url.path)
+        if route is None:
+            return self._send_json(404, {'detail': 'Not found.'})
+        route()
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode(), 'application/json')
+
+    def _redirect(self, url, params):
+        separator = '&' if '?' in url else '?'
+        self._send(302, b'', 'text/plain', {'Location': f'{url}{separator}{urlencode(params)}'})
+
+    def _json_body(self):
+        try:
+            return json.loads(self.body or b'{}')
+        except ValueError:
+            return {}
+
+    def _form_body(self):
+        return {**self.query, **dict(parse_qsl(self.body.decode()))}
+
+    def khalti_initiate(self):
+        if not self.headers.get('Authorization', '').startswith('Key '):
+            return self._send_json(401, {'detail': 'Authentication credentials were not provided.'})
+        data = self._json_body()
+        required = ('return_url', 'website_url', 'amount', 'purchase_order_id', 'purchase_order_name')
+        missing = [field for field in required if not data.get(field)]
+        if missing:
+            return self._send_json(400, {field: ['This field is required.'] for field in missing})
+        if not isinstance(data['amount'], int) or data['amount'] < KHALTI_MIN_AMOUNT:
+            return self._send_json(400, {'amount': [f'Amount should be greater than Rs. {KHALTI_MIN_AMOUNT // 100}']})
+        pidx = uuid.uuid4().hex[:22]
+        with self.server.lock:
+            self.server.khalti_payments[pidx] = {**data, 'status': 'Initiated', 'transaction_id': None}
+        expires_at = timezone.now() + timedelta(seconds=KHALTI_LINK_LIFETIME)
+        self._send_json(200, {
+            'pidx': pidx,
+            'payment_url': f'{self.server.url}/pay/?pidx={pidx}',
+            'expires_at': expires_at.isoformat(),
+            'expires_in': KHALTI_LINK_LIFETIME,
+        })
+
+    def khalti_lookup(self):
+        pidx = self._json_body().get('pidx')
+        with self.server.lock:
+            payment = dict(self.server.khalti_payments.get(pidx) or {})
+        if not payment:
+            return self._send_json(404, {'detail': 'Not found.', 'error_key': 'validation_error'})
+        self._send_json(200, {
+            'pidx': pidx,
+            'total_amount': payment['amount'],
+            'status': payment['status'],
+            'transaction_id': payment['transaction_id'],
+            'fee': 0,
+            'refunded': False,
+        })
+
+    def khalti_pay(self):
+        """The payment page: settles the payment (?status=, Completed by default) and returns"""
+        pidx = self.query.get('pidx')
+        status = self.query.get('status', 'Completed')
+        with self.server.lock:
+            payment = self.server.khalti_payments.get(pidx)
+            if payment is not None:
+                payment['status'] = status
+                if status == 'Completed':
+                    payment['transaction_id'] = uuid.uuid4().hex[:22]
+                payment = dict(payment)
+        if payment is None:
+            return self._send(404, b'Unknown payment', 'text/plain')
+        self._redirect(payment['return_url'], {
+            'pidx': pidx,
+            'status': status,
+            'transaction_id': payment['transaction_id'] or '',
+            'tidx': payment['transaction_id'] or '',
+            'amount': payment['amount'],
+            'total_amount': payment['amount'],
+            'mobile': '98XXXXX904',
+            'purchase_order_id': payment['purchase_order_id'],
+            'purchase_order_name': payment['purchase_order_name'],
+        })
+
+    def esewa_pay(self):
+        """The form target: approves the payment and returns to su (or fu with ?fail=1)"""
+        data = self._form_body()
+        if self.query.get('fail'):
+            return self._redirect(data.get('fu', '/'), {'pid': data.get('pid', '')})
+        ref_id = uuid.uuid4().hex[:10].upper()
+        with self.server.lock:
+            self.server.esewa_payments[data.get('pid')] = {'amt': data.get('tAmt'), 'scd': data.get('scd'), 'rid': ref_id}
+        self._redirect(data.get('su', '/'), {'oid': data.get('pid', ''), 'amt': data.get('tAmt', ''), 'refId': ref_id})
+
+    def esewa_verify(self):
+        data = self._form_body()
+        with self.server.lock:
+            payment = self.server.esewa_payments.get(data.get('pid'))
+        verified = (
+            payment is not None
+            and payment['rid'] == data.get('rid')
+            and payment['scd'] == data.get('scd')
+            and _same_amount(payment['amt'], data.get('amt'))
+        )
+        code = 'Success' if verified else 'failure'
+        self._send(200, f'<response>\n<response_code>\n{code}\n</response_code>\n</response>\n'.encode(), 'text/xml')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _same_amount(a, b):
+    try:
+        return abs(float(a) - float(b)) < 0.005
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,282 @@
+"""Clients for the Khalti and eSewa payment gateways.
+
+Each gateway keeps one requests session, so its connection pool is reused
+across requests, and every call is bounded by connect and read timeouts.
+Failed calls are retried a few times with exponential backoff, and a
+circuit breaker stops calling a gateway that keeps failing, so requests
+fail fast instead of tying up worker threads. Credentials and endpoints
+come from the PAYMENT_GATEWAYS setting; `manage.py run_payment_stub`
+serves a local stand-in for both gateways.
+"""
+import asyncio
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+# Seconds to open a connection, and to wait for each read of the answer
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+
+# Retries after a failed call, RETRY_BACKOFF * 2**n seconds (with jitter) apart
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.25
+
+# Connections kept open to each gateway, and threads running async calls
+POOL_SIZE = 10
+
+# Failed calls in a row that open the circuit, and seconds before a trial call
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+
+class GatewayError(Exception):
+    """A gateway refused a call or answered with something unusable"""
+
+    def __init__(self, message, status=None, data=None):
+        super().__init__(message)
+        self.status = status
+        self.data = data
+
+
+class GatewayUnavailable(GatewayError):
+    """A gateway could not be reached in time, or its circuit is open"""
+
+
+class CircuitBreaker:
+    """Fails calls fast once a gateway has failed too often in a row.
+
+    After ``threshold`` consecutive failures the circuit opens and calls
+    are refused. Every ``reset_timeout`` seconds one trial call is let
+    through; a success closes the circuit again, a failure keeps it open.
+    """
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            # Let this one call through, and hold the rest back another period
+            self._opened_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+def _never_sent(exc):
+    """Whether a failed call certainly never reached the gateway"""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class GatewayClient:
+    """Pooled HTTP transport for the calls to one gateway"""
+
+    def __init__(self, name, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=MAX_RETRIES,
+                 backoff=RETRY_BACKOFF, pool_size=POOL_SIZE, breaker=None):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def request(self, method, url, retry_reads=False, **kwargs):
+        """Send a call and return the response, retrying failures that are safe to repeat.
+
+        A call that never reached the gateway is always retried. One that
+        may have been processed (a read timeout or a 5xx answer) is only
+        retried with ``retry_reads``, for lookups. 4xx answers are
+        returned; they mean the gateway is up.
+        """
+        if not self.breaker.allow():
+            raise GatewayUnavailable(f'{self.name} is unavailable, not calling it for now')
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as exc:
+                if attempt >= self.retries or not (retry_reads or _never_sent(exc)):
+                    self.breaker.record_failure()
+                    raise GatewayUnavailable(f'{self.name} call failed: {exc}') from exc
+            else:
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                if attempt >= self.retries or not retry_reads:
+                    self.breaker.record_failure()
+                    raise GatewayUnavailable(
+                        f'{self.name} answered {response.status_code}', status=response.status_code
+                    )
+            delay = self.backoff * 2 ** attempt
+            time.sleep(random.uniform(delay / 2, delay))
+            attempt += 1
+
+    async def run_async(self, func, *args, **kwargs):
+        """Await a blocking gateway call on this client's thread pool"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix=f'{self.name}-gateway')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+
+def _json(response, name):
+    """The JSON body of a gateway answer, raising GatewayError for refusals"""
+    try:
+        data = response.json()
+    except ValueError:
+        raise GatewayError(f'{name} answered {response.status_code} without JSON', status=response.status_code)
+    if response.status_code >= 400:
+        detail = data.get('detail', data) if isinstance(data, dict) else data
+        raise GatewayError(f'{name} refused the call: {detail}', status=response.status_code, data=data)
+    return data
+
+
+class KhaltiGateway:
+    """Khalti ePayment: initiate a payment, then look up its status by pidx"""
+    name = 'khalti'
+
+    def __init__(self, config, client=None):
+        self.public_key = config['public_key']
+        self.secret_key = config['secret_key']
+        self.base_url = config['base_url']
+        self.client = client or GatewayClient(self.name)
+        self.client.session.headers['Authorization'] = f'Key {self.secret_key}'
+
+    def initiate(self, amount, purchase_order_id, purchase_order_name, return_url, website_url,
+                 customer_info=None):
+        """Start a payment of ``amount`` paisa; returns its pidx, payment_url and expiry"""
+        payload = {
+            'amount': amount,
+            'purchase_order_id': purchase_order_id,
+            'purchase_order_name': purchase_order_name,
+            'return_url': return_url,
+            'website_url': website_url,
+        }
+        if customer_info:
+            payload['customer_info'] = customer_info
+        # Not retried once sent: a repeated initiate would start a second payment
+        response = self.client.request('POST', urljoin(self.base_url, 'epayment/initiate/'), json=payload)
+        return _json(response, self.name)
+
+    def lookup(self, pidx):
+        """A payment's status ('Completed', 'Pending', 'Expired', ...) and amounts"""
+        response = self.client.request(
+            'POST', urljoin(self.base_url, 'epayment/lookup/'), json={'pidx': pidx}, retry_reads=True
+        )
+        return _json(response, self.name)
+
+    async def ainitiate(self, *args, **kwargs):
+        return await self.client.run_async(self.initiate, *args, **kwargs)
+
+    async def alookup(self, pidx):
+        return await self.client.run_async(self.lookup, pidx)
+
+
+class EsewaGateway:
+    """eSewa ePay: the browser posts a form to eSewa, the server verifies the result"""
+    name = 'esewa'
+
+    def __init__(self, config, client=None):
+        self.merchant_id = config['merchant_id']
+        self.payment_url = config['payment_url']
+        self.verify_url = config['verify_url']
+        self.client = client or GatewayClient(self.name)
+
+    def payment_form(self, amount, pid, success_url, failure_url):
+        """The fields the browser posts to payment_url"""
+        return {
+            'amt': amount,
+            'pdc': 0,
+            'psc': 0,
+            'txAmt': 0,
+            'tAmt': amount,
+            'pid': pid,
+            'scd': self.merchant_id,
+            'su': success_url,
+            'fu': failure_url,
+        }
+
+    def verify(self, amount, pid, ref_id):
+        """Whether eSewa confirms a payment of ``amount`` for pid under reference ref_id"""
+        response = self.client.request(
+            'POST', self.verify_url,
+            data={'amt': amount, 'scd': self.merchant_id, 'pid': pid, 'rid': ref_id},
+            retry_reads=True,
+        )
+        if response.status_code >= 400:
+            raise GatewayError(f'{self.name} refused the call', status=response.status_code)
+        try:
+            code = ET.fromstring(response.content).findtext('response_code', '')
+        except ET.ParseError:
+            raise GatewayError(f'{self.name} answered without a response code', status=response.status_code)
+        return code.strip().lower() == 'success'
+
+    async def averify(self, amount, pid, ref_id):
+        return await self.client.run_async(self.verify, amount, pid, ref_id)
+
+
+GATEWAYS = {
+    KhaltiGateway.name: KhaltiGateway,
+    EsewaGateway.name: EsewaGateway,
+}
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(name):
+    """The gateway configured under ``name`` in PAYMENT_GATEWAYS, created on first use"""
+    gateway = _gateways.get(name)
+    if gateway is None:
+        with _gateways_lock:
+            gateway = _gateways.get(name)
+            if gateway is None:
+                config = getattr(settings, 'PAYMENT_GATEWAYS', {}).get(name)
+                if config is None or name not in GATEWAYS:
+                    raise ImproperlyConfigured(f'PAYMENT_GATEWAYS has no {name!r} gateway.')
+                gateway = _gateways[name] = GATEWAYS[name](config)
+    return gateway
@@ -0,0 +1,42 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand
+from gigs.models import Order
+from orders.pricing import paisa_expression, quote_many, to_rupees
+
+COLUMNS = ['id', 'status', 'created_at', 'gig', 'buyer', 'freelancer', 'amount', 'platform_fee', 'total']
+
+
+class Command(BaseCommand):
+    help = 'Export every order with its platform fee and total as CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='File to write; standard output by default')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Orders loaded and priced per query')
+
+    def handle(self, *args, **options):
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', newline='')
+        try:
+            exported = self.export(csv.writer(output), options['batch_size'])
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if output is not sys.stdout:
+            self.stdout.write(self.style.SUCCESS(f"Exported {exported} orders to {options['output']}!"))
+
+    def export(self, writer, batch_size):
+        writer.writerow(COLUMNS)
+        orders = Order.objects.order_by('id').values_list(
+            'id', 'status', 'created_at', 'gig__title', 'buyer__username', 'freelancer__username', paisa_expression(),
+        )
+        exported = last_id = 0
+        while True:
+            rows = list(orders.filter(id__gt=last_id)[:batch_size])
+            if not rows:
+                return exported
+            quotes = quote_many([row[-1] for row in rows])
+            for row, amount, fee, total in zip(rows, quotes.amount, quotes.fee, quotes.total):
+                writer.writerow([*row[:-1], to_rupees(amount), to_rupees(fee), to_rupees(total)])
+            exported += len(rows)
+            last_id = rows[-1][0]
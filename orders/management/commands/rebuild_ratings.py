@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from orders.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the running gig and freelancer ratings from all reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        gigs, users = rebuild_ratings(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt ratings for {gigs} gigs and {users} freelancers!')
+        )
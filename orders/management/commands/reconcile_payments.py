@@ -0,0 +1,25 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+from orders.payments import RECONCILE_MIN_AGE, reconcile_payments
+
+
+class Command(BaseCommand):
+    help = 'Check pending payments with their gateways and settle them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Payments loaded per database query')
+        parser.add_argument('--concurrency', type=int, default=10, help='Gateway calls in flight at once')
+        parser.add_argument(
+            '--min-age', type=int, default=RECONCILE_MIN_AGE,
+            help='Seconds a payment is left to its buyer before it is checked here',
+        )
+
+    def handle(self, *args, **options):
+        counts = asyncio.run(reconcile_payments(
+            batch_size=options['batch_size'], concurrency=options['concurrency'], min_age=options['min_age'],
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {sum(counts.values())} payments: {counts['completed']} completed, "
+            f"{counts['failed']} failed, {counts['pending']} still pending, {counts['error']} not reachable!"
+        ))
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand
+from orders.gateway_stub import StubGatewayServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Khalti and eSewa payment gateways'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--delay', type=float, default=0, help='Seconds added to every answer')
+        parser.add_argument('--error-rate', type=float, default=0, help='Fraction of calls answered with 503')
+
+    def handle(self, *args, **options):
+        server = StubGatewayServer(
+            (options['host'], options['port']), delay=options['delay'], error_rate=options['error_rate']
+        )
+        self.stdout.write(f'Payment gateway stub running at {server.url}, press Ctrl+C to stop.')
+        self.stdout.write('Use these settings:')
+        self.stdout.write(f'PAYMENT_GATEWAYS = {json.dumps(server.gateway_settings(), indent=4)}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
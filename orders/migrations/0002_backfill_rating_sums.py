@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def backfill_rating_sums(apps, schema_editor):
+    from orders.ratings import rebuild_ratings
+    rebuild_ratings(
+        review_model=apps.get_model('orders', 'Review'),
+        gig_model=apps.get_model('gigs', 'Gig'),
+        user_model=apps.get_model('users', 'CustomUser'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        ('gigs', '0003_gig_rating_sum'),
+        ('users', '0002_customuser_rating_sum'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_sums, migrations.RunPython.noop),
+    ]
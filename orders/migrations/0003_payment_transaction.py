@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gigs', '0006_gig_similarity'),
+        ('orders', '0002_backfill_rating_sums'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gateway', models.CharField(choices=[('khalti', 'Khalti'), ('esewa', 'eSewa')], max_length=10)),
+                ('reference', models.CharField(max_length=64)),
+                ('amount', models.PositiveBigIntegerField(help_text='In paisa')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('gateway_transaction_id', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='gigs.order')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='payment_status_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='paymenttransaction',
+            constraint=models.UniqueConstraint(fields=('gateway', 'reference'), name='payment_gateway_reference_unique'),
+        ),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from users.models import CustomUser
-from gigs.models import Gig
+from gigs.models import Gig, Order
+from .ratings import apply_review_delta
 
 
 class Review(models.Model):
@@ -25,14 +26,59 @@ class Review(models.Model):
         return f"Review by {self.reviewer.username} for {self.gig.title}"
     
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Update gig rating
-        self.gig.update_rating()
-        # Update freelancer rating
-        self.freelancer.rating = Review.objects.filter(
-            freelancer=self.freelancer
-        ).aggregate(avg=models.Avg('rating'))['avg'] or 0
-        self.freelancer.total_reviews = Review.objects.filter(
-            freelancer=self.freelancer
-        ).count()
-        self.freelancer.save(update_fields=['rating', 'total_reviews']) 
\ No newline at end of file
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Review.objects.filter(pk=self.pk).values(
+                    'gig_id', 'freelancer_id', 'rating'
+                ).first()
+            super().save(*args, **kwargs)
+            # Update the running gig and freelancer ratings
+            if previous and (previous['gig_id'], previous['freelancer_id']) == (self.gig_id, self.freelancer_id):
+                apply_review_delta(self.gig_id, self.freelancer_id, self.rating - previous['rating'], 0)
+            else:
+                if previous:
+                    apply_review_delta(previous['gig_id'], previous['freelancer_id'], -previous['rating'], -1)
+                apply_review_delta(self.gig_id, self.freelancer_id, self.rating, 1) 
+
+class PaymentTransaction(models.Model):
+    """One attempt to pay for an order through a payment gateway"""
+    KHALTI = 'khalti'
+    ESEWA = 'esewa'
+    GATEWAY_CHOICES = [
+        (KHALTI, 'Khalti'),
+        (ESEWA, 'eSewa'),
+    ]
+    PENDING = 'pending'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments')
+    gateway = models.CharField(max_length=10, choices=GATEWAY_CHOICES)
+    # Khalti's pidx, or the pid sent to eSewa
+    reference = models.CharField(max_length=64)
+    amount = models.PositiveBigIntegerField(help_text='In paisa')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Khalti's transaction_id or eSewa's refId, once known
+    gateway_transaction_id = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    settled_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['gateway', 'reference'], name='payment_gateway_reference_unique'),
+        ]
+        indexes = [
+            # reconcile_payments walks pending payments in id order
+            models.Index(fields=['status', 'id'], name='payment_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_gateway_display()} payment {self.reference} for order #{self.order_id}"
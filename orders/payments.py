@@ -0,0 +1,182 @@
+"""Payment attempts and their confirmation.
+
+Every payment started with a gateway is recorded as a PaymentTransaction
+under the gateway's reference (Khalti's pidx, the pid sent to eSewa).
+A payment is settled at most once: settle_payment moves it out of
+pending with a conditional UPDATE, and only the caller that wins that
+update moves the order on, so repeated callbacks and reconciliation runs
+cannot act on a payment twice. The return from the gateway is checked
+with it right away; payments that stay pending (the buyer never came
+back, or the gateway was down) are verified by `manage.py
+reconcile_payments`, many at a time.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from .gateways import GatewayError, GatewayUnavailable, get_gateway
+from .models import PaymentTransaction
+from .pricing import to_rupees
+
+
+logger = logging.getLogger(__name__)
+
+# Khalti lookup statuses that settle a payment; the rest leave it pending
+KHALTI_SETTLED = {
+    'Completed': PaymentTransaction.COMPLETED,
+    'Expired': PaymentTransaction.FAILED,
+    'User canceled': PaymentTransaction.FAILED,
+    'Refunded': PaymentTransaction.FAILED,
+    'Partially refunded': PaymentTransaction.FAILED,
+}
+
+# eSewa payments can only be verified with the refId the buyer returns with;
+# without one after this long, the buyer gave up
+ESEWA_RETURN_TIMEOUT = timedelta(hours=1)
+
+# Payments younger than this many seconds are left to their buyer's return
+RECONCILE_MIN_AGE = 300
+
+
+def record_payment(order, gateway, reference, amount):
+    """Record a payment of ``amount`` paisa started with a gateway"""
+    return PaymentTransaction.objects.create(order=order, gateway=gateway, reference=reference, amount=amount)
+
+
+def settle_payment(payment, status, gateway_transaction_id=''):
+    """Move a pending payment to ``status``; True for the one caller that did.
+
+    A completed payment moves its order from pending to in_progress.
+    ``payment.status`` is brought up to date either way.
+    """
+    now = timezone.now()
+    changes = {'status': status, 'settled_at': now, 'updated_at': now}
+    if gateway_transaction_id:
+        changes['gateway_transaction_id'] = gateway_transaction_id
+    with transaction.atomic():
+        settled = PaymentTransaction.objects.filter(pk=payment.pk, status=PaymentTransaction.PENDING).update(**changes)
+        if settled and status == PaymentTransaction.COMPLETED:
+            # Unless the order was cancelled in the meantime
+            payment.order.transition('in_progress')
+    if settled:
+        for field, value in changes.items():
+            setattr(payment, field, value)
+    else:
+        payment.status = PaymentTransaction.objects.values_list('status', flat=True).get(pk=payment.pk)
+    return bool(settled)
+
+
+def _khalti_outcome(payment, answer):
+    status = KHALTI_SETTLED.get(answer.get('status'), PaymentTransaction.PENDING)
+    if status == PaymentTransaction.COMPLETED and answer.get('total_amount') != payment.amount:
+        logger.warning('Khalti payment %s paid %s paisa, not %s', payment.reference, answer.get('total_amount'), payment.amount)
+        status = PaymentTransaction.FAILED
+    return status, answer.get('transaction_id') or ''
+
+
+def _esewa_unreturned(payment):
+    if payment.created_at < timezone.now() - ESEWA_RETURN_TIMEOUT:
+        return PaymentTransaction.FAILED, ''
+    return PaymentTransaction.PENDING, ''
+
+
+def _esewa_outcome(payment, verified):
+    status = PaymentTransaction.COMPLETED if verified else PaymentTransaction.FAILED
+    return status, payment.gateway_transaction_id
+
+
+def _refused(exc):
+    # A reference the gateway has never heard of will not be paid
+    if exc.status == 404 and not isinstance(exc, GatewayUnavailable):
+        return PaymentTransaction.FAILED, ''
+    raise exc
+
+
+def check_payment(payment):
+    """How a payment stands at its gateway, as (status, gateway transaction id).
+
+    Raises GatewayError when the gateway cannot say.
+    """
+    try:
+        if payment.gateway == PaymentTransaction.KHALTI:
+            return _khalti_outcome(payment, get_gateway(payment.gateway).lookup(payment.reference))
+        if not payment.gateway_transaction_id:
+            return _esewa_unreturned(payment)
+        verified = get_gateway(payment.gateway).verify(
+            to_rupees(payment.amount), payment.reference, payment.gateway_transaction_id
+        )
+        return _esewa_outcome(payment, verified)
+    except GatewayError as exc:
+        return _refused(exc)
+
+
+async def acheck_payment(payment):
+    """check_payment, on the gateway's own thread pool"""
+    try:
+        if payment.gateway == PaymentTransaction.KHALTI:
+            return _khalti_outcome(payment, await get_gateway(payment.gateway).alookup(payment.reference))
+        if not payment.gateway_transaction_id:
+            return _esewa_unreturned(payment)
+        verified = await get_gateway(payment.gateway).averify(
+            to_rupees(payment.amount), payment.reference, payment.gateway_transaction_id
+        )
+        return _esewa_outcome(payment, verified)
+    except GatewayError as exc:
+        return _refused(exc)
+
+
+def confirm_payment(payment):
+    """Check a pending payment with its gateway, settle it, and return its status.
+
+    When the gateway cannot say, the payment stays pending for
+    reconcile_payments.
+    """
+    if payment.status != PaymentTransaction.PENDING:
+        return payment.status
+    try:
+        status, gateway_transaction_id = check_payment(payment)
+    except GatewayError as exc:
+        logger.warning('Could not check %s: %s', payment, exc)
+        return payment.status
+    if status != PaymentTransaction.PENDING:
+        settle_payment(payment, status, gateway_transaction_id)
+    return payment.status
+
+
+async def reconcile_payments(batch_size=100, concurrency=10, min_age=RECONCILE_MIN_AGE):
+    """Check and settle the pending payments older than ``min_age`` seconds.
+
+    Payments are loaded ``batch_size`` at a time and checked with up to
+    ``concurrency`` gateway calls in flight. Returns a Counter of the
+    resulting statuses, plus 'error' for payments the gateway could not
+    check.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = PaymentTransaction.objects.filter(
+        status=PaymentTransaction.PENDING, created_at__lte=timezone.now() - timedelta(seconds=min_age),
+    ).select_related('order').order_by('id')
+    counts = Counter()
+    last_id = 0
+    while True:
+        batch = [payment async for payment in pending.filter(id__gt=last_id)[:batch_size]]
+        if not batch:
+            return counts
+        last_id = batch[-1].id
+        counts.update(await asyncio.gather(*(_reconcile(payment, semaphore) for payment in batch)))
+
+
+async def _reconcile(payment, semaphore):
+    async with semaphore:
+        try:
+            status, gateway_transaction_id = await acheck_payment(payment)
+        except GatewayError as exc:
+            logger.warning('Could not check %s: %s', payment, exc)
+            return 'error'
+    if status != PaymentTransaction.PENDING:
+        await sync_to_async(settle_payment)(payment, status, gateway_transaction_id)
+    return payment.status
@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.lookups import GreaterThan
+
+
+def _rating(rating_sum, total_reviews):
+    """The average rating, rounded half up to two places, or 0 without reviews.
+
+    Whole hundredths come from integer division, so ties such as 4.125
+    round the same way on every database and in every caller.
+    """
+    hundredths = (rating_sum * 200 + total_reviews) / (total_reviews * 2)
+    return Case(
+        When(GreaterThan(total_reviews, 0), then=hundredths * Value(Decimal('0.01'))),
+        default=Value(0),
+        output_field=models.DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def _rating_delta(sum_delta, count_delta):
+    """UPDATE assignments that shift a running rating sum and count.
+
+    All assignments read the pre-update row, so rating is derived from the
+    new sum and count in the same statement.
+    """
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('total_reviews') + count_delta
+    return {
+        'rating_sum': new_sum,
+        'total_reviews': new_count,
+        'rating': _rating(new_sum, new_count),
+    }
+
+
+def apply_review_delta(gig_id, freelancer_id, sum_delta, count_delta):
+    """Apply a review change to the gig's and the freelancer's running rating"""
+    from gigs.models import Gig
+    from users.models import CustomUser
+
+    if not sum_delta and not count_delta:
+        return
+    values = _rating_delta(sum_delta, count_delta)
+    Gig.objects.filter(pk=gig_id).update(**values)
+    CustomUser.objects.filter(pk=freelancer_id).update(**values)
+
+
+def _rebuild(model, review_model, key, batch_size):
+    stats = review_model.objects.order_by().values(key).annotate(
+        rating_sum=Sum('rating'), total_reviews=Count('id')
+    )
+    rebuilt = [
+        model(pk=row[key], rating_sum=row['rating_sum'], total_reviews=row['total_reviews'])
+        for row in stats
+    ]
+    model.objects.update(rating_sum=0, total_reviews=0, rating=0)
+    model.objects.bulk_update(rebuilt, ['rating_sum', 'total_reviews'], batch_size=batch_size)
+    # Rounded by the same expression as the running updates
+    model.objects.filter(total_reviews__gt=0).update(rating=_rating(F('rating_sum'), F('total_reviews')))
+    return len(rebuilt)
+
+
+def rebuild_ratings(review_model=None, gig_model=None, user_model=None, batch_size=500):
+    """Recompute every running rating from one GROUP BY over reviews per target.
+
+    Returns the number of gigs and users that have reviews. Models can be
+    passed in so migrations can use their historical versions.
+    """
+    if review_model is None:
+        from gigs.models import Gig
+        from orders.models import Review
+        from users.models import CustomUser
+        review_model, gig_model, user_model = Review, Gig, CustomUser
+
+    with transaction.atomic():
+        gigs = _rebuild(gig_model, review_model, 'gig_id', batch_size)
+        users = _rebuild(user_model, review_model, 'freelancer_id', batch_size)
+    return gigs, users
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Review
+from .ratings import apply_review_delta
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    """Take a deleted review out of the running gig and freelancer ratings"""
+    apply_review_delta(instance.gig_id, instance.freelancer_id, -instance.rating, -1)
@@ -0,0 +1,653 @@
+import csv
+import io
+import json
+import os
+import socket
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from gigs.models import Category, Gig, Order
+from users.models import CustomUser, UserStats
+from users.stats import STATS_FIELDS, compute_stats
+from . import gateways
+from .gateway_stub import StubGatewayServer
+from .gateways import CircuitBreaker, GatewayClient, GatewayUnavailable
+from .models import PaymentTransaction, Review
+from .payments import check_payment, confirm_payment, reconcile_payments, record_payment, settle_payment
+from .pricing import Quote, paisa_expression, platform_fee, quote, quote_many, to_paisa, to_rupees
+from .ratings import rebuild_ratings
+
+
+class StubGatewayMixin:
+    """Serves PAYMENT_GATEWAYS from a StubGatewayServer for the test class"""
+    stub_delay = 0
+    stub_error_rate = 0
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubGatewayServer(('127.0.0.1', 0), delay=cls.stub_delay, error_rate=cls.stub_error_rate)
+        cls.stub.start()
+        cls.stub_settings = override_settings(PAYMENT_GATEWAYS=cls.stub.gateway_settings())
+        cls.stub_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_settings.disable()
+        cls.stub.shutdown()
+        cls.stub.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        # Gateway clients are cached with the settings they were built from
+        gateways._gateways.clear()
+        self.addCleanup(gateways._gateways.clear)
+
+
+class OrderFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = CustomUser.objects.create_user('buyer', 'buyer@skillbazar.com', 'password')
+        cls.freelancer = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password')
+        category = Category.objects.create(name='Graphic Design', slug='graphic-design')
+        cls.gig = Gig.objects.create(
+            freelancer=cls.freelancer, category=category, title='Logo design', slug='logo-design',
+            description='A professional logo', price=Decimal('1050.00'), delivery_time=3,
+        )
+
+    def create_order(self):
+        return Order.objects.create(gig=self.gig, buyer=self.buyer, freelancer=self.freelancer, amount=self.gig.price)
+
+    def khalti_payment(self, order, amount=None, pay=False):
+        """A Khalti payment started at the stub, optionally paid by the buyer"""
+        total = quote(order.amount).total
+        answer = gateways.get_gateway('khalti').initiate(
+            amount=total, purchase_order_id=f'order_{order.id}', purchase_order_name=order.gig.title,
+            return_url='http://testserver/', website_url='http://testserver/',
+        )
+        if pay:
+            requests.get(answer['payment_url'], allow_redirects=False, timeout=5)
+        return record_payment(order, PaymentTransaction.KHALTI, answer['pidx'], amount or total)
+
+
+class CheckoutTests(StubGatewayMixin, OrderFixtureMixin, TestCase):
+    """The buyer's way from ordering to a paid order, with the stub as the gateway"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.buyer)
+
+    def initiate(self, gateway, order):
+        response = self.client.post(
+            reverse(f'orders:{gateway}_payment_initiate'), json.dumps({'order_id': order.id}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def return_from(self, location):
+        """Follow the gateway's redirect back to the site"""
+        url = urlsplit(location)
+        return self.client.get(f'{url.path}?{url.query}')
+
+    def test_create_order_and_pay_with_khalti(self):
+        response = self.client.post(
+            reverse('orders:create_order_and_pay', args=[self.gig.id]),
+            {'requirements': 'A blue logo', 'payment_method': 'khalti'},
+        )
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(buyer=self.buyer)
+        # The page starts the payment on the server instead of redirecting back by itself
+        self.assertContains(response, reverse('orders:khalti_payment_initiate'))
+        self.assertNotContains(response, reverse('orders:payment_success', args=[order.id]))
+
+        started = self.initiate('khalti', order)
+        payment = PaymentTransaction.objects.get(order=order)
+        self.assertEqual((payment.reference, payment.amount), (started['pidx'], quote(order.amount).total))
+
+        paid = requests.get(started['payment_url'], allow_redirects=False, timeout=5)
+        response = self.return_from(paid.headers['Location'])
+        self.assertRedirects(response, reverse('orders:order_detail', args=[order.id]), fetch_redirect_response=False)
+        payment.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual(payment.status, PaymentTransaction.COMPLETED)
+        self.assertTrue(payment.gateway_transaction_id)
+        self.assertEqual(order.status, 'in_progress')
+
+        # Coming back again changes nothing
+        response = self.return_from(paid.headers['Location'])
+        self.assertRedirects(response, reverse('orders:order_detail', args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual(PaymentTransaction.objects.filter(order=order).count(), 1)
+
+    def test_order_with_payment_page_starts_a_recorded_payment(self):
+        order = self.create_order()
+        response = self.client.get(reverse('orders:order_detail_with_payment', args=[order.id]))
+        self.assertContains(response, reverse('orders:khalti_payment_initiate'))
+        self.assertNotContains(response, 'KhaltiCheckout')
+
+    def test_esewa_payment(self):
+        order = self.create_order()
+        started = self.initiate('esewa', order)
+        paid = requests.post(started['payment_url'], data=started['fields'], allow_redirects=False, timeout=5)
+        self.return_from(paid.headers['Location'])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'in_progress')
+        self.assertEqual(PaymentTransaction.objects.get(order=order).status, PaymentTransaction.COMPLETED)
+
+    def test_cancelled_khalti_payment(self):
+        order = self.create_order()
+        started = self.initiate('khalti', order)
+        paid = requests.get(started['payment_url'] + '&status=User canceled', allow_redirects=False, timeout=5)
+        response = self.return_from(paid.headers['Location'])
+        self.assertRedirects(
+            response, reverse('orders:payment_integration', args=[order.id]), fetch_redirect_response=False
+        )
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(PaymentTransaction.objects.get(order=order).status, PaymentTransaction.FAILED)
+
+    def test_return_without_a_payment(self):
+        order = self.create_order()
+        response = self.client.get(reverse('orders:payment_success', args=[order.id]))
+        self.assertRedirects(
+            response, reverse('orders:payment_integration', args=[order.id]), fetch_redirect_response=False
+        )
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+
+
+class SettlePaymentTests(StubGatewayMixin, OrderFixtureMixin, TestCase):
+    """Payments are settled at most once, whoever gets there first"""
+
+    def test_settle_once(self):
+        order = self.create_order()
+        payment = self.khalti_payment(order)
+        self.assertTrue(settle_payment(payment, PaymentTransaction.COMPLETED, 'txn-1'))
+        self.assertFalse(settle_payment(payment, PaymentTransaction.FAILED))
+        payment.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual((payment.status, payment.gateway_transaction_id), (PaymentTransaction.COMPLETED, 'txn-1'))
+        self.assertEqual(order.status, 'in_progress')
+
+    def test_stale_copy_loses(self):
+        order = self.create_order()
+        payment = self.khalti_payment(order, pay=True)
+        # Loaded by a reconcile run before the buyer's return settled it
+        stale = PaymentTransaction.objects.get(pk=payment.pk)
+        self.assertEqual(confirm_payment(payment), PaymentTransaction.COMPLETED)
+        self.assertFalse(settle_payment(stale, PaymentTransaction.FAILED))
+        self.assertEqual(stale.status, PaymentTransaction.COMPLETED)
+        self.assertEqual(async_to_sync(reconcile_payments)(min_age=0), {})
+
+    def test_completed_payment_leaves_cancelled_order(self):
+        order = self.create_order()
+        payment = self.khalti_payment(order, pay=True)
+        order.transition('cancelled')
+        self.assertEqual(confirm_payment(payment), PaymentTransaction.COMPLETED)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+
+    def test_khalti_amount_mismatch_fails(self):
+        order = self.create_order()
+        # Recorded for more than the buyer was asked to pay
+        payment = self.khalti_payment(order, amount=quote(order.amount).total + 100, pay=True)
+        self.assertEqual(confirm_payment(payment), PaymentTransaction.FAILED)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+
+    def test_unpaid_khalti_payment_stays_pending(self):
+        payment = self.khalti_payment(self.create_order())
+        self.assertEqual(confirm_payment(payment), PaymentTransaction.PENDING)
+
+    def test_unknown_khalti_payment_fails(self):
+        payment = record_payment(self.create_order(), PaymentTransaction.KHALTI, 'unknown-pidx', 105000)
+        self.assertEqual(check_payment(payment), (PaymentTransaction.FAILED, ''))
+
+    def test_esewa_payment_without_ref_id(self):
+        payment = record_payment(self.create_order(), PaymentTransaction.ESEWA, 'order_1_abc', 110250)
+        self.assertEqual(check_payment(payment), (PaymentTransaction.PENDING, ''))
+        # The buyer never came back with a refId
+        PaymentTransaction.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        payment.refresh_from_db()
+        self.assertEqual(check_payment(payment), (PaymentTransaction.FAILED, ''))
+
+    def test_esewa_payment_with_wrong_ref_id_fails(self):
+        payment = record_payment(self.create_order(), PaymentTransaction.ESEWA, 'order_1_abc', 110250)
+        payment.gateway_transaction_id = 'NOT-A-REF'
+        self.assertEqual(confirm_payment(payment), PaymentTransaction.FAILED)
+
+
+class ReconcilePaymentsTests(StubGatewayMixin, OrderFixtureMixin, TestCase):
+
+    def age(self, payments):
+        PaymentTransaction.objects.filter(pk__in=[payment.pk for payment in payments]).update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_reconcile_in_batches(self):
+        paid = [self.khalti_payment(self.create_order(), pay=True) for _ in range(5)]
+        unpaid = [self.khalti_payment(self.create_order()) for _ in range(2)]
+        mismatched = self.khalti_payment(self.create_order(), amount=1, pay=True)
+        self.age(paid + unpaid + [mismatched])
+        young = self.khalti_payment(self.create_order(), pay=True)
+
+        counts = async_to_sync(reconcile_payments)(batch_size=3, concurrency=2)
+        self.assertEqual(counts, {'completed': 5, 'pending': 2, 'failed': 1})
+        self.assertEqual(
+            Order.objects.filter(payments__in=paid, status='in_progress').count(), len(paid)
+        )
+        young.refresh_from_db()
+        self.assertEqual(young.status, PaymentTransaction.PENDING)
+
+        # Settled payments are not checked again
+        counts = async_to_sync(reconcile_payments)(batch_size=3, concurrency=2)
+        self.assertEqual(counts, {'pending': 2})
+
+    def test_unreachable_gateway_is_counted(self):
+        payment = self.khalti_payment(self.create_order(), pay=True)
+        self.age([payment])
+        self.stub.error_rate = 1
+        self.addCleanup(setattr, self.stub, 'error_rate', 0)
+        gateways.get_gateway('khalti').client.backoff = 0
+        counts = async_to_sync(reconcile_payments)()
+        self.assertEqual(counts, {'error': 1})
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, PaymentTransaction.PENDING)
+
+
+class GatewayClientTests(SimpleTestCase):
+    """Retries, timeouts and the circuit breaker, against a slow or failing stub"""
+
+    def start_stub(self, delay=0, error_rate=0):
+        stub = StubGatewayServer(('127.0.0.1', 0), delay=delay, error_rate=error_rate)
+        stub.start()
+        self.addCleanup(stub.server_close)
+        self.addCleanup(stub.shutdown)
+        return stub
+
+    def gateway_client(self, **kwargs):
+        kwargs.setdefault('timeout', (1, 1))
+        client = GatewayClient('stub', backoff=0, **kwargs)
+        self.addCleanup(client.session.close)
+        return client
+
+    def calls(self, client):
+        """Count the HTTP calls the client makes"""
+        return mock.patch.object(client.session, 'request', wraps=client.session.request)
+
+    def test_connect_failure_is_retried(self):
+        # Nothing listens on a port that was just released
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        client = self.gateway_client(retries=2)
+        with self.calls(client) as sent, self.assertRaises(GatewayUnavailable):
+            client.request('POST', f'http://127.0.0.1:{port}/api/v2/epayment/initiate/')
+        self.assertEqual(sent.call_count, 3)
+
+    def test_read_timeout_is_only_retried_for_reads(self):
+        stub = self.start_stub(delay=0.3)
+        client = self.gateway_client(timeout=(1, 0.05), retries=2)
+        with self.calls(client) as sent:
+            with self.assertRaises(GatewayUnavailable):
+                client.request('POST', f'{stub.url}/api/v2/epayment/initiate/')
+            self.assertEqual(sent.call_count, 1)
+            with self.assertRaises(GatewayUnavailable):
+                client.request('POST', f'{stub.url}/api/v2/epayment/lookup/', retry_reads=True)
+            self.assertEqual(sent.call_count, 4)
+
+    def test_server_error_is_only_retried_for_reads(self):
+        stub = self.start_stub(error_rate=1)
+        client = self.gateway_client(retries=2)
+        with self.calls(client) as sent:
+            with self.assertRaises(GatewayUnavailable) as raised:
+                client.request('POST', f'{stub.url}/api/v2/epayment/initiate/')
+            self.assertEqual((raised.exception.status, sent.call_count), (503, 1))
+            with self.assertRaises(GatewayUnavailable):
+                client.request('POST', f'{stub.url}/api/v2/epayment/lookup/', retry_reads=True)
+            self.assertEqual(sent.call_count, 4)
+
+    def test_client_errors_are_returned(self):
+        stub = self.start_stub()
+        # No Authorization header
+        response = self.gateway_client().request('POST', f'{stub.url}/api/v2/epayment/initiate/', json={})
+        self.assertEqual(response.status_code, 401)
+
+    def test_circuit_opens_and_lets_one_trial_through(self):
+        stub = self.start_stub(error_rate=1)
+        breaker = CircuitBreaker(threshold=2, reset_timeout=0.2)
+        client = self.gateway_client(retries=0, breaker=breaker)
+        url = f'{stub.url}/api/v2/epayment/lookup/'
+        with self.calls(client) as sent:
+            for _ in range(2):
+                with self.assertRaises(GatewayUnavailable):
+                    client.request('POST', url)
+            self.assertTrue(breaker.is_open)
+            # Refused without calling the gateway
+            with self.assertRaisesMessage(GatewayUnavailable, 'not calling it'):
+                client.request('POST', url)
+            self.assertEqual(sent.call_count, 2)
+
+            # A failed trial keeps the circuit open for another period
+            time.sleep(0.25)
+            with self.assertRaisesMessage(GatewayUnavailable, 'answered 503'):
+                client.request('POST', url)
+            with self.assertRaisesMessage(GatewayUnavailable, 'not calling it'):
+                client.request('POST', url)
+            self.assertEqual(sent.call_count, 3)
+
+            # A successful one closes it; an unknown pidx is an answer too
+            stub.error_rate = 0
+            time.sleep(0.25)
+            self.assertEqual(client.request('POST', url).status_code, 404)
+            self.assertFalse(breaker.is_open)
+            client.request('POST', url)
+            self.assertEqual(sent.call_count, 5)
+
+    def test_half_open_circuit_allows_one_call_per_period(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0.1)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+    def test_stub_delay(self):
+        stub = self.start_stub(delay=0.2)
+        started = time.monotonic()
+        self.gateway_client().request('GET', f'{stub.url}/epay/transrec')
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_stub_error_rate(self):
+        stub = self.start_stub(error_rate=1)
+        self.assertEqual(requests.get(f'{stub.url}/epay/transrec', timeout=5).status_code, 503)
+        stub.error_rate = 0
+        self.assertEqual(requests.get(f'{stub.url}/epay/transrec', timeout=5).status_code, 200)
+
+
+class PaymentInitiateTests(StubGatewayMixin, OrderFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_order()
+
+    def initiate(self, gateway, client=None):
+        return (client or self.client).post(
+            reverse(f'orders:{gateway}_payment_initiate'), json.dumps({'order_id': self.order.id}),
+            content_type='application/json',
+        )
+
+    def test_requires_login(self):
+        for gateway in ('khalti', 'esewa'):
+            response = self.initiate(gateway)
+            self.assertEqual(response.status_code, 302)
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.buyer)
+        for gateway in ('khalti', 'esewa'):
+            self.assertEqual(self.initiate(gateway, client).status_code, 403)
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_other_users_order(self):
+        self.client.force_login(self.freelancer)
+        self.assertEqual(self.initiate('khalti').status_code, 404)
+
+    def test_invalid_request(self):
+        self.client.force_login(self.buyer)
+        response = self.client.post(
+            reverse('orders:khalti_payment_initiate'), 'not json', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_unexpected_error_is_not_shown(self):
+        self.client.force_login(self.buyer)
+        for gateway in ('khalti', 'esewa'):
+            with mock.patch('orders.views.record_payment', side_effect=RuntimeError('database password')), \
+                    self.assertLogs('orders.views', 'ERROR'):
+                response = self.initiate(gateway)
+            self.assertEqual(response.status_code, 500)
+            self.assertNotIn('database password', response.json()['error'])
+
+
+class OrderStatusTests(OrderFixtureMixin, TestCase):
+    """Status moves follow Order.TRANSITIONS and keep both parties' stats exact"""
+
+    def setUp(self):
+        self.client.force_login(self.freelancer)
+
+    def create_orders(self, *statuses):
+        orders = []
+        for status in statuses:
+            order = self.create_order()
+            Order.objects.filter(pk=order.pk).update(status=status)
+            order.status = status
+            orders.append(order)
+        # Rebuilt, since the statuses above were set behind the signals' back
+        UserStats.objects.all().delete()
+        return orders
+
+    def assertStatsExact(self):
+        for user in (self.freelancer, self.buyer):
+            stats = UserStats.objects.filter(user=user).values(*STATS_FIELDS).get()
+            self.assertEqual(stats, compute_stats(user.id))
+
+    def bulk_update(self, orders, status):
+        return self.client.post(reverse('orders:bulk_update_order_status'), {
+            'order_ids': [order.id for order in orders], 'status': status,
+        })
+
+    def statuses(self, orders):
+        orders = Order.objects.filter(pk__in=[order.pk for order in orders]).order_by('pk')
+        return list(orders.values_list('status', flat=True))
+
+    def test_transition_table(self):
+        pending, in_progress, completed, cancelled = self.create_orders(
+            'pending', 'in_progress', 'completed', 'cancelled'
+        )
+        self.assertEqual([status for status, _ in pending.next_statuses], ['in_progress', 'cancelled'])
+        self.assertEqual([status for status, _ in in_progress.next_statuses], ['completed', 'cancelled'])
+        self.assertEqual((completed.next_statuses, cancelled.next_statuses), ([], []))
+        self.assertFalse(pending.transition('completed'))
+        self.assertFalse(cancelled.transition('in_progress'))
+        self.assertTrue(pending.transition('in_progress'))
+        self.assertEqual(self.statuses([pending, cancelled]), ['in_progress', 'cancelled'])
+
+    def test_stale_instance_does_not_move(self):
+        order, = self.create_orders('pending')
+        stale = Order.objects.get(pk=order.pk)
+        self.assertTrue(order.transition('cancelled'))
+        self.assertFalse(stale.transition('in_progress'))
+        self.assertEqual(self.statuses([order]), ['cancelled'])
+        self.assertStatsExact()
+
+    def test_order_list_offers_bulk_update(self):
+        order, = self.create_orders('pending')
+        response = self.client.get(reverse('orders:order_list'))
+        self.assertContains(response, reverse('orders:bulk_update_order_status'))
+        self.assertContains(response, f'name="order_ids" value="{order.id}"')
+
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('orders:order_list'))
+        self.assertContains(response, f'Order #{order.id}')
+        self.assertNotContains(response, 'name="order_ids"')
+
+    def test_bulk_update_from_mixed_statuses(self):
+        orders = self.create_orders('pending', 'in_progress', 'completed', 'cancelled', 'pending')
+        response = self.bulk_update(orders, 'cancelled')
+        self.assertRedirects(response, reverse('orders:order_list'), fetch_redirect_response=False)
+        # Completed orders are final
+        self.assertEqual(self.statuses(orders), ['cancelled', 'cancelled', 'completed', 'cancelled', 'cancelled'])
+        self.assertStatsExact()
+
+        orders = self.create_orders('pending', 'in_progress', 'in_progress')
+        self.bulk_update(orders, 'completed')
+        self.assertEqual(self.statuses(orders), ['pending', 'completed', 'completed'])
+        completed = Order.objects.filter(pk__in=[order.pk for order in orders[1:]])
+        self.assertTrue(all(completed.values_list('delivery_date', flat=True)))
+        self.assertStatsExact()
+
+    def test_bulk_update_only_moves_own_orders(self):
+        order, = self.create_orders('pending')
+        self.client.force_login(self.buyer)
+        self.bulk_update([order], 'cancelled')
+        self.assertEqual(self.statuses([order]), ['pending'])
+
+    def change_before_update(self, order, status):
+        """Have another request move ``order`` just before the bulk UPDATE runs"""
+        pending = [order]
+
+        def concurrent_change(execute, sql, params, many, context):
+            if pending and sql.startswith('UPDATE "gigs_order"'):
+                self.assertTrue(Order.objects.get(pk=pending.pop().pk).transition(status))
+            return execute(sql, params, many, context)
+
+        return connection.execute_wrapper(concurrent_change)
+
+    def test_bulk_update_skips_concurrent_change(self):
+        raced, other = self.create_orders('pending', 'pending')
+        with self.change_before_update(raced, 'cancelled'):
+            self.bulk_update([raced, other], 'in_progress')
+        self.assertEqual(self.statuses([raced, other]), ['cancelled', 'in_progress'])
+        self.assertStatsExact()
+
+    def test_bulk_update_counts_concurrent_move_to_same_status_once(self):
+        raced, other = self.create_orders('in_progress', 'in_progress')
+        # Both end up completed, but the raced one was moved (and counted) by the other request
+        with self.change_before_update(raced, 'completed'):
+            self.bulk_update([raced, other], 'completed')
+        self.assertEqual(self.statuses([raced, other]), ['completed', 'completed'])
+        self.assertStatsExact()
+
+
+class ReviewRatingTests(OrderFixtureMixin, TestCase):
+    """Running ratings follow review changes and equal a full rebuild"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reviewers = [
+            CustomUser.objects.create_user(f'reviewer{i}', f'reviewer{i}@skillbazar.com', 'password') for i in range(8)
+        ]
+        cls.other_gig = Gig.objects.create(
+            freelancer=cls.freelancer, category=cls.gig.category, title='Banner design', slug='banner-design',
+            description='A banner', price=Decimal('800.00'), delivery_time=2,
+        )
+
+    def review(self, reviewer, rating, gig=None):
+        return Review.objects.create(
+            gig=gig or self.gig, reviewer=reviewer, freelancer=self.freelancer, rating=rating, comment='Good',
+        )
+
+    def ratings(self):
+        """(rating_sum, total_reviews, rating) of both gigs and the freelancer"""
+        fields = ('rating_sum', 'total_reviews', 'rating')
+        rows = [Gig.objects.filter(pk=gig.pk).values_list(*fields).get() for gig in (self.gig, self.other_gig)]
+        rows.append(CustomUser.objects.filter(pk=self.freelancer.pk).values_list(*fields).get())
+        return rows
+
+    def assertMatchesRebuild(self):
+        running = self.ratings()
+        rebuild_ratings()
+        self.assertEqual(self.ratings(), running)
+
+    def test_ties_round_half_up(self):
+        # 33 / 8 = 4.125
+        for reviewer, rating in zip(self.reviewers, (5, 5, 4, 4, 4, 4, 4, 3)):
+            self.review(reviewer, rating)
+        self.assertEqual(self.ratings()[0], (33, 8, Decimal('4.13')))
+        self.assertMatchesRebuild()
+
+    def test_repeating_average(self):
+        for reviewer, rating in zip(self.reviewers, (5, 4, 4)):
+            self.review(reviewer, rating)
+        self.assertEqual(self.ratings()[0], (13, 3, Decimal('4.33')))
+        self.assertMatchesRebuild()
+
+    def test_edit_move_and_delete(self):
+        first = self.review(self.reviewers[0], 5)
+        second = self.review(self.reviewers[1], 2)
+        first.rating = 3
+        first.save()
+        self.assertEqual(self.ratings()[0], (5, 2, Decimal('2.50')))
+        self.assertMatchesRebuild()
+
+        second.gig = self.other_gig
+        second.save()
+        self.assertEqual(self.ratings(), [
+            (3, 1, Decimal('3.00')), (2, 1, Decimal('2.00')), (5, 2, Decimal('2.50')),
+        ])
+        self.assertMatchesRebuild()
+
+        first.delete()
+        second.delete()
+        self.assertEqual(self.ratings(), [(0, 0, 0), (0, 0, 0), (0, 0, 0)])
+        self.assertMatchesRebuild()
+
+    def test_rebuild_repairs_drift(self):
+        self.review(self.reviewers[0], 4)
+        Gig.objects.filter(pk=self.gig.pk).update(rating_sum=40, total_reviews=3, rating=Decimal('1.00'))
+        self.assertEqual(rebuild_ratings(), (1, 1))
+        self.assertEqual(self.ratings()[0], (4, 1, Decimal('4.00')))
+
+
+class PricingTests(OrderFixtureMixin, TestCase):
+    """Fees and totals are exact in paisa, one at a time or in bulk"""
+
+    def test_paisa_conversion(self):
+        for rupees, paisa in (
+            (Decimal('1050.00'), 105000), ('19.99', 1999), ('0.005', 1), ('0.004', 0), (7, 700), ('1234567.89', 123456789),
+        ):
+            with self.subTest(rupees=rupees):
+                self.assertEqual(to_paisa(rupees), paisa)
+        self.assertEqual(to_rupees(105), Decimal('1.05'))
+        self.assertEqual(str(to_rupees(np.int64(110250))), '1102.50')
+
+    def test_fee_rounds_half_up(self):
+        # 5% of 9, 10, 30 and 31 paisa is 0.45, 0.5, 1.5 and 1.55
+        self.assertEqual([platform_fee(paisa) for paisa in (9, 10, 30, 31)], [0, 1, 2, 2])
+
+    def test_quote(self):
+        order_quote = quote(Decimal('1050.00'))
+        self.assertEqual(order_quote, Quote(105000, 5250, 110250))
+        self.assertEqual((order_quote.fee_rupees, order_quote.total_rupees), (Decimal('52.50'), Decimal('1102.50')))
+        self.assertEqual(quote('10.10'), Quote(1010, 51, 1061))
+
+    def test_quote_many_matches_quote(self):
+        amounts = list(range(0, 20000)) + [99999999, 123456789]
+        quotes = quote_many(amounts)
+        for index in (0, 9, 10, 30, 12345, len(amounts) - 1):
+            self.assertEqual(quotes.at(index), quote(to_rupees(amounts[index])))
+        self.assertEqual(
+            quotes.sum(), Quote(*(sum(values) for values in zip(*(quote(to_rupees(a)) for a in amounts)))),
+        )
+
+    def test_paisa_expression(self):
+        for amount in ('19.99', '0.01', '1234567.89'):
+            Order.objects.create(gig=self.gig, buyer=self.buyer, freelancer=self.freelancer, amount=Decimal(amount))
+        for amount, paisa in Order.objects.values_list('amount', paisa_expression()):
+            self.assertEqual(paisa, to_paisa(amount))
+
+    def test_export_prices_every_order(self):
+        orders = [self.create_order() for _ in range(3)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.csv')
+            call_command('export_orders', output=path, batch_size=2, stdout=io.StringIO())
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual([int(row['id']) for row in rows], [order.id for order in orders])
+        self.assertEqual({(row['amount'], row['platform_fee'], row['total']) for row in rows}, {('1050.00', '52.50', '1102.50')})
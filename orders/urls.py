@@ -15,6 +15,7 @@ urlpatterns = [
     path('order-with-payment/<int:pk>/', views.order_detail_with_payment, name='order_detail_with_payment'),
     path('orders/', views.order_list, name='order_list'),
     path('update-order-status/<int:pk>/', views.update_order_status, name='update_order_status'),
+    path('update-order-status/', views.bulk_update_order_status, name='bulk_update_order_status'),
     path('submit-review/<int:order_id>/', views.submit_review, name='submit_review'),
     path('delete-order/<int:order_id>/', views.delete_order, name='delete_order'),
 ] 
\ No newline at end of file
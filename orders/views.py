@@ -4,19 +4,22 @@ from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
 from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from datetime import timedelta
-from decimal import Decimal
-import requests
 import json
+import logging
 import uuid
-from .models import Review
+from .gateways import GatewayError, GatewayUnavailable, get_gateway
+from .models import PaymentTransaction, Review
+from .payments import confirm_payment, record_payment
+from .pricing import quote, to_rupees
 from .forms import OrderForm, ReviewForm
 from gigs.models import Gig, Order
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+logger = logging.getLogger(__name__)
+
 
 @login_required
 def create_order(request, gig_id):
@@ -72,46 +75,30 @@ def create_order_and_pay(request, gig_id):
                 )
                 
                 # Calculate payment details
-                platform_fee = order.amount * Decimal('0.05')
-                total_amount = order.amount + platform_fee
-                
-                # Khalti configuration
-                khalti_config = {
-                    'public_key': 'test_public_key_dc74c7d6d5134b94a2330cbbe3c57c54',
-                    'product_identity': f"order_{order.id}",
-                    'product_name': order.gig.title,
-                    'amount': int(float(total_amount) * 100),  # Convert to paisa
-                    'customer_info': {
-                        'name': request.user.get_full_name() or request.user.username,
-                        'email': request.user.email,
-                        'phone': request.user.phone_number or "9800000000"
-                    }
-                }
+                price = quote(order.amount)
                 
                 # Get the selected payment method from the form
                 payment_method = request.POST.get('payment_method', 'khalti')
                 
+                # The page starts the payment with khalti/esewa_payment_initiate
                 context = {
                     'order': order,
-                    'platform_fee': platform_fee,
-                    'total_amount': total_amount,
-                    'khalti_config': khalti_config,
+                    'platform_fee': price.fee_rupees,
+                    'total_amount': price.total_rupees,
                     'payment_method': payment_method,  # Pass the selected payment method
-                    'auto_open': True,  # Flag to auto-open Khalti
                 }
                 return render(request, 'orders/direct_payment.html', context)
     else:
         form = OrderForm()
     
     # Calculate payment details for display
-    platform_fee = gig.price * Decimal('0.05')
-    total_amount = gig.price + platform_fee
+    price = quote(gig.price)
     
     context = {
         'gig': gig,
         'form': form,
-        'platform_fee': platform_fee,
-        'total_amount': total_amount,
+        'platform_fee': price.fee_rupees,
+        'total_amount': price.total_rupees,
     }
     return render(request, 'orders/create_order.html', context)
 
@@ -134,28 +121,13 @@ def order_detail_with_payment(request, pk):
     )
     
     # Calculate payment details
-    platform_fee = order.amount * Decimal('0.05')
-    total_amount = order.amount + platform_fee
-    
-    # Khalti configuration
-    khalti_config = {
-        'public_key': 'test_public_key_dc74c7d6d5134b94a2330cbbe3c57c54',
-        'product_identity': f"order_{order.id}",
-        'product_name': order.gig.title,
-        'amount': int(float(total_amount) * 100),  # Convert to paisa
-        'customer_info': {
-            'name': request.user.get_full_name() or request.user.username,
-            'email': request.user.email,
-            'phone': request.user.phone_number or "9800000000"
-        }
-    }
+    price = quote(order.amount)
     
     context = {
         'order': order,
         'can_review': can_review,
-        'platform_fee': platform_fee,
-        'total_amount': total_amount,
-        'khalti_config': khalti_config,
+        'platform_fee': price.fee_rupees,
+        'total_amount': price.total_rupees,
         'is_buyer': request.user == order.buyer,
     }
     return render(request, 'orders/order_detail_with_payment.html', context)
@@ -167,31 +139,24 @@ def payment_integration(request, order_id):
     order = get_object_or_404(Order, id=order_id, buyer=request.user)
     
     # Calculate fees
-    platform_fee = order.amount * Decimal('0.05')  # 5% platform fee
-    total_amount = order.amount + platform_fee
+    price = quote(order.amount)
     
     # Generate unique transaction ID
     transaction_id = str(uuid.uuid4())
     
-    # Khalti API Configuration (Test credentials)
+    # Public gateway configuration; the secret key stays on the server
     khalti_config = {
-        'public_key': 'test_public_key_dc74c7d6d5134b94a2330cbbe3c57c54',
-        'secret_key': 'test_secret_key_3e7b4c1d5f8a9b2c6d7e8f9a0b1c2d3e',
-        'api_url': 'https://a.khalti.com/api/v2/epayment/initiate/',
-        'verify_url': 'https://a.khalti.com/api/v2/epayment/lookup/',
+        'public_key': get_gateway('khalti').public_key,
     }
-    
-    # eSewa API Configuration (Test credentials)
     esewa_config = {
-        'merchant_id': 'EPAYTEST',
-        'api_url': 'https://esewa.com.np/epay/main',
-        'verify_url': 'https://esewa.com.np/epay/transrec',
+        'merchant_id': get_gateway('esewa').merchant_id,
+        'api_url': get_gateway('esewa').payment_url,
     }
     
     context = {
         'order': order,
-        'platform_fee': platform_fee,
-        'total_amount': total_amount,
+        'platform_fee': price.fee_rupees,
+        'total_amount': price.total_rupees,
         'transaction_id': transaction_id,
         'khalti_config': khalti_config,
         'esewa_config': esewa_config,
@@ -199,93 +164,116 @@ def payment_integration(request, order_id):
     return render(request, 'orders/payment_integration.html', context)
 
 
-@csrf_exempt
+def _initiate_order(request):
+    """The buyer's order named in an initiate request's JSON body"""
+    try:
+        order_id = json.loads(request.body)['order_id']
+    except (ValueError, KeyError, TypeError):
+        return None
+    return get_object_or_404(Order, id=order_id, buyer=request.user)
+
+
+@login_required
 @require_POST
 def khalti_payment_initiate(request):
     """Initiate Khalti payment"""
+    order = _initiate_order(request)
+    if order is None:
+        return JsonResponse({'error': 'Invalid payment request.'}, status=400)
     try:
-        data = json.loads(request.body)
-        order_id = data.get('order_id')
-        amount = data.get('amount')
-        
-        order = get_object_or_404(Order, id=order_id, buyer=request.user)
-        
-        # Khalti payment initiation
-        khalti_data = {
-            "public_key": "test_public_key_dc74c7d6d5134b94a2330cbbe3c57c54",
-            "amount": int(float(amount) * 100),  # Convert to paisa
-            "product_identity": f"order_{order_id}",
-            "product_name": order.gig.title,
-            "customer_info": {
+        # Charge the order's total, whatever amount the page sent
+        amount = quote(order.amount).total
+        response_data = get_gateway('khalti').initiate(
+            amount=amount,
+            purchase_order_id=f"order_{order.id}",
+            purchase_order_name=order.gig.title,
+            return_url=request.build_absolute_uri(reverse('orders:payment_success', args=[order.id])),
+            website_url=request.build_absolute_uri('/'),
+            customer_info={
                 "name": request.user.get_full_name(),
                 "email": request.user.email,
                 "phone": request.user.phone_number or "9800000000"
             },
-            "success_url": request.build_absolute_uri(f"/orders/payment-success/{order_id}/"),
-            "failure_url": request.build_absolute_uri(f"/orders/payment-failure/{order_id}/"),
-        }
+        )
+        record_payment(order, PaymentTransaction.KHALTI, response_data['pidx'], amount)
         
-        # In production, you would make a real API call to Khalti
-        # For demo purposes, we'll simulate the response
-        response_data = {
-            "pidx": str(uuid.uuid4()),
-            "payment_url": f"https://a.khalti.com/api/v2/epayment/initiate/?pidx={khalti_data['product_identity']}",
-            "expires_at": "2024-12-31T23:59:59.999999Z"
-        }
+        return JsonResponse({
+            "pidx": response_data['pidx'],
+            "payment_url": response_data['payment_url'],
+            "expires_at": response_data.get('expires_at'),
+        })
         
-        return JsonResponse(response_data)
-        
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=400)
+    except GatewayUnavailable:
+        return JsonResponse({'error': 'Khalti is not responding. Please try again shortly.'}, status=503)
+    except GatewayError as e:
+        return JsonResponse({'error': str(e)}, status=502)
+    except Exception:
+        logger.exception('Could not start a Khalti payment for order #%s', order.id)
+        return JsonResponse({'error': 'Could not start the payment. Please try again.'}, status=500)
 
 
-@csrf_exempt
+@login_required
 @require_POST
 def esewa_payment_initiate(request):
     """Initiate eSewa payment"""
+    order = _initiate_order(request)
+    if order is None:
+        return JsonResponse({'error': 'Invalid payment request.'}, status=400)
     try:
-        data = json.loads(request.body)
-        order_id = data.get('order_id')
-        amount = data.get('amount')
-        
-        order = get_object_or_404(Order, id=order_id, buyer=request.user)
-        
-        # eSewa payment initiation
-        esewa_data = {
-            "amt": amount,
-            "pdc": 0,
-            "psc": 0,
-            "txAmt": 0,
-            "tAmt": amount,
-            "pid": f"order_{order_id}",
-            "scd": "EPAYTEST",
-            "su": request.build_absolute_uri(f"/orders/payment-success/{order_id}/"),
-            "fu": request.build_absolute_uri(f"/orders/payment-failure/{order_id}/"),
-        }
+        # eSewa is paid by posting this form from the browser, once per pid
+        amount = quote(order.amount).total
+        payment = record_payment(order, PaymentTransaction.ESEWA, f"order_{order.id}_{uuid.uuid4().hex[:12]}", amount)
+        esewa = get_gateway('esewa')
+        fields = esewa.payment_form(
+            amount=to_rupees(amount),
+            pid=payment.reference,
+            success_url=request.build_absolute_uri(reverse('orders:payment_success', args=[order.id])),
+            failure_url=request.build_absolute_uri(reverse('orders:payment_failure', args=[order.id])),
+        )
         
-        # In production, you would redirect to eSewa
-        # For demo purposes, we'll simulate the response
         response_data = {
-            "payment_url": f"https://esewa.com.np/epay/main?pid={esewa_data['pid']}&amt={esewa_data['amt']}&tAmt={esewa_data['tAmt']}",
-            "pid": esewa_data['pid']
+            "payment_url": esewa.payment_url,
+            "pid": fields['pid'],
+            "fields": fields,
         }
         
         return JsonResponse(response_data)
         
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=400)
+    except Exception:
+        logger.exception('Could not start an eSewa payment for order #%s', order.id)
+        return JsonResponse({'error': 'Could not start the payment. Please try again.'}, status=500)
 
 
 @login_required
 def payment_success(request, order_id):
-    """Handle successful payment"""
+    """Handle the buyer's return from a payment gateway"""
     order = get_object_or_404(Order, id=order_id, buyer=request.user)
     
-    # Update order status
-    order.status = 'in_progress'
-    order.save()
+    # Khalti returns with the payment's pidx, eSewa with our pid and its refId
+    if request.GET.get('pidx'):
+        gateway, reference = PaymentTransaction.KHALTI, request.GET['pidx']
+    else:
+        gateway, reference = PaymentTransaction.ESEWA, request.GET.get('oid', '')
+    payment = PaymentTransaction.objects.filter(order=order, gateway=gateway, reference=reference).first()
+    if payment is None:
+        messages.error(request, 'We could not find a payment for this order. Please pay through Khalti or eSewa.')
+        return redirect('orders:payment_integration', order_id=order.pk)
+    
+    ref_id = request.GET.get('refId')
+    if gateway == PaymentTransaction.ESEWA and ref_id and not payment.gateway_transaction_id:
+        # Kept for reconcile_payments in case verification fails now
+        PaymentTransaction.objects.filter(pk=payment.pk, gateway_transaction_id='').update(gateway_transaction_id=ref_id)
+        payment.gateway_transaction_id = ref_id
     
-    messages.success(request, 'Payment successful! Your order has been placed.')
+    # Verified with the gateway; a repeated return finds the payment settled
+    status = confirm_payment(payment)
+    if status == PaymentTransaction.COMPLETED:
+        messages.success(request, 'Payment successful! Your order has been placed.')
+    elif status == PaymentTransaction.FAILED:
+        messages.error(request, 'Payment was not completed. Please try again.')
+        return redirect('orders:payment_integration', order_id=order.pk)
+    else:
+        messages.info(request, 'Your payment is being confirmed. Your order will start once it is.')
     return redirect('orders:order_detail', pk=order.pk)
 
 
@@ -316,14 +304,13 @@ def order_detail(request, pk):
     )
     
     # Calculate payment details
-    platform_fee = order.amount * Decimal('0.05')
-    total_amount = order.amount + platform_fee
+    price = quote(order.amount)
     
     context = {
         'order': order,
         'can_review': can_review,
-        'platform_fee': platform_fee,
-        'total_amount': total_amount,
+        'platform_fee': price.fee_rupees,
+        'total_amount': price.total_rupees,
     }
     return render(request, 'orders/order_detail.html', context)
 
@@ -331,13 +318,14 @@ def order_detail(request, pk):
 @login_required
 def order_list(request):
     """Show user's orders"""
+    orders = Order.objects.select_related('gig__category', 'buyer', 'freelancer').order_by('-created_at')
     if request.user.user_type in ['freelancer', 'both']:
-        orders_received = Order.objects.filter(freelancer=request.user).order_by('-created_at')
+        orders_received = orders.filter(freelancer=request.user)
     else:
         orders_received = []
     
     if request.user.user_type in ['buyer', 'both']:
-        orders_bought = Order.objects.filter(buyer=request.user).order_by('-created_at')
+        orders_bought = orders.filter(buyer=request.user)
     else:
         orders_bought = []
     
@@ -355,18 +343,44 @@ def update_order_status(request, pk):
     
     if request.method == 'POST':
         new_status = request.POST.get('status')
-        if new_status in ['in_progress', 'completed', 'cancelled']:
-            order.status = new_status
-            if new_status == 'completed':
-                order.delivery_date = timezone.now()
-            order.save()
-            messages.success(request, f'Order status updated to {new_status}.')
+        if not order.can_transition(new_status):
+            messages.error(request, f'A {order.get_status_display().lower()} order cannot be moved to that status.')
+        elif order.transition(new_status, **_status_changes(new_status)):
+            messages.success(request, f'Order status updated to {order.get_status_display()}.')
         else:
-            messages.error(request, 'Invalid status.')
+            messages.error(request, 'The order was updated in the meantime. Please check it and try again.')
     
     return redirect('orders:order_detail', pk=order.pk)
 
 
+@require_POST
+@login_required
+def bulk_update_order_status(request):
+    """Move several of the freelancer's orders to one status"""
+    new_status = request.POST.get('status')
+    try:
+        order_ids = [int(order_id) for order_id in request.POST.getlist('order_ids')]
+    except ValueError:
+        order_ids = []
+    
+    if new_status not in dict(Order.STATUS_CHOICES) or not order_ids:
+        messages.error(request, 'Choose some orders and a status.')
+    else:
+        moved = Order.objects.filter(freelancer=request.user, id__in=order_ids).transition(
+            new_status, **_status_changes(new_status)
+        )
+        messages.success(request, f'{moved} orders updated.')
+        if moved < len(order_ids):
+            messages.warning(request, f'{len(order_ids) - moved} orders could not be moved to that status.')
+    
+    return redirect('orders:order_list')
+
+
+def _status_changes(status):
+    """Fields set along with a move to ``status``"""
+    return {'delivery_date': timezone.now()} if status == 'completed' else {}
+
+
 @login_required
 def submit_review(request, order_id):
     """Submit a review for a completed order"""
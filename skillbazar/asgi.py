@@ -2,6 +2,9 @@
 ASGI config for skillbazar project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Live conversation updates (messaging.views.conversation_events) are
+long-lived Server-Sent Events streams and are only served through it, e.g.
+``uvicorn skillbazar.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
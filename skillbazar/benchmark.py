@@ -0,0 +1,456 @@
+"""Scaled benchmark of every gigs, users, orders and messaging URL.
+
+``seed()`` fills an empty database with a large synthetic dataset and
+``run()`` drives each URL through the Django test client, recording
+latency percentiles, SQL query counts and rows fetched per URL. Results
+are plain dicts so they can be written as JSON and compared between runs
+with ``compare()``. Every request must answer with a 2xx or 3xx status;
+``failures()`` lists the entries that did not. Payment gateways are
+served by the local stub in orders.gateway_stub while run() is going.
+"""
+import json
+import random
+import time
+from decimal import Decimal
+from importlib import import_module
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.db.backends.utils import CursorWrapper
+from django.test import Client, override_settings
+from django.urls import reverse
+
+BENCH_USERNAME = 'bench_user'
+URL_MODULES = ['gigs', 'users', 'orders', 'messaging']
+CATEGORY_NAMES = [
+    'Web Development', 'Graphic Design', 'Digital Marketing', 'Data Entry', 'Voice Over',
+    'Video Editing', 'Content Writing', 'Translation', 'Other',
+]
+WORDS = [
+    'logo', 'design', 'website', 'python', 'editing', 'video', 'seo', 'writing', 'translation',
+    'nepali', 'professional', 'fast', 'wordpress', 'marketing', 'data', 'entry', 'voice', 'app',
+]
+
+
+def _bulk(model, objects, batch_size):
+    model.objects.bulk_create(objects, batch_size=batch_size)
+
+
+def seed(users=10000, gigs=100000, orders=1000000, messages=5000000,
+         messages_per_conversation=50, batch_size=5000, stdout=None, seed_value=42):
+    """Fill the database with a synthetic dataset of the given size.
+
+    Bulk inserts skip model signals, so the search index, facet table and
+    running ratings are rebuilt at the end. ``bench_user`` is a buyer and
+    freelancer with its own gigs, orders and conversations, used as the
+    logged-in user by run().
+    """
+    from gigs import facets, search, similarity
+    from gigs.models import Category, Gig, Order
+    from messaging.inbox import rebuild_inbox
+    from messaging.models import Conversation, ConversationParticipant, Message
+    from orders.models import Review
+    from orders.ratings import rebuild_ratings
+    from users.models import CustomUser
+    from users.stats import rebuild_stats
+
+    rng = random.Random(seed_value)
+    log = stdout.write if stdout else (lambda message: None)
+    password = make_password('benchmark')
+
+    with transaction.atomic():
+        log(f'Seeding {users} users...')
+        _bulk(CustomUser, [
+            CustomUser(
+                username=BENCH_USERNAME if i == 0 else f'bench{i}',
+                email=f'bench{i}@skillbazar.com',
+                first_name=f'Bench{i}', last_name='User',
+                user_type='both', password=password,
+            )
+            for i in range(users)
+        ], batch_size)
+        user_ids = list(CustomUser.objects.order_by('id').values_list('id', flat=True))
+        bench_user_id = user_ids[0]
+
+        _bulk(Category, [
+            Category(name=name, slug=name.lower().replace(' ', '-'), icon='fas fa-code')
+            for name in CATEGORY_NAMES
+        ], batch_size)
+        category_ids = list(Category.objects.values_list('id', flat=True))
+
+        log(f'Seeding {gigs} gigs...')
+        for start in range(0, gigs, batch_size):
+            _bulk(Gig, [
+                Gig(
+                    freelancer_id=bench_user_id if i % 1000 == 0 else rng.choice(user_ids),
+                    category_id=rng.choice(category_ids),
+                    title=' '.join(rng.sample(WORDS, 3)).title(),
+                    slug=f'bench-gig-{i}',
+                    description=' '.join(rng.choices(WORDS, k=40)),
+                    price=Decimal(rng.randint(5, 500) * 100),
+                    delivery_time=rng.randint(1, 30),
+                    is_active=rng.random() > 0.05,
+                    views=rng.randint(0, 5000),
+                )
+                for i in range(start, min(start + batch_size, gigs))
+            ], batch_size)
+        gig_rows = list(Gig.objects.values_list('id', 'freelancer_id'))
+
+        log(f'Seeding {orders} orders...')
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        for start in range(0, orders, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, orders)):
+                gig_id, freelancer_id = rng.choice(gig_rows)
+                buyer_id = bench_user_id if i % 200 == 0 else rng.choice(user_ids)
+                if buyer_id == freelancer_id:
+                    buyer_id = user_ids[(user_ids.index(buyer_id) + 1) % len(user_ids)]
+                batch.append(Order(
+                    gig_id=gig_id, buyer_id=buyer_id, freelancer_id=freelancer_id,
+                    amount=Decimal(rng.randint(5, 500) * 100),
+                    status='pending' if buyer_id == bench_user_id and i % 400 == 0 else rng.choice(statuses),
+                ))
+            _bulk(Order, batch, batch_size)
+
+        log('Seeding reviews...')
+        reviews = {}
+        for gig_id, freelancer_id in rng.sample(gig_rows, min(len(gig_rows), max(1, orders // 20))):
+            reviewer_id = rng.choice(user_ids)
+            if reviewer_id != freelancer_id:
+                reviews[(gig_id, reviewer_id)] = Review(
+                    gig_id=gig_id, reviewer_id=reviewer_id, freelancer_id=freelancer_id,
+                    rating=rng.randint(1, 5), comment=' '.join(rng.choices(WORDS, k=12)),
+                )
+        _bulk(Review, list(reviews.values()), batch_size)
+
+        conversations = max(1, messages // messages_per_conversation)
+        log(f'Seeding {conversations} conversations with {messages} messages...')
+        keyed_pairs = set()
+        for start in range(0, conversations, batch_size):
+            count = min(batch_size, conversations - start)
+            members = []
+            new_conversations = []
+            for index in range(count):
+                first = bench_user_id if (start + index) % 100 == 0 else rng.choice(user_ids)
+                second = first
+                while second == first:
+                    second = rng.choice(user_ids)
+                members.append((first, second))
+                pair = (min(first, second), max(first, second))
+                if pair in keyed_pairs:
+                    # Repeat pairs stay unkeyed, like duplicate threads from before pair keys
+                    new_conversations.append(Conversation())
+                else:
+                    keyed_pairs.add(pair)
+                    new_conversations.append(Conversation(**Conversation.pair_key(first, second)))
+            created = Conversation.objects.bulk_create(new_conversations, batch_size=batch_size)
+            pairs = [
+                (conversation.pk, first, second)
+                for conversation, (first, second) in zip(created, members)
+            ]
+            _bulk(ConversationParticipant, [
+                ConversationParticipant(conversation_id=conversation_id, user_id=user_id)
+                for conversation_id, first, second in pairs
+                for user_id in (first, second)
+            ], batch_size)
+            batch = []
+            for conversation_id, first, second in pairs:
+                for _ in range(messages_per_conversation):
+                    batch.append(Message(
+                        conversation_id=conversation_id,
+                        sender_id=rng.choice((first, second)),
+                        content=' '.join(rng.choices(WORDS, k=rng.randint(4, 30))),
+                    ))
+                if len(batch) >= batch_size:
+                    _bulk(Message, batch, batch_size)
+                    batch = []
+            _bulk(Message, batch, batch_size)
+
+        log('Rebuilding derived tables...')
+        search.rebuild_index()
+        facets.refresh_facets()
+        similarity.rebuild_similarities()
+        rebuild_ratings()
+        rebuild_stats()
+        # Everyone has read all but the last fifth of each conversation
+        newest = Message.objects.filter(conversation=OuterRef('conversation')).order_by('-id').values('id')[:1]
+        ConversationParticipant.objects.update(
+            last_read_message_id=Greatest(Subquery(newest) - messages_per_conversation // 5, 0)
+        )
+        rebuild_inbox()
+
+
+class RowCountingCursor(CursorWrapper):
+    """Cursor wrapper that counts the rows fetched from the database"""
+    rows = 0
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            RowCountingCursor.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        RowCountingCursor.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        RowCountingCursor.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            RowCountingCursor.rows += 1
+            yield row
+
+
+class Context:
+    """Objects owned by bench_user, handed out per iteration to the URL specs"""
+
+    def __init__(self):
+        from gigs.models import Category, Gig, Order
+        from messaging.models import Conversation
+        from users.models import CustomUser
+
+        self.user = CustomUser.objects.get(username=BENCH_USERNAME)
+        self.own_gigs = list(Gig.objects.filter(freelancer=self.user).values_list('slug', flat=True)[:50])
+        self.other_gigs = list(
+            Gig.objects.filter(is_active=True).exclude(freelancer=self.user).values_list('id', 'slug')[:200]
+        )
+        self.categories = list(Category.objects.values_list('slug', flat=True))
+        self.freelancers = list(
+            CustomUser.objects.exclude(pk=self.user.pk).values_list('id', 'username')[:200]
+        )
+        bought = Order.objects.filter(buyer=self.user)
+        self.bought_orders = list(bought.exclude(status='pending').values_list('id', flat=True)[:200])
+        self.pending_orders = list(bought.filter(status='pending').values_list('id', flat=True)[:200])
+        self.completed_orders = list(bought.filter(status='completed').values_list('id', flat=True)[:200])
+        self.received_orders = list(Order.objects.filter(freelancer=self.user).values_list('id', flat=True)[:200])
+        conversations = list(self.user.conversations.values_list('id', flat=True)[:400])
+        half = len(conversations) // 2
+        self.conversations = conversations[:half] or conversations
+        self.disposable_conversations = conversations[half:]
+        self.last_messages = dict(
+            Conversation.objects.filter(id__in=self.conversations).values_list('id', 'last_message_id')
+        )
+
+    @staticmethod
+    def pick(pool, iteration):
+        if not pool:
+            raise LookupError('not enough seeded objects')
+        return pool[iteration % len(pool)]
+
+    @staticmethod
+    def take(pool, iteration):
+        # For objects a request uses up, like a deleted conversation
+        if iteration >= len(pool):
+            raise LookupError('not enough seeded objects')
+        return pool[iteration]
+
+    @classmethod
+    def window(cls, pool, iteration, size):
+        start = iteration * size
+        return [cls.pick(pool, index) for index in range(start, start + size)]
+
+
+def _json(data):
+    return {'data': json.dumps(data), 'content_type': 'application/json'}
+
+
+# url name -> function(context, iteration) returning (method, kwargs, query, body)
+URL_SPECS = {
+    'gigs:home': lambda c, i: ('get', {}, {}, {}),
+    'gigs:gig_list': lambda c, i: ('get', {}, {}, {}),
+    'gigs:gig_detail': lambda c, i: ('get', {'slug': c.pick(c.other_gigs, i)[1]}, {}, {}),
+    'gigs:category': lambda c, i: ('get', {'slug': c.pick(c.categories, i)}, {}, {}),
+    'gigs:create_gig': lambda c, i: ('get', {}, {}, {}),
+    'gigs:edit_gig': lambda c, i: ('get', {'slug': c.pick(c.own_gigs, i)}, {}, {}),
+    'gigs:delete_gig': lambda c, i: ('get', {'slug': c.pick(c.own_gigs, i)}, {}, {}),
+    'gigs:my_gigs': lambda c, i: ('get', {}, {}, {}),
+    'users:profile': lambda c, i: ('get', {'username': c.pick(c.freelancers, i)[1]}, {}, {}),
+    'users:edit_profile': lambda c, i: ('get', {}, {}, {}),
+    'users:change_password': lambda c, i: ('get', {}, {}, {}),
+    'users:dashboard': lambda c, i: ('get', {}, {}, {}),
+    'orders:create_order': lambda c, i: ('get', {'gig_id': c.pick(c.other_gigs, i)[0]}, {}, {}),
+    'orders:create_order_and_pay': lambda c, i: ('get', {'gig_id': c.pick(c.other_gigs, i)[0]}, {}, {}),
+    'orders:payment_integration': lambda c, i: ('get', {'order_id': c.pick(c.bought_orders, i)}, {}, {}),
+    'orders:khalti_payment_initiate': lambda c, i: (
+        'post', {}, {}, _json({'order_id': c.pick(c.bought_orders, i), 'amount': '1050.00'})),
+    'orders:esewa_payment_initiate': lambda c, i: (
+        'post', {}, {}, _json({'order_id': c.pick(c.bought_orders, i), 'amount': '1050.00'})),
+    'orders:payment_success': lambda c, i: ('get', {'order_id': c.pick(c.bought_orders, i)}, {}, {}),
+    'orders:payment_failure': lambda c, i: ('get', {'order_id': c.pick(c.bought_orders, i)}, {}, {}),
+    'orders:order_detail': lambda c, i: ('get', {'pk': c.pick(c.bought_orders, i)}, {}, {}),
+    'orders:order_detail_with_payment': lambda c, i: ('get', {'pk': c.pick(c.bought_orders, i)}, {}, {}),
+    'orders:order_list': lambda c, i: ('get', {}, {}, {}),
+    'orders:update_order_status': lambda c, i: ('get', {'pk': c.pick(c.received_orders, i)}, {}, {}),
+    'orders:bulk_update_order_status': lambda c, i: (
+        'post', {}, {}, {'data': {'status': 'in_progress', 'order_ids': c.window(c.received_orders, i, 20)}}),
+    'orders:submit_review': lambda c, i: ('get', {'order_id': c.pick(c.completed_orders, i)}, {}, {}),
+    'orders:delete_order': lambda c, i: ('get', {'order_id': c.pick(c.pending_orders, i)}, {}, {}),
+    'messaging:conversation_list': lambda c, i: ('get', {}, {}, {}),
+    'messaging:conversation_detail': lambda c, i: (
+        'get', {'conversation_id': c.pick(c.conversations, i)}, {}, {}),
+    'messaging:conversation_messages': lambda c, i: (
+        'get', {'conversation_id': c.pick(c.conversations, i)},
+        {'before_id': c.last_messages.get(c.pick(c.conversations, i)) or 0}, {}),
+    'messaging:conversation_updates': lambda c, i: (
+        'get', {'conversation_id': c.pick(c.conversations, i)},
+        {'since_id': max((c.last_messages.get(c.pick(c.conversations, i)) or 0) - 5, 0)}, {}),
+    'messaging:start_conversation': lambda c, i: ('get', {'user_id': c.pick(c.freelancers, i)[0]}, {}, {}),
+    'messaging:delete_conversation': lambda c, i: (
+        'post', {'conversation_id': c.take(c.disposable_conversations, i)}, {}, {}),
+}
+
+# URLs that cannot be timed as one request/response, with the reason
+SKIPPED_URLS = {
+    'messaging:conversation_events': 'long-lived event stream',
+}
+
+# Extra query-string variants benchmarked as separate entries
+URL_VARIANTS = {
+    'gigs:gig_list': {
+        'search': {'q': 'logo design'},
+        'sort=price_low': {'sort': 'price_low'},
+        'category': {'category': 'graphic-design'},
+    },
+}
+
+
+def url_names():
+    """Every named URL in the benchmarked apps"""
+    names = []
+    for module_name in URL_MODULES:
+        module = import_module(f'{module_name}.urls')
+        names.extend(
+            f'{module.app_name}:{pattern.name}' for pattern in module.urlpatterns if pattern.name
+        )
+    return names
+
+
+def missing_specs():
+    """URLs with neither a benchmark spec nor a reason to skip them"""
+    return [name for name in url_names() if name not in URL_SPECS and name not in SKIPPED_URLS]
+
+
+def failures(results):
+    """Entries with a response outside 2xx and 3xx, as messages"""
+    return [
+        f"{entry}: status {metrics['status']}"
+        for entry, metrics in results.items()
+        if any(not 200 <= status < 400 for status in metrics.get('status', []))
+    ]
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _measure(client, context, name, spec, query_extra, iterations, warmup):
+    timings, query_counts, row_counts, statuses = [], [], [], set()
+    for iteration in range(warmup + iterations):
+        method, kwargs, query, body = spec(context, iteration)
+        url = reverse(name, kwargs=kwargs)
+        params = {**query, **query_extra}
+        queries = []
+
+        def count(execute, sql, sql_params, many, ctx):
+            queries.append(sql)
+            return execute(sql, sql_params, many, ctx)
+
+        RowCountingCursor.rows = 0
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            if method == 'post':
+                response = client.post(url, **body) if body else client.post(url, params)
+            else:
+                response = client.get(url, params)
+            elapsed = time.perf_counter() - started
+        if iteration >= warmup:
+            timings.append(elapsed * 1000)
+            query_counts.append(len(queries))
+            row_counts.append(RowCountingCursor.rows)
+            statuses.add(response.status_code)
+    return {
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p95_ms': round(_percentile(timings, 95), 3),
+        'queries': _percentile(query_counts, 50),
+        'max_queries': max(query_counts),
+        'rows': _percentile(row_counts, 50),
+        'status': sorted(statuses),
+    }
+
+
+def run(iterations=20, warmup=1, stdout=None):
+    """Benchmark every URL as bench_user and return {entry: metrics}"""
+    from orders import gateways
+    from orders.gateway_stub import StubGatewayServer
+
+    missing = missing_specs()
+    if missing:
+        raise LookupError(f"No benchmark spec or skip reason for {', '.join(missing)}")
+    log = stdout.write if stdout else (lambda message: None)
+    context = Context()
+    client = Client(raise_request_exception=False)
+    client.force_login(context.user)
+
+    stub = StubGatewayServer(('127.0.0.1', 0))
+    stub.start()
+    # Gateway clients are cached with the settings they were built from
+    gateways._gateways.clear()
+    # Plain and DEBUG cursors alike are swapped for the row counting one
+    connection.make_cursor = connection.make_debug_cursor = (
+        lambda cursor: RowCountingCursor(cursor, connection)
+    )
+    results = {}
+    try:
+        with override_settings(ALLOWED_HOSTS=['testserver'], PAYMENT_GATEWAYS=stub.gateway_settings()):
+            _run(client, context, iterations, warmup, log, results)
+    finally:
+        del connection.make_cursor, connection.make_debug_cursor
+        gateways._gateways.clear()
+        stub.shutdown()
+        stub.server_close()
+    return results
+
+
+def _run(client, context, iterations, warmup, log, results):
+    for name in url_names():
+        spec = URL_SPECS.get(name)
+        if spec is None:
+            results[name] = {'skipped': SKIPPED_URLS[name]}
+            log(f'{name}: skipped, {SKIPPED_URLS[name]}')
+            continue
+        variants = {'': {}, **URL_VARIANTS.get(name, {})}
+        for label, query_extra in variants.items():
+            entry = f'{name} [{label}]' if label else name
+            try:
+                results[entry] = _measure(client, context, name, spec, query_extra, iterations, warmup)
+            except LookupError as error:
+                results[entry] = {'skipped': str(error)}
+            log(f'{entry}: {results[entry]}')
+
+
+def compare(current, baseline, threshold):
+    """Regressions of current against baseline results.
+
+    An entry regresses when it answers with a status outside 2xx and 3xx,
+    when its p95 latency grows by more than threshold (a fraction) or when
+    it runs more queries than before.
+    """
+    regressions = failures(current)
+    for entry, metrics in current.items():
+        before = baseline.get(entry)
+        if not before or 'skipped' in metrics or 'skipped' in before:
+            continue
+        if metrics['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{entry}: p95 {before['p95_ms']}ms -> {metrics['p95_ms']}ms")
+        if metrics['queries'] > before['queries']:
+            regressions.append(f"{entry}: queries {before['queries']} -> {metrics['queries']}")
+    return regressions
@@ -0,0 +1,41 @@
+"""The database row a model instance is about to overwrite, read once per save.
+
+Receivers that compare a saved instance with its previous values register
+the fields they need with track_old_row. One pre_save receiver per model
+then reads all of them in a single query, when the save may change any,
+and post_save receivers get them from old_row.
+"""
+from django.db.models.signals import pre_save
+
+
+# Model -> (field names as passed in update_fields, columns to read)
+_tracked = {}
+
+
+def touches(update_fields, fields):
+    """Whether a save with ``update_fields`` may change any of ``fields``"""
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+def track_old_row(model, fields):
+    """Have every save of ``model`` remember the previous values of ``fields``"""
+    if model not in _tracked:
+        _tracked[model] = (set(), set())
+        pre_save.connect(_remember_old_row, sender=model, dispatch_uid=f'old_row:{model._meta.label}')
+    names, attnames = _tracked[model]
+    names.update(fields)
+    # get_field also finds foreign keys by their attname (freelancer_id)
+    attnames.update(model._meta.get_field(field).attname for field in fields)
+
+
+def _remember_old_row(sender, instance, update_fields=None, **kwargs):
+    names, attnames = _tracked[sender]
+    instance._old_row = None
+    if instance.pk is None or instance._state.adding or not touches(update_fields, names):
+        return
+    instance._old_row = sender._default_manager.filter(pk=instance.pk).values(*attnames).first()
+
+
+def old_row(instance):
+    """The tracked columns of the row the instance's last save replaced, or None for a new row"""
+    return getattr(instance, '_old_row', None)
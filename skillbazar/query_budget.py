@@ -0,0 +1,79 @@
+import functools
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+# Queries every page on base.html may add: the unread message badge, when not cached
+PAGE_QUERIES = 1
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Database execute wrapper that records every SQL statement it sees"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+
+@contextmanager
+def count_queries():
+    """Count the queries run inside the block, without needing DEBUG"""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+@contextmanager
+def assert_max_queries(limit, label='block'):
+    """Test helper: fail if the block runs more than ``limit`` queries"""
+    with count_queries() as counter:
+        yield counter
+    if len(counter) > limit:
+        raise QueryBudgetExceeded(_report(label, limit, counter))
+
+
+def _report(label, limit, counter):
+    statements = '\n'.join(f'  {index}. {sql}' for index, sql in enumerate(counter.queries, 1))
+    return f'{label} ran {len(counter)} queries, budget is {limit}:\n{statements}'
+
+
+def query_budget(limit):
+    """Declare the most queries a view may run.
+
+    Going over the budget is logged as an error with every statement, and
+    raises QueryBudgetExceeded when settings.QUERY_BUDGET_RAISE is on (as it
+    should be in tests). Loading the request's session and user is not
+    counted. The budget is exposed as ``view.query_budget``.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            # Session and user lookups are shared by every view, not charged to it
+            if hasattr(request, 'user'):
+                request.user.is_authenticated
+            with count_queries() as counter:
+                response = view_func(request, *args, **kwargs)
+            if len(counter) > limit:
+                message = _report(view_func.__qualname__, limit, counter)
+                if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                    raise QueryBudgetExceeded(message)
+                logger.error(message)
+            return response
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
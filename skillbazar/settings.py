@@ -64,6 +64,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'messaging.context_processors.unread_messages',
             ],
         },
     },
@@ -79,6 +80,17 @@ DATABASES = {
     }
 }
 
+# Homepage fragments and unread message totals live here. The fragments are
+# versioned in the database, but the local memory cache is private to each
+# process: with several web processes, or with run_message_worker sending
+# auto-replies, use a shared backend (Redis, Memcached) so unread totals
+# dropped in one process are dropped in all of them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -133,6 +145,44 @@ ACCOUNT_LOGIN_METHODS = {'username', 'email'}
 ACCOUNT_SIGNUP_FIELDS = ['email*', 'username*', 'password1*', 'password2*']
 ACCOUNT_EMAIL_VERIFICATION = 'none'
 
+# Seconds gig view counts are buffered in memory before a background thread
+# writes them in batches; None writes each view straight away. Set it (e.g.
+# to 10) in the web servers' settings, so tests and commands start no thread
+GIG_VIEW_FLUSH_INTERVAL = None
+
+# Views over their declared query budget are logged; set True to raise instead
+QUERY_BUDGET_RAISE = False
+
+# Pub/sub for live conversation updates: empty keeps events inside one ASGI
+# process, a redis:// URL shares them between workers (needs the redis package).
+# Without one and without MESSAGING_TASKS_EAGER, live pages also poll the
+# database for run_message_worker's replies
+MESSAGING_BROKER_URL = ''
+
+# Seconds an unread message total stays cached; it is recounted whenever a
+# message or read receipt commits, so this only limits memory use
+MESSAGING_UNREAD_TOTAL_TIMEOUT = 24 * 60 * 60
+
+# Welcome messages and auto-replies are sent when the request commits (no worker
+# needed, the default with DEBUG); set False to queue them for
+# `manage.py run_message_worker` instead
+MESSAGING_TASKS_EAGER = DEBUG
+
+# Payment gateway credentials and endpoints (Khalti and eSewa test values);
+# `manage.py run_payment_stub` prints the values for a local stand-in
+PAYMENT_GATEWAYS = {
+    'khalti': {
+        'public_key': 'test_public_key_dc74c7d6d5134b94a2330cbbe3c57c54',
+        'secret_key': 'test_secret_key_3e7b4c1d5f8a9b2c6d7e8f9a0b1c2d3e',
+        'base_url': 'https://a.khalti.com/api/v2/',
+    },
+    'esewa': {
+        'merchant_id': 'EPAYTEST',
+        'payment_url': 'https://esewa.com.np/epay/main',
+        'verify_url': 'https://esewa.com.np/epay/transrec',
+    },
+}
+
 # Messages
 from django.contrib.messages import constants as messages
 MESSAGE_TAGS = {
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import CustomUser, UserStats
 
 
 @admin.register(CustomUser)
@@ -26,4 +26,11 @@ class CustomUserAdmin(UserAdmin):
                       'phone_number', 'address', 'facebook_url', 'twitter_url', 
                       'linkedin_url', 'website_url', 'hourly_rate')
         }),
-    ) 
\ No newline at end of file
+    )
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'gig_count', 'orders_received', 'earnings', 'orders_bought']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
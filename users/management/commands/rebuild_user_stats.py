@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from users.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard stats of every user from all gigs and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = rebuild_stats(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt dashboard stats for {users} users!')
+        )
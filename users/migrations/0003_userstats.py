@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_customuser_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('gig_count', models.PositiveIntegerField(default=0)),
+                ('active_gig_count', models.PositiveIntegerField(default=0)),
+                ('orders_received', models.PositiveIntegerField(default=0)),
+                ('orders_received_pending', models.PositiveIntegerField(default=0)),
+                ('orders_received_completed', models.PositiveIntegerField(default=0)),
+                ('earnings', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('orders_bought', models.PositiveIntegerField(default=0)),
+                ('orders_bought_pending', models.PositiveIntegerField(default=0)),
+                ('orders_bought_completed', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+            },
+        ),
+    ]
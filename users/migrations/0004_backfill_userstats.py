@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def backfill_user_stats(apps, schema_editor):
+    from users.stats import rebuild_stats
+    rebuild_stats(
+        gig_model=apps.get_model('gigs', 'Gig'),
+        order_model=apps.get_model('gigs', 'Order'),
+        stats_model=apps.get_model('users', 'UserStats'),
+        user_model=apps.get_model('users', 'CustomUser'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_userstats'),
+        ('gigs', '0006_gig_similarity'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_user_stats, migrations.RunPython.noop),
+    ]
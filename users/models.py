@@ -26,6 +26,7 @@ class CustomUser(AbstractUser):
     hourly_rate = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     total_earnings = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    rating_sum = models.PositiveIntegerField(default=0)  # Running sum of review ratings
     total_reviews = models.PositiveIntegerField(default=0)
     date_joined = models.DateTimeField(auto_now_add=True)
     
@@ -36,4 +37,26 @@ class CustomUser(AbstractUser):
         return reverse('users:profile', kwargs={'username': self.username})
     
     def get_full_name(self):
-        return f"{self.first_name} {self.last_name}".strip() or self.username 
\ No newline at end of file
+        return f"{self.first_name} {self.last_name}".strip() or self.username
+
+
+class UserStats(models.Model):
+    """Dashboard counters for a user, kept current by users.stats"""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # Freelancer side
+    gig_count = models.PositiveIntegerField(default=0)
+    active_gig_count = models.PositiveIntegerField(default=0)
+    orders_received = models.PositiveIntegerField(default=0)
+    orders_received_pending = models.PositiveIntegerField(default=0)
+    orders_received_completed = models.PositiveIntegerField(default=0)
+    earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Buyer side
+    orders_bought = models.PositiveIntegerField(default=0)
+    orders_bought_pending = models.PositiveIntegerField(default=0)
+    orders_bought_completed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'user stats'
+
+    def __str__(self):
+        return f"Stats for {self.user}"
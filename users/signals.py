@@ -0,0 +1,61 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from gigs.models import Gig, Order
+from skillbazar.old_rows import old_row, touches, track_old_row
+from .models import CustomUser, UserStats
+from .stats import apply_stats_change, gig_contribution, order_contribution
+
+
+# Fields that decide what a gig or an order adds to the dashboard stats
+GIG_STATS_FIELDS = {'freelancer', 'freelancer_id', 'is_active'}
+ORDER_STATS_FIELDS = {'freelancer', 'freelancer_id', 'buyer', 'buyer_id', 'status', 'amount'}
+
+track_old_row(Gig, GIG_STATS_FIELDS)
+track_old_row(Order, ORDER_STATS_FIELDS)
+
+
+@receiver(post_save, sender=CustomUser)
+def create_user_stats(sender, instance, created=False, raw=False, **kwargs):
+    """Start every new user with an all-zero stats row"""
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+def _gig_stats(gig):
+    """What a row from old_row added to the stats; None for a new gig"""
+    return gig_contribution(gig['freelancer_id'], gig['is_active']) if gig else None
+
+
+def _order_stats(order):
+    """What a row from old_row added to the stats; None for a new order"""
+    if not order:
+        return None
+    return order_contribution(order['freelancer_id'], order['buyer_id'], order['status'], order['amount'])
+
+
+@receiver(post_save, sender=Gig)
+def update_stats_on_gig_save(sender, instance, update_fields=None, **kwargs):
+    """Move the gig's count between its freelancer's stats"""
+    if touches(update_fields, GIG_STATS_FIELDS):
+        after = gig_contribution(instance.freelancer_id, instance.is_active)
+        apply_stats_change(_gig_stats(old_row(instance)), after)
+
+
+@receiver(post_delete, sender=Gig)
+def update_stats_on_gig_delete(sender, instance, **kwargs):
+    apply_stats_change(gig_contribution(instance.freelancer_id, instance.is_active), None)
+
+
+@receiver(post_save, sender=Order)
+def update_stats_on_order_save(sender, instance, update_fields=None, **kwargs):
+    """Move the order between its freelancer's and buyer's stats"""
+    if touches(update_fields, ORDER_STATS_FIELDS):
+        after = order_contribution(instance.freelancer_id, instance.buyer_id, instance.status, instance.amount)
+        apply_stats_change(_order_stats(old_row(instance)), after)
+
+
+@receiver(post_delete, sender=Order)
+def update_stats_on_order_delete(sender, instance, **kwargs):
+    apply_stats_change(
+        order_contribution(instance.freelancer_id, instance.buyer_id, instance.status, instance.amount), None,
+    )
@@ -0,0 +1,173 @@
+"""Per-user dashboard counters.
+
+UserStats rows are shifted by gig and order signals as those change, and
+read through the cache, so the dashboard costs the same however many
+orders a user has. Rows are created with their user; a missing one is
+computed with one conditional aggregation per table when it is needed.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+STATS_FIELDS = [
+    'gig_count', 'active_gig_count',
+    'orders_received', 'orders_received_pending', 'orders_received_completed', 'earnings',
+    'orders_bought', 'orders_bought_pending', 'orders_bought_completed',
+]
+
+# Upper bound on staleness for changes that bypass signals (bulk updates)
+STATS_CACHE_TIMEOUT = 600
+
+ZERO = Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def stats_key(user_id):
+    return f'users:stats:{user_id}'
+
+
+def _aggregates(prefix):
+    """Conditional aggregates of one side of a user's orders"""
+    return {
+        prefix: Count('id'),
+        f'{prefix}_pending': Count('id', filter=Q(status='pending')),
+        f'{prefix}_completed': Count('id', filter=Q(status='completed')),
+    }
+
+
+def compute_stats(user_id):
+    """Count a user's stats from the gigs and orders tables"""
+    from gigs.models import Gig, Order
+
+    stats = Gig.objects.filter(freelancer_id=user_id).aggregate(
+        gig_count=Count('id'), active_gig_count=Count('id', filter=Q(is_active=True)),
+    )
+    stats.update(Order.objects.filter(freelancer_id=user_id).aggregate(
+        **_aggregates('orders_received'),
+        earnings=Coalesce(Sum('amount', filter=Q(status='completed')), ZERO),
+    ))
+    stats.update(Order.objects.filter(buyer_id=user_id).aggregate(**_aggregates('orders_bought')))
+    return stats
+
+
+def get_stats(user_id):
+    """A user's dashboard counters as a dict, from the cache when possible"""
+    from .models import UserStats
+
+    key = stats_key(user_id)
+    stats = cache.get(key)
+    if stats is None:
+        stats = UserStats.objects.filter(user_id=user_id).values(*STATS_FIELDS).first()
+        if stats is None:
+            stats = compute_stats(user_id)
+            try:
+                with transaction.atomic():
+                    UserStats.objects.create(user_id=user_id, **stats)
+            except IntegrityError:
+                # Created by a concurrent request
+                pass
+        cache.set(key, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def gig_contribution(freelancer_id, is_active):
+    """What one gig adds to its freelancer's stats"""
+    return {freelancer_id: {'gig_count': 1, 'active_gig_count': int(bool(is_active))}}
+
+
+def order_contribution(freelancer_id, buyer_id, status, amount):
+    """What one order adds to its freelancer's and buyer's stats"""
+    completed = status == 'completed'
+    pending = status == 'pending'
+    contribution = {
+        freelancer_id: {
+            'orders_received': 1,
+            'orders_received_pending': int(pending),
+            'orders_received_completed': int(completed),
+            'earnings': amount if completed else 0,
+        },
+    }
+    # Merged rather than keyed separately, so an order from a user to themselves counts on both sides
+    contribution.setdefault(buyer_id, {}).update({
+        'orders_bought': 1,
+        'orders_bought_pending': int(pending),
+        'orders_bought_completed': int(completed),
+    })
+    return contribution
+
+
+def combine_contributions(contributions):
+    """Sum the contributions of several rows, to shift their stats in one go"""
+    combined = defaultdict(lambda: defaultdict(int))
+    for contribution in contributions:
+        for user_id, values in contribution.items():
+            for field, value in values.items():
+                combined[user_id][field] += value
+    return combined
+
+
+def apply_stats_change(before, after):
+    """Shift stats rows from one contribution to another.
+
+    ``before`` and ``after`` come from gig_contribution or
+    order_contribution (None for a created or deleted row). Users without
+    a stats row yet get one counted from scratch, which already includes
+    the change. Cached stats are dropped once the change commits.
+    """
+    from .models import UserStats
+
+    deltas = defaultdict(lambda: defaultdict(int))
+    for contribution, sign in ((before, -1), (after, 1)):
+        for user_id, values in (contribution or {}).items():
+            for field, value in values.items():
+                deltas[user_id][field] += sign * value
+
+    for user_id, fields in deltas.items():
+        changes = {field: F(field) + delta for field, delta in fields.items() if delta}
+        if not changes:
+            continue
+        if not UserStats.objects.filter(user_id=user_id).update(**changes):
+            try:
+                with transaction.atomic():
+                    UserStats.objects.create(user_id=user_id, **compute_stats(user_id))
+            except IntegrityError:
+                UserStats.objects.filter(user_id=user_id).update(**changes)
+        transaction.on_commit(lambda user_id=user_id: cache.delete(stats_key(user_id)))
+
+
+def rebuild_stats(gig_model=None, order_model=None, stats_model=None, user_model=None, batch_size=1000):
+    """Recompute every user's stats from grouped aggregations and return how many rows were written.
+
+    Every user gets a row. Models can be passed in so migrations can use
+    their historical versions.
+    """
+    if gig_model is None:
+        from gigs.models import Gig, Order
+        from .models import CustomUser, UserStats
+        gig_model, order_model, stats_model, user_model = Gig, Order, UserStats, CustomUser
+
+    stats = {user_id: {} for user_id in user_model.objects.values_list('id', flat=True)}
+    for row in gig_model.objects.order_by().values('freelancer_id').annotate(
+        gig_count=Count('id'), active_gig_count=Count('id', filter=Q(is_active=True)),
+    ):
+        stats[row.pop('freelancer_id')].update(row)
+    for row in order_model.objects.order_by().values('freelancer_id').annotate(
+        **_aggregates('orders_received'),
+        earnings=Coalesce(Sum('amount', filter=Q(status='completed')), ZERO),
+    ):
+        stats[row.pop('freelancer_id')].update(row)
+    for row in order_model.objects.order_by().values('buyer_id').annotate(**_aggregates('orders_bought')):
+        stats[row.pop('buyer_id')].update(row)
+
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        stats_model.objects.bulk_create(
+            [stats_model(user_id=user_id, **values) for user_id, values in stats.items()],
+            batch_size=batch_size,
+        )
+    cache.delete_many([stats_key(user_id) for user_id in stats])
+    return len(stats)
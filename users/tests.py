@@ -0,0 +1,147 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from gigs.models import Category, Gig, Order
+from skillbazar.query_budget import assert_max_queries, count_queries
+from .models import CustomUser, UserStats
+from .stats import STATS_FIELDS, compute_stats, get_stats, rebuild_stats
+
+
+# Session and user lookups made by every signed-in request
+REQUEST_QUERIES = 2
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class DashboardQueryTests(TestCase):
+    """The dashboard runs a fixed number of queries however many orders there are"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('freelancer', 'freelancer@skillbazar.com', 'password', user_type='both')
+        category = Category.objects.create(name='Graphic Design', slug='graphic-design')
+        own_gig = Gig.objects.create(
+            freelancer=cls.user, category=category, title='Logo design', slug='logo-design',
+            description='A professional logo', price=Decimal('500.00'), delivery_time=3,
+        )
+        for i in range(8):
+            other = CustomUser.objects.create_user(f'user{i}', f'user{i}@skillbazar.com', 'password', user_type='both')
+            other_gig = Gig.objects.create(
+                freelancer=other, category=category, title=f'Website {i}', slug=f'website-{i}',
+                description='A website', price=Decimal('1000.00'), delivery_time=7,
+            )
+            Order.objects.create(gig=own_gig, buyer=other, freelancer=cls.user, amount=own_gig.price)
+            Order.objects.create(gig=other_gig, buyer=cls.user, freelancer=other, amount=other_gig.price)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Cold caches, including the stats row and the unread badge, are the worst case
+        cache.clear()
+
+    def test_dashboard(self):
+        with assert_max_queries(REQUEST_QUERIES + 4, 'dashboard'):
+            response = self.client.get(reverse('users:dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+
+class UserStatsTests(TestCase):
+    """Stats rows shifted by gig and order signals match a count from the tables"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(f'user{i}', f'user{i}@skillbazar.com', 'password', user_type='both')
+            for i in range(3)
+        ]
+        cls.category = Category.objects.create(name='Graphic Design', slug='graphic-design')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_gig(self, freelancer, slug):
+        return Gig.objects.create(
+            freelancer=freelancer, category=self.category, title='Logo design', slug=slug,
+            description='A professional logo', price=Decimal('500.00'), delivery_time=3,
+        )
+
+    def assertStatsExact(self):
+        for user in self.users:
+            stats = UserStats.objects.filter(user=user).values(*STATS_FIELDS).get()
+            self.assertEqual(stats, compute_stats(user.id), user.username)
+
+    def test_changes_shift_stats(self):
+        first, second, third = self.users
+        gig = self.create_gig(first, 'logo-1')
+        other_gig = self.create_gig(second, 'logo-2')
+        orders = [
+            Order.objects.create(gig=gig, buyer=second, freelancer=first, amount=Decimal('500.00')),
+            Order.objects.create(gig=gig, buyer=third, freelancer=first, amount=Decimal('750.50')),
+            Order.objects.create(gig=other_gig, buyer=first, freelancer=second, amount=Decimal('1000.00')),
+        ]
+        self.assertStatsExact()
+
+        orders[0].status = 'completed'
+        orders[0].save()
+        orders[1].amount = Decimal('800.00')
+        orders[1].buyer = second
+        orders[1].save(update_fields=['amount', 'buyer'])
+        orders[2].status = 'in_progress'
+        orders[2].save()
+        self.assertStatsExact()
+
+        gig.is_active = False
+        gig.save(update_fields=['is_active'])
+        other_gig.freelancer = third
+        other_gig.save()
+        self.assertStatsExact()
+
+        orders[0].delete()
+        other_gig.delete()
+        self.assertStatsExact()
+        self.assertEqual(UserStats.objects.get(user=first).earnings, 0)
+
+    def test_own_order_counts_on_both_sides(self):
+        first = self.users[0]
+        gig = self.create_gig(first, 'logo')
+        order = Order.objects.create(gig=gig, buyer=first, freelancer=first, amount=Decimal('500.00'))
+        order.status = 'completed'
+        order.save()
+        self.assertStatsExact()
+        order.delete()
+        self.assertStatsExact()
+
+    def test_unrelated_save_leaves_stats_alone(self):
+        gig = self.create_gig(self.users[0], 'logo')
+        gig.title = 'Better logo design'
+        with count_queries() as queries:
+            gig.save(update_fields=['title'])
+        self.assertFalse([sql for sql in queries.queries if 'users_userstats' in sql])
+
+    def test_missing_row_is_counted_from_scratch(self):
+        first, second, _ = self.users
+        gig = self.create_gig(first, 'logo')
+        UserStats.objects.filter(user=first).delete()
+        order = Order.objects.create(gig=gig, buyer=second, freelancer=first, amount=Decimal('500.00'))
+        order.status = 'completed'
+        order.save()
+        self.assertStatsExact()
+
+    def test_cached_stats_follow_commits(self):
+        first, second, _ = self.users
+        gig = self.create_gig(first, 'logo')
+        self.assertEqual(get_stats(first.id)['orders_received'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(gig=gig, buyer=second, freelancer=first, amount=Decimal('500.00'))
+        with assert_max_queries(1, 'get_stats'):
+            self.assertEqual(get_stats(first.id)['orders_received'], 1)
+        with assert_max_queries(0, 'get_stats'):
+            self.assertEqual(get_stats(first.id)['orders_received'], 1)
+
+    def test_rebuild_repairs_drift(self):
+        gig = self.create_gig(self.users[0], 'logo')
+        Order.objects.create(gig=gig, buyer=self.users[1], freelancer=self.users[0], amount=Decimal('500.00'))
+        UserStats.objects.update(gig_count=9, orders_bought=4)
+        UserStats.objects.filter(user=self.users[2]).delete()
+        self.assertEqual(rebuild_stats(), len(self.users))
+        self.assertStatsExact()
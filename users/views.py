@@ -2,18 +2,20 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import Sum, Count
+from skillbazar.query_budget import PAGE_QUERIES, query_budget
 from .models import CustomUser
 from .forms import ProfileUpdateForm, CustomPasswordChangeForm
+from .stats import get_stats
 from gigs.models import Gig, Order
 from orders.models import Review
 
 
 @login_required
+@query_budget(3 + PAGE_QUERIES)
 def profile(request, username):
     user = get_object_or_404(CustomUser, username=username)
     user_gigs = Gig.objects.filter(freelancer=user, is_active=True)
-    user_reviews = Review.objects.filter(freelancer=user).order_by('-created_at')[:5]
+    user_reviews = Review.objects.filter(freelancer=user).select_related('reviewer', 'gig').order_by('-created_at')[:5]
     
     context = {
         'profile_user': user,
@@ -59,67 +61,44 @@ def change_password(request):
 
 
 @login_required
+@query_budget(3 + PAGE_QUERIES)  # stats row (when not cached) and two recent order lists
 def dashboard(request):
     user = request.user
+    stats = get_stats(user.id)
     
     if user.user_type in ['freelancer', 'both']:
         # Freelancer dashboard
         my_gigs = Gig.objects.filter(freelancer=user)
-        total_gigs = my_gigs.count()
-        active_gigs = my_gigs.filter(is_active=True).count()
-        
-        # Orders received
-        orders_received = Order.objects.filter(gig__freelancer=user)
-        total_orders = orders_received.count()
-        pending_orders = orders_received.filter(status='pending').count()
-        completed_orders = orders_received.filter(status='completed').count()
-        
-        # Earnings
-        total_earnings = orders_received.filter(status='completed').aggregate(
-            total=Sum('amount')
-        )['total'] or 0
         
         # Recent orders
-        recent_orders = orders_received.order_by('-created_at')[:5]
+        recent_orders = Order.objects.filter(freelancer=user).select_related('gig', 'buyer').order_by('-created_at')[:5]
         
         context = {
             'user_type': 'freelancer',
-            'total_gigs': total_gigs,
-            'active_gigs': active_gigs,
-            'total_orders': total_orders,
-            'pending_orders': pending_orders,
-            'completed_orders': completed_orders,
-            'total_earnings': total_earnings,
+            'total_gigs': stats['gig_count'],
+            'active_gigs': stats['active_gig_count'],
+            'total_orders': stats['orders_received'],
+            'pending_orders': stats['orders_received_pending'],
+            'completed_orders': stats['orders_received_completed'],
+            'total_earnings': stats['earnings'],
             'recent_orders': recent_orders,
             'my_gigs': my_gigs[:5],
         }
     
     if user.user_type in ['buyer', 'both']:
         # Buyer dashboard
-        my_orders = Order.objects.filter(buyer=user)
-        total_orders_bought = my_orders.count()
-        pending_orders_bought = my_orders.filter(status='pending').count()
-        completed_orders_bought = my_orders.filter(status='completed').count()
-        
-        # Recent orders
-        recent_orders_bought = my_orders.order_by('-created_at')[:5]
+        recent_orders_bought = Order.objects.filter(buyer=user).select_related('gig', 'freelancer').order_by('-created_at')[:5]
+        buyer_context = {
+            'total_orders_bought': stats['orders_bought'],
+            'pending_orders_bought': stats['orders_bought_pending'],
+            'completed_orders_bought': stats['orders_bought_completed'],
+            'recent_orders_bought': recent_orders_bought,
+        }
         
         if user.user_type == 'both':
             # Combine both dashboards
-            context.update({
-                'user_type': 'both',
-                'total_orders_bought': total_orders_bought,
-                'pending_orders_bought': pending_orders_bought,
-                'completed_orders_bought': completed_orders_bought,
-                'recent_orders_bought': recent_orders_bought,
-            })
+            context.update(buyer_context, user_type='both')
         else:
-            context = {
-                'user_type': 'buyer',
-                'total_orders_bought': total_orders_bought,
-                'pending_orders_bought': pending_orders_bought,
-                'completed_orders_bought': completed_orders_bought,
-                'recent_orders_bought': recent_orders_bought,
-            }
+            context = dict(buyer_context, user_type='buyer')
     
-    return render(request, 'users/dashboard.html', context) 
\ No newline at end of file
+    return render(request, 'users/dashboard.html', context)